@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""Index the Ansible log of the deployments and query the task durations.
+
+The log written by Ansible (`log_path` in `ansible.cfg`) is read as a stream
+and split into runs (one `ansible-playbook` process), plays, tasks and the
+result of every host. Durations are stored in an SQLite index next to the
+log, only the lines appended since the previous command are read, so the
+memory used depends on the size of the index and not on the size of the log.
+
+A task lasts from its `TASK` line to the next `TASK`, `PLAY` or `PLAY RECAP`
+line of the run, and a host from the `TASK` line to its last result.
+"""
+
+import argparse
+import hashlib
+import logging
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("analyze_deploy_log")
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_LOG = REPOSITORY_DIR / "logs" / "tdp.log"
+# The start of the log identifies it, a different one means it was rotated
+HEAD_SIZE = 4096
+# Tasks written to the index between two commits
+COMMIT_INTERVAL = 1000
+
+# %(asctime)s p=%(process)d u=%(user)s n=%(name)s [%(levelname)s] | %(message)s
+RE_LOG_LINE = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) p=(\d+) u=(\S*) n=\S+"
+    r"(?: \w+)?\s*\| (.*)$"
+)
+RE_PLAY = re.compile(r"^PLAY \[(.*)\] \**$")
+RE_TASK = re.compile(r"^(TASK|RUNNING HANDLER) \[(.*)\] \**$")
+RE_RECAP = re.compile(r"^PLAY RECAP \**$")
+RE_HOST_RESULT = re.compile(
+    r"^(ok|changed|skipping|failed|fatal|unreachable|ignored|rescued):"
+    r" \[([^\]\s]+?)(?: -> [^\]]+)?\]"
+)
+# Results overriding the previous ones of a host, e.g. a failed loop item
+FAILED_STATUSES = ("failed", "fatal", "unreachable")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    first_play TEXT,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    play TEXT NOT NULL,
+    name TEXT NOT NULL,
+    -- Number of the previous tasks of the run with the same play and name
+    occurrence INTEGER NOT NULL,
+    start REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS host_results (
+    task_id INTEGER NOT NULL REFERENCES tasks(id),
+    host TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run_id);
+CREATE INDEX IF NOT EXISTS tasks_name ON tasks (play, name);
+CREATE INDEX IF NOT EXISTS host_results_task ON host_results (task_id);
+"""
+
+
+class LogLine(NamedTuple):
+    offset: int
+    # Offset of the next line
+    end: int
+    time: float
+    pid: int
+    user: str
+    message: str
+
+
+class LogIndexError(Exception):
+    pass
+
+
+def parse_time(value: str) -> float:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S,%f").timestamp()
+
+
+def read_lines(path: Path, offset: int) -> Iterator[LogLine]:
+    """Log lines starting at `offset`, the continuation lines of multi-line
+    messages and the last line if it is not complete are skipped."""
+    with path.open("rb") as log_file:
+        log_file.seek(offset)
+        for raw_line in log_file:
+            if not raw_line.endswith(b"\n"):
+                return
+            line_offset = offset
+            offset += len(raw_line)
+            match = RE_LOG_LINE.match(raw_line.decode("utf-8", "replace").rstrip())
+            if match is None:
+                continue
+            timestamp, pid, user, message = match.groups()
+            yield LogLine(
+                line_offset, offset, parse_time(timestamp), int(pid), user, message
+            )
+
+
+class LogIndex:
+    """SQLite index of the runs, tasks and host results of a log."""
+
+    def __init__(self, log_path: Path, index_path: Path):
+        self.log_path = log_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.executescript(SCHEMA)
+
+    def meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def clear(self, from_run: int = 0):
+        self.connection.execute(
+            "DELETE FROM host_results WHERE task_id IN"
+            " (SELECT id FROM tasks WHERE run_id >= ?)",
+            (from_run,),
+        )
+        self.connection.execute("DELETE FROM tasks WHERE run_id >= ?", (from_run,))
+        self.connection.execute("DELETE FROM runs WHERE id >= ?", (from_run,))
+
+    def head(self, size: int) -> str:
+        with self.log_path.open("rb") as log_file:
+            return hashlib.sha256(log_file.read(size)).hexdigest()
+
+    def resume_offset(self) -> int:
+        """Offset to read the log from, the run still running at the previous
+        update is read again."""
+        offset = int(self.meta("offset") or 0)
+        # Only the lines already indexed are compared, the head grows with
+        # the log until it reaches its full size
+        head_size = min(HEAD_SIZE, offset)
+        if (
+            self.log_path.stat().st_size < offset
+            or self.head(head_size) != self.meta("head")
+        ) and offset:
+            logger.info("%s was rotated, indexing it again", self.log_path)
+            self.clear()
+            offset = 0
+        running = self.connection.execute(
+            "SELECT id, offset FROM runs WHERE status = 'running'"
+        ).fetchone()
+        if running is not None:
+            self.clear(running[0])
+            offset = running[1]
+        return offset
+
+    def update(self) -> int:
+        """Index the lines appended to the log, return the number of new tasks."""
+        if not self.log_path.exists():
+            raise LogIndexError(f"{self.log_path} does not exist")
+        with self.connection:
+            offset = self.resume_offset()
+        parser = RunParser(self, offset)
+        nb_tasks = committed = 0
+        for line in read_lines(self.log_path, offset):
+            nb_tasks += parser.feed(line)
+            if nb_tasks - committed >= COMMIT_INTERVAL:
+                self.connection.commit()
+                committed = nb_tasks
+        parser.flush()
+        self.set_meta("offset", str(parser.offset))
+        self.set_meta("head", self.head(min(HEAD_SIZE, parser.offset)))
+        self.connection.commit()
+        return nb_tasks
+
+    def close(self):
+        self.connection.close()
+
+
+class RunParser:
+    """State of the run, play and task being read, written to the index
+    when they end."""
+
+    def __init__(self, index: LogIndex, offset: int):
+        self.connection = index.connection
+        # End of the last line read
+        self.offset = offset
+        self.run_id: Optional[int] = None
+        self.run_pid: Optional[int] = None
+        self.run_end = 0.0
+        self.play: Optional[str] = None
+        self.task: Optional[Tuple[str, float]] = None
+        # Last result and its time by host
+        self.results: Dict[str, Tuple[str, float]] = {}
+        self.occurrences: Dict[Tuple[str, str], int] = {}
+
+    def feed(self, line: LogLine) -> int:
+        nb_tasks = 0
+        self.offset = line.end
+        if line.pid != self.run_pid:
+            nb_tasks += self.end_run("interrupted")
+            self.start_run(line)
+        elif self.run_id is None:
+            if not RE_PLAY.match(line.message):
+                # Recap of the hosts at the end of the run
+                return 0
+            # New run reusing the pid of the previous one, e.g. after a
+            # restart of the container
+            self.start_run(line)
+        self.run_end = line.time
+        message = line.message
+        if RE_RECAP.match(message):
+            nb_tasks += self.end_run("done")
+        elif match := RE_PLAY.match(message):
+            nb_tasks += self.end_task(line.time)
+            self.play = match.group(1)
+            self.connection.execute(
+                "UPDATE runs SET first_play = coalesce(first_play, ?) WHERE id = ?",
+                (self.play, self.run_id),
+            )
+        elif match := RE_TASK.match(message):
+            nb_tasks += self.end_task(line.time)
+            kind, name = match.groups()
+            if kind == "RUNNING HANDLER":
+                name = f"handler {name}"
+            self.task = (name, line.time)
+        elif (match := RE_HOST_RESULT.match(message)) and self.task is not None:
+            status, host = match.groups()
+            previous = self.results.get(host)
+            if previous is None or previous[0] not in FAILED_STATUSES:
+                self.results[host] = (status, line.time)
+            else:
+                self.results[host] = (previous[0], line.time)
+        return nb_tasks
+
+    def start_run(self, line: LogLine):
+        self.run_id = self.connection.execute(
+            "INSERT INTO runs (pid, user, offset, start, end, status)"
+            " VALUES (?, ?, ?, ?, ?, 'running')",
+            (line.pid, line.user, line.offset, line.time, line.time),
+        ).lastrowid
+        self.run_pid = line.pid
+        self.play = None
+        self.occurrences = {}
+
+    def end_task(self, end: float) -> int:
+        if self.task is None:
+            return 0
+        name, start = self.task
+        play = self.play or ""
+        occurrence = self.occurrences.get((play, name), 0)
+        self.occurrences[(play, name)] = occurrence + 1
+        task_id = self.connection.execute(
+            "INSERT INTO tasks (run_id, play, name, occurrence, start, duration)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self.run_id, play, name, occurrence, start, end - start),
+        ).lastrowid
+        self.connection.executemany(
+            "INSERT INTO host_results (task_id, host, status, duration)"
+            " VALUES (?, ?, ?, ?)",
+            [
+                (task_id, host, status, finished - start)
+                for host, (status, finished) in self.results.items()
+            ],
+        )
+        self.task = None
+        self.results = {}
+        return 1
+
+    def end_run(self, status: str) -> int:
+        if self.run_id is None:
+            return 0
+        nb_tasks = self.end_task(self.run_end)
+        self.connection.execute(
+            "UPDATE runs SET end = ?, status = ? WHERE id = ?",
+            (self.run_end, status, self.run_id),
+        )
+        # The lines of the recap belong to no run
+        self.run_id = None
+        return nb_tasks
+
+    def flush(self):
+        """Write the task being read, its run stays running and is read
+        again by the next update."""
+        if self.run_id is None:
+            return
+        self.end_task(self.run_end)
+        self.connection.execute(
+            "UPDATE runs SET end = ? WHERE id = ?", (self.run_end, self.run_id)
+        )
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+def runs(connection: sqlite3.Connection, top: int) -> List[str]:
+    rows = connection.execute(
+        """
+        SELECT runs.id, runs.start, runs.end, status, first_play, count(tasks.id)
+        FROM runs LEFT JOIN tasks ON tasks.run_id = runs.id
+        GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?
+        """,
+        (top,),
+    )
+    return [
+        f"{run_id:6} {datetime.fromtimestamp(start):%Y-%m-%d %H:%M:%S}"
+        f" {format_duration(end - start):>9} {status:<11} {nb_tasks:5} tasks"
+        f"  {first_play or ''}"
+        for run_id, start, end, status, first_play, nb_tasks in rows
+    ]
+
+
+def slowest(connection: sqlite3.Connection, top: int, run: Optional[int]) -> List[str]:
+    if run is not None:
+        rows = connection.execute(
+            "SELECT duration, 1, play, name FROM tasks WHERE run_id = ?"
+            " ORDER BY duration DESC LIMIT ?",
+            (run, top),
+        )
+    else:
+        # Total time of each task over every run
+        rows = connection.execute(
+            "SELECT sum(duration), count(*), play, name FROM tasks"
+            " GROUP BY play, name ORDER BY sum(duration) DESC LIMIT ?",
+            (top,),
+        )
+    return [
+        f"{format_duration(duration):>9} {count:5}x  {play} / {name}"
+        for duration, count, play, name in rows
+    ]
+
+
+def skew(connection: sqlite3.Connection, top: int, run: Optional[int]) -> List[str]:
+    rows = connection.execute(
+        f"""
+        SELECT tasks.id, tasks.run_id, play, name,
+            max(host_results.duration) - min(host_results.duration) AS skew
+        FROM tasks JOIN host_results ON host_results.task_id = tasks.id
+        {"WHERE tasks.run_id = ?" if run is not None else ""}
+        GROUP BY tasks.id HAVING count(*) > 1
+        ORDER BY skew DESC LIMIT ?
+        """,
+        (run, top) if run is not None else (top,),
+    ).fetchall()
+    lines = []
+    for task_id, run_id, play, name, task_skew in rows:
+        slowest_host, duration = connection.execute(
+            "SELECT host, duration FROM host_results WHERE task_id = ?"
+            " ORDER BY duration DESC LIMIT 1",
+            (task_id,),
+        ).fetchone()
+        lines.append(
+            f"{format_duration(task_skew):>9} run {run_id:<6} {play} / {name}"
+            f" (slowest {slowest_host} {format_duration(duration)})"
+        )
+    return lines
+
+
+def diff(connection: sqlite3.Connection, top: int, run_a: int, run_b: int) -> List[str]:
+    """Tasks whose duration changed the most between two runs, matched by
+    play, name and occurrence."""
+    rows = connection.execute(
+        """
+        SELECT a.play, a.name, a.duration, b.duration
+        FROM tasks a JOIN tasks b ON a.play = b.play AND a.name = b.name
+            AND a.occurrence = b.occurrence
+        WHERE a.run_id = ? AND b.run_id = ?
+        ORDER BY abs(b.duration - a.duration) DESC LIMIT ?
+        """,
+        (run_a, run_b, top),
+    )
+    lines = [
+        f"{b_duration - a_duration:+9.1f}s {format_duration(a_duration):>9}"
+        f" -> {format_duration(b_duration):>9}  {play} / {name}"
+        for play, name, a_duration, b_duration in rows
+    ]
+    for label, run, other in (("only in", run_a, run_b), ("only in", run_b, run_a)):
+        (nb_tasks,) = connection.execute(
+            """
+            SELECT count(*) FROM tasks a WHERE a.run_id = ? AND NOT EXISTS (
+                SELECT 1 FROM tasks b WHERE b.run_id = ? AND a.play = b.play
+                    AND a.name = b.name AND a.occurrence = b.occurrence
+            )
+            """,
+            (run, other),
+        ).fetchone()
+        if nb_tasks:
+            lines.append(f"{nb_tasks} tasks {label} run {run}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", type=Path, default=DEFAULT_LOG)
+    parser.add_argument(
+        "--index", type=Path, help="SQLite index (default: <log>.index.sqlite)"
+    )
+    parser.add_argument("--top", type=int, default=20, help="Number of lines")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("update", help="Index the new lines of the log")
+    subparsers.add_parser("runs", help="Last runs")
+    for name, help_text in (
+        ("slowest", "Slowest tasks, over every run by default"),
+        ("skew", "Tasks with the largest gap between their fastest and slowest host"),
+    ):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("--run", type=int, help="Only this run")
+    diff_parser = subparsers.add_parser(
+        "diff", help="Tasks whose duration changed the most between two runs"
+    )
+    diff_parser.add_argument("run_a", type=int)
+    diff_parser.add_argument("run_b", type=int)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not args.log.exists():
+        # Checked before the index is created next to it
+        logger.error("%s does not exist", args.log)
+        return 1
+    index_path = args.index or args.log.with_name(f"{args.log.name}.index.sqlite")
+    index = LogIndex(args.log, index_path)
+    try:
+        # Every query sees the lines appended since the previous command
+        nb_tasks = index.update()
+        if args.command == "update":
+            logger.info("%s new tasks indexed in %s", nb_tasks, index_path)
+            return 0
+        if args.command == "runs":
+            lines = runs(index.connection, args.top)
+        elif args.command == "slowest":
+            lines = slowest(index.connection, args.top, args.run)
+        elif args.command == "skew":
+            lines = skew(index.connection, args.top, args.run)
+        else:
+            lines = diff(index.connection, args.top, args.run_a, args.run_b)
+    except LogIndexError as error:
+        logger.error("%s", error)
+        return 1
+    finally:
+        index.close()
+    print("\n".join(lines))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
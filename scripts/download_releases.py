@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Download the component releases listed in the release uri files.
+
+Each line of a list is `<uri>[;<file name>]`. The releases are downloaded in
+parallel into a content-addressed store and hardlinked into the `files`
+directory, so a release listed several times or in several lists is stored
+once. The checksum, size and HTTP validators of each uri are kept in a
+manifest: a re-run sends conditional requests and only downloads the
+releases which changed, and an interrupted download is resumed with a
+range request.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("download_releases")
+
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_RELEASE_LIST = REPOSITORY_DIR / "scripts" / "tdp-v2-release-uris.txt"
+CHUNK_SIZE = 1024 * 1024
+USER_AGENT = "tdp-dev-download-releases"
+
+
+class Release(NamedTuple):
+    uri: str
+    file_name: str
+
+
+class DownloadError(Exception):
+    pass
+
+
+def read_release_list(path: Path) -> List[Release]:
+    releases = []
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        uri, _, file_name = line.partition(";")
+        if not file_name:
+            file_name = os.path.basename(urllib.parse.urlparse(uri).path)
+        releases.append(Release(uri, file_name))
+    return releases
+
+
+def unique_releases(releases: List[Release]) -> List[Release]:
+    by_file_name: Dict[str, Release] = {}
+    for release in releases:
+        known = by_file_name.setdefault(release.file_name, release)
+        if known.uri != release.uri:
+            raise DownloadError(
+                f"{release.file_name} is listed with two uris:"
+                f" {known.uri} and {release.uri}"
+            )
+    return list(by_file_name.values())
+
+
+class Store:
+    """Blobs named after their sha256 and the manifest of the uris."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.blobs_dir = path / "sha256"
+        self.partial_dir = path / "partial"
+        self.manifest_path = path / "manifest.json"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        if self.manifest_path.exists():
+            self.manifest: Dict[str, dict] = json.loads(self.manifest_path.read_text())
+        else:
+            self.manifest = {}
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blobs_dir / sha256[:2] / sha256
+
+    def partial_path(self, uri: str) -> Path:
+        return self.partial_dir / hashlib.sha256(uri.encode()).hexdigest()
+
+    def entry(self, uri: str, verify: bool = False) -> Optional[dict]:
+        """Manifest entry of the uri if its blob is intact."""
+        with self.lock:
+            entry = self.manifest.get(uri)
+        if entry is None:
+            return None
+        blob_path = self.blob_path(entry["sha256"])
+        if not blob_path.exists() or blob_path.stat().st_size != entry["size"]:
+            return None
+        if verify and file_sha256(blob_path) != entry["sha256"]:
+            return None
+        return entry
+
+    def add(self, uri: str, partial_path: Path, sha256: str, headers: dict) -> dict:
+        blob_path = self.blob_path(sha256)
+        blob_path.parent.mkdir(exist_ok=True)
+        if blob_path.exists():
+            # Same content under another uri, the links to the blob are kept
+            partial_path.unlink()
+        else:
+            os.replace(partial_path, blob_path)
+        entry = {
+            "sha256": sha256,
+            "size": blob_path.stat().st_size,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        with self.lock:
+            self.manifest[uri] = entry
+            # Written after each download so an interrupted run keeps them
+            tmp_path = self.manifest_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.manifest, indent=2, sort_keys=True))
+            os.replace(tmp_path, self.manifest_path)
+        return entry
+
+
+def file_sha256(path: Path, digest=None) -> str:
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as blob:
+        while chunk := blob.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download(store: Store, uri: str, verify: bool = False) -> dict:
+    """Download `uri` into the store unless the stored blob is still valid,
+    returns its manifest entry with the number of bytes transferred."""
+    entry = store.entry(uri, verify)
+    partial_path = store.partial_path(uri)
+    validators_path = partial_path.with_suffix(".json")
+    headers = {"User-Agent": USER_AGENT}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    if offset and validators_path.exists():
+        # The range is only honored if the release did not change since
+        validator = json.loads(validators_path.read_text())
+        if validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+    request = urllib.request.Request(uri, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=60)
+    except urllib.error.HTTPError as error:
+        if error.code == 304 and entry is not None:
+            return {**entry, "transferred": 0, "changed": False}
+        if error.code == 416 and "Range" in headers:
+            # The partial file is not a prefix of the release anymore
+            partial_path.unlink()
+            validators_path.unlink()
+            return download(store, uri, verify)
+        raise DownloadError(f"{uri}: HTTP {error.code}") from error
+    except urllib.error.URLError as error:
+        raise DownloadError(f"{uri}: {error.reason}") from error
+    except (OSError, http.client.HTTPException) as error:
+        raise DownloadError(f"{uri}: {error!r}") from error
+
+    with response:
+        digest = hashlib.sha256()
+        if getattr(response, "status", None) == 206:
+            file_sha256(partial_path, digest)
+            mode = "ab"
+        else:
+            offset = 0
+            mode = "wb"
+        validators_path.write_text(
+            json.dumps(
+                response.headers.get("ETag") or response.headers.get("Last-Modified")
+            )
+        )
+        transferred = 0
+        try:
+            with open(partial_path, mode) as partial:
+                while chunk := response.read(CHUNK_SIZE):
+                    partial.write(chunk)
+                    digest.update(chunk)
+                    transferred += len(chunk)
+        except (OSError, http.client.HTTPException) as error:
+            # The partial file and its validator are kept for the next run
+            raise DownloadError(
+                f"{uri}: {error!r} after {transferred} bytes, run again to resume"
+            ) from error
+        length = response.headers.get("Content-Length")
+        if length is not None and transferred != int(length):
+            raise DownloadError(
+                f"{uri}: {transferred} bytes received out of {length},"
+                " run again to resume"
+            )
+        sha256 = digest.hexdigest()
+        # Local files and servers without validators send the release again
+        changed = entry is None or entry["sha256"] != sha256
+        if changed:
+            entry = store.add(uri, partial_path, sha256, dict(response.headers))
+        else:
+            partial_path.unlink()
+    validators_path.unlink()
+    return {
+        **entry,
+        "transferred": transferred,
+        "resumed_at": offset,
+        "changed": changed,
+    }
+
+
+def link(blob_path: Path, target: Path):
+    if target.exists() and os.path.samefile(blob_path, target):
+        return
+    tmp_path = target.with_name(f".{target.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(blob_path, tmp_path)
+    except OSError:
+        # The store is on another filesystem
+        shutil.copyfile(blob_path, tmp_path)
+    os.replace(tmp_path, target)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "release_lists",
+        nargs="*",
+        type=Path,
+        default=[Path(os.environ.get("tdp_release_script_path", DEFAULT_RELEASE_LIST))],
+        help="Release uri files, the TDP 2 list by default"
+        " or the one set in tdp_release_script_path",
+    )
+    parser.add_argument("--files-dir", type=Path, default=REPOSITORY_DIR / "files")
+    parser.add_argument(
+        "--store",
+        type=Path,
+        help="Content-addressed store, on the filesystem of the files directory"
+        " so it can be hardlinked (default: <files-dir>/.store)",
+    )
+    parser.add_argument("--jobs", type=int, default=4, help="Parallel downloads")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check the sha256 of the stored releases instead of their size",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    releases = unique_releases(
+        [
+            release
+            for release_list in args.release_lists
+            for release in read_release_list(release_list)
+        ]
+    )
+    args.files_dir.mkdir(parents=True, exist_ok=True)
+    store = Store(args.store or args.files_dir / ".store")
+
+    errors = 0
+    transferred = 0
+    # A uri listed under two names is downloaded once
+    uris = sorted({release.uri for release in releases})
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        futures = {
+            executor.submit(download, store, uri, args.verify): uri for uri in uris
+        }
+        entries = {}
+        for future in concurrent.futures.as_completed(futures):
+            uri = futures[future]
+            try:
+                entry = future.result()
+            except DownloadError as error:
+                errors += 1
+                logger.error("FAILED %s", error)
+                continue
+            entries[uri] = entry
+            transferred += entry["transferred"]
+            if not entry["changed"]:
+                status = "unchanged"
+            elif entry.get("resumed_at"):
+                status = f"resumed at {entry['resumed_at']} bytes"
+            else:
+                status = "downloaded"
+            logger.info("%s %s %s", entry["sha256"][:12], status, uri)
+
+    for release in releases:
+        if release.uri in entries:
+            blob_path = store.blob_path(entries[release.uri]["sha256"])
+            link(blob_path, args.files_dir / release.file_name)
+
+    logger.info(
+        "%s releases, %s MB transferred, %s failed",
+        len(releases),
+        round(transferred / 1024 / 1024, 1),
+        errors,
+    )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
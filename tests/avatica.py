@@ -0,0 +1,461 @@
+# Avatica protobuf protocol https://calcite.apache.org/avatica/docs/protobuf_reference.html
+import concurrent.futures
+import datetime
+import decimal
+import itertools
+import logging
+import struct
+import subprocess
+import time
+import uuid
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    NamedTuple,
+    Sequence,
+    Tuple,
+)
+
+from testinfra.host import Host
+
+from .hbase_load import protobuf_field, protobuf_varint
+from .pooling import UserPool
+from .remote_agent import spawn_command
+from .stats import percentiles
+
+logger = logging.getLogger("testinfra")
+
+REQUESTS_PACKAGE = "org.apache.calcite.avatica.proto.Requests$"
+RESPONSES_PACKAGE = "org.apache.calcite.avatica.proto.Responses$"
+RESPONSE_MARKER = b"\n__AVATICA__ "
+# Rows of each frame sent by the query server
+FRAME_MAX_SIZE = 1000
+# Time a statement waits for a free connection of the pool
+CONNECTION_WAIT_TIMEOUT = 600
+
+# common.proto Rep
+REP_BOOLEANS = (0, 8)
+REP_INTEGERS = (1, 3, 4, 5, 9, 11, 12, 13)
+REP_FLOATS = (6, 7, 14, 15)
+REP_STRINGS = (2, 10, 21)
+REP_TIME, REP_TIMESTAMP, REP_DATE = 16, 17, 18
+REP_BYTE_STRING, REP_STRING, REP_NULL = 20, 21, 24
+REP_BIG_DECIMAL, REP_ARRAY = 26, 27
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class AvaticaError(Exception):
+    pass
+
+
+class AvaticaResult(NamedTuple):
+    columns: List[str]
+    rows: List[tuple]
+    # Rows changed by a DML statement, -1 for a query
+    update_count: int
+    # Time the query server took to answer the requests of the statement
+    seconds: float
+
+
+def protobuf_varint_field(number: int, value: int) -> bytes:
+    # Varint field (wire type 0), negative numbers take 10 bytes
+    return protobuf_varint(number << 3) + protobuf_varint(value % 2**64)
+
+
+def protobuf_string_field(number: int, value: str) -> bytes:
+    return protobuf_field(number, value.encode())
+
+
+def read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def parse_message(data: bytes) -> Dict[int, List[Any]]:
+    """Values of the fields of a protobuf message by field number, varints
+    are ints and the other wire types are bytes."""
+    fields: Dict[int, List[Any]] = {}
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 2:
+            length, position = read_varint(data, position)
+            value = data[position : position + length]
+            position += length
+        elif wire_type in (1, 5):
+            size = 8 if wire_type == 1 else 4
+            value = data[position : position + size]
+            position += size
+        else:
+            raise AvaticaError(f"Unsupported protobuf wire type {wire_type}")
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def first(fields: Dict[int, List[Any]], number: int, default: Any = None) -> Any:
+    return fields[number][-1] if number in fields else default
+
+
+def encode_typed_value(value: Any) -> bytes:
+    # TypedValue { Rep type = 1; bool bool_value = 2; string string_value = 3;
+    # sint64 number_value = 4; bytes bytes_value = 5; double double_value = 6;
+    # bool null = 7 }
+    if value is None:
+        return protobuf_varint_field(1, REP_NULL) + protobuf_varint_field(7, 1)
+    if isinstance(value, bool):
+        return protobuf_varint_field(1, 8) + protobuf_varint_field(2, int(value))
+    if isinstance(value, int):
+        # Zigzag encoding of sint64
+        zigzag = (value << 1) ^ (value >> 63)
+        return protobuf_varint_field(1, 13) + protobuf_varint_field(4, zigzag)
+    if isinstance(value, float):
+        return (
+            protobuf_varint_field(1, 15)
+            + protobuf_varint(6 << 3 | 1)
+            + struct.pack("<d", value)
+        )
+    if isinstance(value, bytes):
+        return protobuf_varint_field(1, REP_BYTE_STRING) + protobuf_field(5, value)
+    return protobuf_varint_field(1, REP_STRING) + protobuf_string_field(3, str(value))
+
+
+def decode_typed_value(data: bytes) -> Any:
+    fields = parse_message(data)
+    rep = first(fields, 1, 0)
+    if first(fields, 7, 0) or rep == REP_NULL:
+        return None
+    number = first(fields, 4, 0)
+    number = (number >> 1) ^ -(number & 1)
+    if rep in REP_BOOLEANS:
+        return bool(first(fields, 2, 0))
+    if rep in REP_INTEGERS:
+        return number
+    if rep in REP_FLOATS:
+        return struct.unpack("<d", first(fields, 6, bytes(8)))[0]
+    if rep == REP_DATE:
+        return (EPOCH + datetime.timedelta(days=number)).date()
+    if rep == REP_TIMESTAMP:
+        return EPOCH + datetime.timedelta(milliseconds=number)
+    if rep == REP_TIME:
+        return (EPOCH + datetime.timedelta(milliseconds=number)).time()
+    if rep == REP_BYTE_STRING:
+        return first(fields, 5, b"")
+    if rep == REP_ARRAY:
+        return [decode_typed_value(value) for value in fields.get(8, [])]
+    string = first(fields, 3, b"").decode()
+    if rep == REP_BIG_DECIMAL:
+        return decimal.Decimal(string)
+    if rep in REP_STRINGS or 3 in fields:
+        return string
+    return number
+
+
+def decode_row(data: bytes) -> tuple:
+    # Row { repeated ColumnValue value = 1 }
+    # ColumnValue { repeated TypedValue value = 1; repeated TypedValue
+    # array_value = 2; bool has_array_value = 3; TypedValue scalar_value = 4 }
+    row = []
+    for column_value in parse_message(data).get(1, []):
+        fields = parse_message(column_value)
+        if first(fields, 3, 0):
+            row.append([decode_typed_value(value) for value in fields.get(2, [])])
+        elif 4 in fields:
+            row.append(decode_typed_value(first(fields, 4)))
+        else:
+            # Servers older than Avatica 1.7
+            row.append(decode_typed_value(first(fields, 1, b"")))
+    return tuple(row)
+
+
+def signature_columns(signature: bytes) -> List[str]:
+    # Signature { repeated ColumnMetaData columns = 1 }
+    # ColumnMetaData { string label = 9 }
+    return [
+        first(parse_message(column), 9, b"").decode()
+        for column in parse_message(signature).get(1, [])
+    ]
+
+
+class AvaticaStatement:
+    """Statement prepared once on the query server and executed with new
+    parameters each time."""
+
+    def __init__(self, connection: "AvaticaConnection", sql: str):
+        self.connection = connection
+        self.sql = sql
+        self.update_count = -1
+        # PrepareRequest { string connection_id = 1; string sql = 2;
+        # int64 max_rows_total = 4 }
+        response, self.prepare_time = connection.send(
+            "PrepareRequest",
+            protobuf_string_field(1, connection.connection_id)
+            + protobuf_string_field(2, sql)
+            + protobuf_varint_field(4, -1),
+        )
+        # PrepareResponse { StatementHandle statement = 1 }
+        # StatementHandle { uint32 id = 2; Signature signature = 3 }
+        self.handle = first(response, 1)
+        handle = parse_message(self.handle)
+        self.statement_id = first(handle, 2, 0)
+        self.columns = signature_columns(first(handle, 3, b""))
+
+    def _frames(
+        self, parameters: Sequence[Any], frame_max_size: int
+    ) -> Generator[List[tuple], None, float]:
+        # ExecuteRequest { StatementHandle statementHandle = 1; repeated
+        # TypedValue parameter_values = 2; bool has_parameter_values = 4;
+        # int32 first_frame_max_size = 5 }
+        response, seconds = self.connection.send(
+            "ExecuteRequest",
+            protobuf_field(1, self.handle)
+            + b"".join(protobuf_field(2, encode_typed_value(p)) for p in parameters)
+            + protobuf_varint_field(4, 1)
+            + protobuf_varint_field(5, frame_max_size),
+        )
+        if first(response, 2, 0):
+            self.connection.broken = True
+            raise AvaticaError(f"Statement {self.statement_id} is missing: {self.sql}")
+        # ResultSetResponse { Signature signature = 4; Frame first_frame = 5;
+        # uint64 update_count = 6 }
+        result = parse_message(first(response, 1, b""))
+        update_count = first(result, 6, 0)
+        self.update_count = (
+            update_count - 2**64 if update_count >= 2**63 else update_count
+        )
+        frame = first(result, 5)
+        offset = 0
+        while frame is not None:
+            # Frame { uint64 offset = 1; bool done = 2; repeated Row rows = 3 }
+            frame = parse_message(frame)
+            rows = [decode_row(row) for row in frame.get(3, [])]
+            offset += len(rows)
+            yield rows
+            if first(frame, 2, 0):
+                break
+            # FetchRequest { string connection_id = 1; uint32 statement_id = 2;
+            # uint64 offset = 3; int32 frame_max_size = 5 }
+            response, fetch_time = self.connection.send(
+                "FetchRequest",
+                protobuf_string_field(1, self.connection.connection_id)
+                + protobuf_varint_field(2, self.statement_id)
+                + protobuf_varint_field(3, offset)
+                + protobuf_varint_field(5, frame_max_size),
+            )
+            seconds += fetch_time
+            # FetchResponse { Frame frame = 1; bool missing_statement = 2;
+            # bool missing_results = 3 }
+            if first(response, 2, 0) or first(response, 3, 0):
+                self.connection.broken = True
+                raise AvaticaError(f"Results of {self.sql} are missing at {offset}")
+            frame = first(response, 1)
+        return seconds
+
+    def iter_rows(
+        self, parameters: Sequence[Any] = (), frame_max_size: int = FRAME_MAX_SIZE
+    ) -> Iterator[tuple]:
+        """Rows of the statement, fetched frame by frame while they are read."""
+        for rows in self._frames(parameters, frame_max_size):
+            yield from rows
+
+    def execute(
+        self, parameters: Sequence[Any] = (), frame_max_size: int = FRAME_MAX_SIZE
+    ) -> AvaticaResult:
+        frames = self._frames(parameters, frame_max_size)
+        rows: List[tuple] = []
+        while True:
+            try:
+                rows.extend(next(frames))
+            except StopIteration as stop:
+                seconds = stop.value
+                break
+        return AvaticaResult(self.columns, rows, self.update_count, seconds)
+
+    def close(self):
+        # CloseStatementRequest { string connection_id = 1; uint32 statement_id = 2 }
+        self.connection.send(
+            "CloseStatementRequest",
+            protobuf_string_field(1, self.connection.connection_id)
+            + protobuf_varint_field(2, self.statement_id),
+        )
+
+
+class AvaticaConnection:
+    """Connection to the Phoenix Query Server opened as `user`.
+
+    Each request is a protobuf message posted by curl on the edge host with
+    SPNEGO authentication, the connection and its prepared statements live
+    on the query server between requests.
+    """
+
+    def __init__(self, host: Host, user: str, url: str):
+        self.host = host
+        self.user = user
+        self.url = url
+        self.connection_id = str(uuid.uuid4())
+        self.statements: Dict[str, AvaticaStatement] = {}
+        # Set once a request failed, the query server may have expired the
+        # connection or lost its statements
+        self.broken = False
+        # OpenConnectionRequest { string connection_id = 1 }
+        self.send("OpenConnectionRequest", protobuf_string_field(1, self.connection_id))
+        # ConnectionSyncRequest { string connection_id = 1; ConnectionProperties
+        # conn_props = 2 }, ConnectionProperties { bool is_dirty = 1;
+        # bool auto_commit = 2; bool has_auto_commit = 7 }
+        self.send(
+            "ConnectionSyncRequest",
+            protobuf_string_field(1, self.connection_id)
+            + protobuf_field(
+                2,
+                protobuf_varint_field(1, 1)
+                + protobuf_varint_field(2, 1)
+                + protobuf_varint_field(7, 1),
+            ),
+        )
+
+    def send(self, request: str, message: bytes) -> Tuple[Dict[int, List[Any]], float]:
+        """Post the request and return the fields of the response with the
+        time the query server took to answer."""
+        try:
+            return self._post(request, message)
+        except AvaticaError:
+            self.broken = True
+            raise
+
+    def _post(self, request: str, message: bytes) -> Tuple[Dict[int, List[Any]], float]:
+        # WireMessage { string name = 1; bytes wrapped_message = 2 }
+        body = protobuf_string_field(1, REQUESTS_PACKAGE + request) + protobuf_field(
+            2, message
+        )
+        curl_cmd = (
+            "curl --silent --show-error --insecure --negotiate --user :"
+            " --request POST --header 'Content-Type: application/octet-stream'"
+            " --data-binary @- --write-out '\\n__AVATICA__ %{http_code} %{time_total}'"
+            f" '{self.url}'"
+        )
+        process = subprocess.run(
+            spawn_command(self.host, curl_cmd, self.user),
+            shell=True,
+            input=body,
+            capture_output=True,
+        )
+        content, marker, status = process.stdout.rpartition(RESPONSE_MARKER)
+        if process.returncode != 0 or not marker:
+            raise AvaticaError(f"{request} failed: {process.stderr.decode()}")
+        http_status, seconds = status.decode().split()
+        wire_message = parse_message(content)
+        name = first(wire_message, 1, b"").decode()
+        response = parse_message(first(wire_message, 2, b""))
+        if name == RESPONSES_PACKAGE + "ErrorResponse":
+            # ErrorResponse { repeated string exceptions = 1;
+            # string error_message = 2 }
+            raise AvaticaError(
+                f"{request} failed: {first(response, 2, b'').decode()}\n"
+                + "\n".join(e.decode() for e in response.get(1, []))
+            )
+        if http_status != "200":
+            raise AvaticaError(f"{request} failed with http status {http_status}")
+        return response, float(seconds)
+
+    def prepare(self, sql: str) -> AvaticaStatement:
+        # Statements are prepared once per connection
+        if sql not in self.statements:
+            self.statements[sql] = AvaticaStatement(self, sql)
+        return self.statements[sql]
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()) -> AvaticaResult:
+        return self.prepare(sql).execute(parameters)
+
+    def close(self):
+        if not self.broken:
+            for statement in self.statements.values():
+                statement.close()
+        self.statements.clear()
+        try:
+            # CloseConnectionRequest { string connection_id = 1 }
+            self.send(
+                "CloseConnectionRequest", protobuf_string_field(1, self.connection_id)
+            )
+        except AvaticaError:
+            if not self.broken:
+                raise
+            logger.info("Connection %s was already closed", self.connection_id)
+
+
+class AvaticaConnectionPool(UserPool[AvaticaConnection]):
+    """Open Phoenix Query Server connections per user, reused by the tests.
+
+    At most `max_connections` connections are opened per user, a statement
+    waits up to `wait_timeout` seconds for a free connection when all of
+    them are in use.
+    """
+
+    error = AvaticaError
+    kind = "Phoenix Query Server connection"
+
+    def __init__(
+        self,
+        host: Host,
+        url: str,
+        max_connections: int = 2,
+        wait_timeout: float = CONNECTION_WAIT_TIMEOUT,
+    ):
+        super().__init__(max_connections, wait_timeout)
+        self.host = host
+        self.url = url
+
+    def open(self, user: str) -> AvaticaConnection:
+        return AvaticaConnection(self.host, user, self.url)
+
+    def connection(self, user: str) -> ContextManager[AvaticaConnection]:
+        return self.acquire(user)
+
+    def execute(
+        self, user: str, sql: str, parameters: Sequence[Any] = ()
+    ) -> AvaticaResult:
+        with self.connection(user) as connection:
+            return connection.execute(sql, parameters)
+
+
+def run_load(
+    pool: AvaticaConnectionPool,
+    user: str,
+    queries: Sequence[Tuple[str, Sequence[Any]]],
+    nb_queries: int,
+    concurrency: int,
+) -> dict:
+    """Run `nb_queries` queries, taken in turn from `queries`, from
+    `concurrency` threads and report the latency percentiles."""
+    latencies = []
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        futures = [
+            executor.submit(pool.execute, user, sql, parameters)
+            for sql, parameters in itertools.islice(
+                itertools.cycle(queries), nb_queries
+            )
+        ]
+        for future in futures:
+            latencies.append(future.result().seconds)
+    duration = time.perf_counter() - start
+    report = {
+        "queries": len(latencies),
+        "concurrency": concurrency,
+        "seconds": duration,
+        "queries_per_second": len(latencies) / duration if duration else 0,
+        "latency": percentiles(latencies),
+    }
+    logger.info("Phoenix Query Server load on %s: %s", pool.url, report)
+    return report
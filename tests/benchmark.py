@@ -0,0 +1,224 @@
+import contextlib
+import hashlib
+import json
+import math
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from testinfra.host import Host
+
+# Files of the repository describing the deployed cluster
+CLUSTER_CONFIG_PATHS = ("inventory", "tdp_vars_overrides")
+REPOSITORY_DIR = Path(__file__).resolve().parent.parent
+
+BENCHMARK_PROPERTY = "benchmark"
+# Fewer runs in the baseline give no verdict
+BENCHMARK_MIN_BASELINE_RUNS = 3
+# A value is a regression when it is worse than the baseline mean by more
+# than this ratio and by more than this number of standard deviations
+BENCHMARK_MIN_CHANGE = 0.1
+BENCHMARK_MAX_DEVIATIONS = 3
+
+
+class Metric(NamedTuple):
+    name: str
+    value: float
+    unit: str = ""
+    higher_is_better: bool = False
+
+
+class Comparison(NamedTuple):
+    nodeid: str
+    metric: Metric
+    baseline_mean: Optional[float]
+    nb_baseline_runs: int
+    verdict: str
+
+
+def cluster_config_hash(paths: Iterable[str] = CLUSTER_CONFIG_PATHS) -> str:
+    digest = hashlib.sha256()
+    for config_path in paths:
+        for path in sorted((REPOSITORY_DIR / config_path).rglob("*")):
+            if path.is_file():
+                digest.update(str(path.relative_to(REPOSITORY_DIR)).encode())
+                digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def component_versions(host: Host) -> Dict[str, str]:
+    # The components are installed in /opt/tdp/<component> which links to
+    # the directory of the release
+    stdout = host.check_output(
+        "find /opt/tdp -mindepth 1 -maxdepth 1 -type l -printf '%f %l\\n'"
+    )
+    return dict(line.split(" ", 1) for line in stdout.splitlines() if " " in line)
+
+
+class Benchmark:
+    """Metrics of a test, sent to the controller with the report of the test.
+
+    The wall time of the test is always recorded, `timer` and `record` add
+    the metrics the test knows about.
+    """
+
+    def __init__(self):
+        # Plain tuples, xdist can not serialize the named tuples
+        self.metrics: List[tuple] = []
+        # Settings the metrics depend on, e.g. the executor layout of a Spark
+        # job, results are only compared to results with the same parameters
+        self.parameters: Dict[str, Any] = {}
+
+    def record(
+        self, name: str, value: float, unit: str = "", higher_is_better: bool = False
+    ):
+        self.metrics.append(tuple(Metric(name, value, unit, higher_is_better)))
+
+    @contextlib.contextmanager
+    def timer(self, name: str, nb_items: Optional[int] = None):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.record(f"{name}_time", elapsed, "s")
+        if nb_items is not None and elapsed > 0:
+            self.record(f"{name}_throughput", nb_items / elapsed, "items/s", True)
+
+
+def compare(
+    value: float, baseline: List[float], higher_is_better: bool
+) -> Optional[bool]:
+    """Whether `value` is a regression from the `baseline` values, `None`
+    when the baseline is too short."""
+    if len(baseline) < BENCHMARK_MIN_BASELINE_RUNS:
+        return None
+    mean = statistics.mean(baseline)
+    stdev = statistics.stdev(baseline)
+    change = (value - mean) / mean if mean else 0
+    if higher_is_better:
+        change = -change
+    deviations = abs(value - mean) / stdev if stdev else math.inf
+    return change > BENCHMARK_MIN_CHANGE and deviations > BENCHMARK_MAX_DEVIATIONS
+
+
+class BenchmarkHistory:
+    """Results of the benchmark runs, the baseline of a result is made of
+    the previous runs on the same cluster configuration and versions."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started REAL NOT NULL,
+                verdict TEXT
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                run_id INTEGER NOT NULL REFERENCES runs(id),
+                config_hash TEXT NOT NULL,
+                versions TEXT NOT NULL,
+                nodeid TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                value REAL NOT NULL,
+                unit TEXT NOT NULL,
+                higher_is_better INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_baseline
+                ON results (nodeid, metric, config_hash, versions, run_id);
+            """)
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(results)")
+        ]
+        if "parameters" not in columns:
+            # Histories recorded before the parameters of the results
+            self.connection.execute(
+                "ALTER TABLE results ADD COLUMN parameters TEXT NOT NULL DEFAULT '{}'"
+            )
+
+    def baseline(
+        self,
+        run_id: int,
+        context: dict,
+        nodeid: str,
+        metric: str,
+        nb_runs: int,
+        parameters: Optional[dict] = None,
+    ) -> List[float]:
+        rows = self.connection.execute(
+            """
+            SELECT value FROM results
+            WHERE nodeid = ? AND metric = ? AND config_hash = ? AND versions = ?
+                AND parameters = ? AND run_id < ?
+            ORDER BY run_id DESC LIMIT ?
+            """,
+            (
+                nodeid,
+                metric,
+                context["config_hash"],
+                json.dumps(context["versions"], sort_keys=True),
+                json.dumps(parameters or {}, sort_keys=True),
+                run_id,
+                nb_runs,
+            ),
+        )
+        return [value for value, in rows]
+
+    def add_run(self, results: List[dict], nb_baseline_runs: int) -> List[Comparison]:
+        with self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (started) VALUES (?)", (time.time(),)
+            ).lastrowid
+            comparisons = []
+            for result in results:
+                context = result["context"]
+                parameters = result.get("parameters", {})
+                for metric in map(Metric._make, result["metrics"]):
+                    baseline = self.baseline(
+                        run_id,
+                        context,
+                        result["nodeid"],
+                        metric.name,
+                        nb_baseline_runs,
+                        parameters,
+                    )
+                    regression = compare(
+                        metric.value, baseline, metric.higher_is_better
+                    )
+                    comparisons.append(
+                        Comparison(
+                            result["nodeid"],
+                            metric,
+                            statistics.mean(baseline) if baseline else None,
+                            len(baseline),
+                            {None: "no baseline", False: "ok", True: "regression"}[
+                                regression
+                            ],
+                        )
+                    )
+                    self.connection.execute(
+                        """
+                        INSERT INTO results (
+                            run_id, config_hash, versions, nodeid, metric, value,
+                            unit, higher_is_better, parameters
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            run_id,
+                            context["config_hash"],
+                            json.dumps(context["versions"], sort_keys=True),
+                            result["nodeid"],
+                            *metric,
+                            json.dumps(parameters, sort_keys=True),
+                        ),
+                    )
+            regressions = [c for c in comparisons if c.verdict == "regression"]
+            self.connection.execute(
+                "UPDATE runs SET verdict = ? WHERE id = ?",
+                ("fail" if regressions else "pass", run_id),
+            )
+        return comparisons
+
+    def close(self):
+        self.connection.close()
@@ -1,23 +1,76 @@
 import contextlib
-import csv
-import functools
-import io
 import json
 import logging
-import re
+import os
+import shlex
+import shutil
 import tempfile
-import time
-from datetime import datetime
-from typing import Any, Callable, Dict, Generator, List, Optional
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, List, Optional, Union
+from urllib.parse import urlencode
 
 import pytest
 import testinfra
-from filelock import FileLock
 from testinfra.host import Host
 
+from .avatica import AvaticaConnectionPool
+from .benchmark import (
+    BENCHMARK_PROPERTY,
+    REPOSITORY_DIR,
+    Benchmark,
+    BenchmarkHistory,
+    Comparison,
+    Metric,
+    cluster_config_hash,
+    component_versions,
+)
+from .datasets import WEIGHT_SCHEMA, Dataset, stream_to_hdfs
+from .file_transfer import FileUploader
+from .hive_client import HiveSessionPool
+from .inventory_snapshot import load_inventory_snapshot
+from .http_client import HttpBatchError, HttpClient
+from .kerberos import CredentialCacheManager, KerberosError, kinit_tracker
+from .livy import LivySession
+from .prometheus import PROMETHEUS_PORT, WINDOW_PROPERTY, PrometheusClient
+from .prometheus import PrometheusError, RecordedPrometheus, TimeWindow, correlate
+from .prometheus import load_series
+from .prometheus import summary as prometheus_summary
+from .remote_agent import AgentHost, RemoteAgent, RemoteAgentError
+from .retrying import retry, sleep_tracker
+from .scheduling import (
+    RESOURCES_MARKER,
+    CapacityScheduling,
+    YarnCapacity,
+    check_xdist_version,
+    write_items_resources,
+)
+from .spark_layout import ExecutorLayout, ResourceManagerClient
+from .shared_state import SHARED_STATE_BACKENDS, shared_state_context
+from .stats import percentiles
+from .tracing import Tracer, new_trace_id, read_trace_file
+from .tracing import summary as trace_summary
+from .tracing import trace_host, traced_acquisition
+from .webhdfs import WebHdfsClient
+
 logger = logging.getLogger("testinfra")
 
-RE_CURL_HTTP_STATUS = re.compile("< HTTP/[^ ]+ ([^ ]+) ")
+RANGER_AUDITS_PAGE_SIZE = 100
+# 304 means that the plugin already has the latest policies
+RANGER_POLICIES_UP_TO_DATE_CODES = (200, 304)
+# The plugins pull the policies every 30s, two pulls are waited for
+RANGER_POLICIES_PULL_TIMEOUT = 60
+
+RETRY_SLEEPS_KEY = pytest.StashKey[Dict[str, float]]()
+KINIT_LATENCIES_KEY = pytest.StashKey[List[float]]()
+BENCHMARK_RESULTS_KEY = pytest.StashKey[List[dict]]()
+BENCHMARK_COMPARISONS_KEY = pytest.StashKey[List[Comparison]]()
+TRACER_KEY = pytest.StashKey[Tracer]()
+TEARDOWN_SPANS_KEY = pytest.StashKey[Dict[pytest.FixtureDef, dict]]()
+RESOURCES_DIR_KEY = pytest.StashKey[Path]()
+SCHEDULER_KEY = pytest.StashKey[CapacityScheduling]()
+PROMETHEUS_WINDOWS_KEY = pytest.StashKey[List[TimeWindow]]()
+PROMETHEUS_CORRELATIONS_KEY = pytest.StashKey[Dict[str, dict]]()
 
 USERS = [
     "tdp_user",
@@ -30,6 +83,426 @@ USERS_CREDS = {
 }
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup("tdp")
+    group.addoption(
+        "--lock-backend",
+        choices=sorted(SHARED_STATE_BACKENDS),
+        default="sqlite",
+        help="Storage of the state shared between xdist workers by the lock fixture",
+    )
+    group.addoption(
+        "--remote-agent",
+        action="store_true",
+        help="Run the commands through one long-lived agent per host and worker",
+    )
+    group.addoption(
+        "--dataset-rows",
+        type=int,
+        default=200,
+        help="Number of rows of the datasets shared by the tests",
+    )
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Record the metrics of the tests and compare them to the previous runs",
+    )
+    group.addoption(
+        "--benchmark-history",
+        default=str(REPOSITORY_DIR / ".benchmarks" / "history.sqlite"),
+        help="SQLite database of the benchmark results",
+    )
+    group.addoption(
+        "--benchmark-baseline-runs",
+        type=int,
+        default=10,
+        help="Number of previous runs the benchmark results are compared to",
+    )
+    group.addoption(
+        "--hbase-scan-sweep",
+        action="store_true",
+        help="Scan the HBase tables through the REST gateway with every batch size"
+        " and filter of the sweep",
+    )
+    group.addoption(
+        "--webhdfs-load-clients",
+        type=int,
+        help="Number of concurrent clients per user of the WebHDFS load test through"
+        " Knox and directly, which only runs when it is set",
+    )
+    group.addoption(
+        "--phoenix-load-concurrency",
+        type=int,
+        help="Number of concurrent queries of the Phoenix Query Server load test,"
+        " which only runs when it is set",
+    )
+    group.addoption(
+        "--hive-benchmark-scale",
+        type=float,
+        help="Scale factor of the star schema of the Hive benchmark, which only"
+        " runs when it is set (1 is 1M sales)",
+    )
+    group.addoption(
+        "--prometheus",
+        action="store_true",
+        help="Aggregate the Prometheus series over the time window of each test",
+    )
+    group.addoption(
+        "--prometheus-series",
+        help="JSON file of the PromQL queries by series name, instead of the"
+        " NameNode, RegionServer, HiveServer2 and GC series",
+    )
+    group.addoption(
+        "--prometheus-record",
+        help="Write the windows of the tests and the Prometheus responses to"
+        " this file",
+    )
+    group.addoption(
+        "--prometheus-replay",
+        help="Answer the Prometheus queries with the responses of a file written"
+        " with --prometheus-record",
+    )
+    group.addoption(
+        "--trace-output",
+        help="File the spans of the session are appended to as OTLP JSON lines",
+    )
+    group.addoption(
+        "--trace-endpoint",
+        help="OTLP/HTTP URL the spans are sent to, e.g. the collector started by"
+        " python -m tests.tracing collector",
+    )
+    group.addoption(
+        "--trace-top",
+        type=int,
+        default=10,
+        help="Number of spans listed in the trace summary",
+    )
+    group.addoption(
+        "--capacity-scheduling",
+        action="store_true",
+        help="Only run the xdist tests marked with the YARN resources they need"
+        " when the capacity read from the ResourceManager allows it",
+    )
+
+
+def pytest_configure(config: pytest.Config):
+    config.addinivalue_line(
+        "markers",
+        f"{RESOURCES_MARKER}(vcores=0, memory=0, services=()): YARN vcores and"
+        " memory in MB used by the test, and services it must not share with"
+        " another test, see --capacity-scheduling",
+    )
+    config.pluginmanager.register(ReportCollector(config), "tdp_report_collector")
+    if config.option.connection == "ansible":
+        load_inventory_snapshot(config)
+    if config.getoption("capacity_scheduling") and not hasattr(config, "workerinput"):
+        check_xdist_version()
+        config.stash[RESOURCES_DIR_KEY] = Path(
+            tempfile.mkdtemp(prefix="pytest-resources-")
+        )
+    if not config.getoption("trace_output") and not config.getoption("trace_endpoint"):
+        return
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is None:
+        trace_output = config.getoption("trace_output")
+        if trace_output and os.path.exists(trace_output):
+            os.remove(trace_output)
+        config.stash[TRACER_KEY] = Tracer(new_trace_id(), "master")
+    else:
+        config.stash[TRACER_KEY] = Tracer(
+            workerinput["trace_id"], workerinput["workerid"]
+        )
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    # Every xdist worker adds its spans to the trace of the controller
+    tracer = node.config.stash.get(TRACER_KEY, None)
+    if tracer is not None:
+        node.workerinput["trace_id"] = tracer.trace_id
+    resources_dir = node.config.stash.get(RESOURCES_DIR_KEY, None)
+    if resources_dir is not None:
+        node.workerinput["resources_dir"] = str(resources_dir)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config: pytest.Config, log):
+    resources_dir = config.stash.get(RESOURCES_DIR_KEY, None)
+    if resources_dir is None or config.getvalue("dist") != "load":
+        return None
+    scheduler = CapacityScheduling(config, log, resources_dir)
+    edge = testinfra.get_host("edge", **testinfra_host_options(config))
+    rm_urls = [f"https://{rm}:8090" for rm in edge.backend.get_hosts("yarn_rm")]
+    scheduler.capacity = YarnCapacity(
+        edge,
+        rm_urls,
+        USERS[0],
+        edge.ansible.get_variables()["realm"],
+        scheduler.in_use,
+    )
+    scheduler.capacity.start()
+    config.stash[SCHEDULER_KEY] = scheduler
+    return scheduler
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: List[pytest.Item]):
+    # The controller schedules the tests but only the workers collect them
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is not None and "resources_dir" in workerinput:
+        write_items_resources(
+            items,
+            Path(workerinput["resources_dir"]) / f"{workerinput['workerid']}.json",
+        )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item: pytest.Item):
+    tracer = item.config.stash.get(TRACER_KEY, None)
+    if tracer is None:
+        yield
+        return
+    tracer.component = item.module.__name__.rsplit(".", 1)[-1].replace("test_", "", 1)
+    with tracer.span(item.nodeid, test=item.nodeid):
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef: pytest.FixtureDef, request: pytest.FixtureRequest):
+    tracer = request.config.stash.get(TRACER_KEY, None)
+    if tracer is None:
+        yield
+        return
+    with tracer.span(
+        f"setup {fixturedef.argname}",
+        fixture=fixturedef.argname,
+        scope=fixturedef.scope,
+    ):
+        yield
+    teardown_spans = request.config.stash.setdefault(TEARDOWN_SPANS_KEY, {})
+
+    def start_teardown():
+        teardown_spans[fixturedef] = tracer.start(
+            f"teardown {fixturedef.argname}",
+            fixture=fixturedef.argname,
+            scope=fixturedef.scope,
+        )
+
+    # Runs before the teardown of the fixture, finalizers are run in the
+    # reverse order
+    fixturedef.addfinalizer(start_teardown)
+
+
+def pytest_fixture_post_finalizer(
+    fixturedef: pytest.FixtureDef, request: pytest.FixtureRequest
+):
+    tracer = request.config.stash.get(TRACER_KEY, None)
+    teardown_spans = request.config.stash.get(TEARDOWN_SPANS_KEY, {})
+    if tracer is not None and fixturedef in teardown_spans:
+        tracer.end(teardown_spans.pop(fixturedef))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item: pytest.Item, call: pytest.CallInfo):
+    outcome = yield
+    report = outcome.get_result()
+    # user_properties are sent back to the controller by xdist workers
+    retry_sleep = sleep_tracker.pop()
+    if retry_sleep:
+        report.user_properties.append(("retry_sleep", retry_sleep))
+    kinit_latencies = kinit_tracker.pop()
+    if kinit_latencies:
+        report.user_properties.append(("kinit_latency", kinit_latencies))
+    if call.when == "call" and prometheus_enabled(item.config):
+        report.user_properties.append((WINDOW_PROPERTY, (call.start, call.stop)))
+
+
+class ReportCollector:
+    """Keep the values sent by the tests in their user_properties.
+
+    Registered as a plugin since `pytest.TestReport` has no reference to the
+    config whose stash holds them.
+    """
+
+    def __init__(self, config: pytest.Config):
+        self.config = config
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport):
+        retry_sleep = sum(
+            value for name, value in report.user_properties if name == "retry_sleep"
+        )
+        if retry_sleep:
+            retry_sleeps = self.config.stash.setdefault(RETRY_SLEEPS_KEY, {})
+            retry_sleeps[report.nodeid] = (
+                retry_sleeps.get(report.nodeid, 0) + retry_sleep
+            )
+        kinit_latencies = self.config.stash.setdefault(KINIT_LATENCIES_KEY, [])
+        for name, value in report.user_properties:
+            if name == "kinit_latency":
+                kinit_latencies.extend(value)
+            elif name == WINDOW_PROPERTY:
+                self.config.stash.setdefault(PROMETHEUS_WINDOWS_KEY, []).append(
+                    TimeWindow(report.nodeid, *value)
+                )
+        if report.when != "call" or not report.passed:
+            return
+        for name, value in report.user_properties:
+            if name == BENCHMARK_PROPERTY:
+                metrics = [tuple(Metric("wall_time", report.duration, "s"))]
+                self.config.stash.setdefault(BENCHMARK_RESULTS_KEY, []).append(
+                    {
+                        "nodeid": report.nodeid,
+                        "context": value["context"],
+                        "metrics": metrics + value["metrics"],
+                        "parameters": value["parameters"],
+                    }
+                )
+
+
+def pytest_sessionfinish(session: pytest.Session):
+    scheduler = session.config.stash.get(SCHEDULER_KEY, None)
+    if scheduler is not None:
+        scheduler.capacity.close()
+    tracer = session.config.stash.get(TRACER_KEY, None)
+    if tracer is not None and tracer.spans:
+        tracer.export(
+            session.config.getoption("trace_output"),
+            session.config.getoption("trace_endpoint"),
+        )
+    # The results of the xdist workers are compared once by the controller
+    if hasattr(session.config, "workerinput"):
+        return
+    windows = session.config.stash.get(PROMETHEUS_WINDOWS_KEY, [])
+    if windows:
+        correlate_prometheus(session.config, windows)
+    results = session.config.stash.get(BENCHMARK_RESULTS_KEY, [])
+    if not results:
+        return
+    history = BenchmarkHistory(Path(session.config.getoption("benchmark_history")))
+    try:
+        comparisons = history.add_run(
+            results, session.config.getoption("benchmark_baseline_runs")
+        )
+    finally:
+        history.close()
+    session.config.stash[BENCHMARK_COMPARISONS_KEY] = comparisons
+    if any(comparison.verdict == "regression" for comparison in comparisons):
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_unconfigure(config: pytest.Config):
+    resources_dir = config.stash.get(RESOURCES_DIR_KEY, None)
+    if resources_dir is not None:
+        shutil.rmtree(resources_dir, ignore_errors=True)
+
+
+def pytest_terminal_summary(terminalreporter, config: pytest.Config):
+    scheduler = config.stash.get(SCHEDULER_KEY, None)
+    if scheduler is not None:
+        terminalreporter.section("capacity scheduling")
+        for line in scheduler.summary():
+            terminalreporter.write_line(line)
+    trace_output = config.getoption("trace_output")
+    if trace_output and os.path.exists(trace_output):
+        terminalreporter.section("trace")
+        for line in trace_summary(
+            read_trace_file(trace_output), config.getoption("trace_top")
+        ):
+            terminalreporter.write_line(line)
+    comparisons = config.stash.get(BENCHMARK_COMPARISONS_KEY, [])
+    if comparisons:
+        terminalreporter.section("benchmark")
+        for comparison in comparisons:
+            metric = comparison.metric
+            baseline = (
+                f"{comparison.baseline_mean:.3f}"
+                if comparison.baseline_mean is not None
+                else "-"
+            )
+            terminalreporter.write_line(
+                f"{comparison.verdict:<12} {metric.value:12.3f} {baseline:>12}"
+                f" {metric.unit:<8} {comparison.nodeid} {metric.name}"
+                f" ({comparison.nb_baseline_runs} runs)"
+            )
+        regressions = [c for c in comparisons if c.verdict == "regression"]
+        terminalreporter.write_line(
+            f"benchmark verdict: {'fail' if regressions else 'pass'},"
+            f" {len(regressions)} regression(s) out of {len(comparisons)} metrics"
+        )
+    correlations = config.stash.get(PROMETHEUS_CORRELATIONS_KEY, {})
+    if correlations:
+        terminalreporter.section("prometheus")
+        for line in prometheus_summary(correlations):
+            terminalreporter.write_line(line)
+    kinit_latencies = config.stash.get(KINIT_LATENCIES_KEY, [])
+    if kinit_latencies:
+        terminalreporter.section("kerberos tickets")
+        latencies = ", ".join(
+            f"{name} {value:.2f}s"
+            for name, value in percentiles(kinit_latencies).items()
+        )
+        terminalreporter.write_line(
+            f"{len(kinit_latencies)} tickets acquired with kinit, {latencies}"
+        )
+    retry_sleeps = config.stash.get(RETRY_SLEEPS_KEY, {})
+    if not retry_sleeps:
+        return
+    terminalreporter.section("retry sleep time")
+    terminalreporter.write_line(
+        f"{sum(retry_sleeps.values()):.1f}s spent sleeping between retries"
+    )
+    slowest = sorted(retry_sleeps.items(), key=lambda item: item[1], reverse=True)
+    for nodeid, retry_sleep in slowest[:10]:
+        terminalreporter.write_line(f"{retry_sleep:8.1f}s {nodeid}")
+
+
+def prometheus_enabled(config: pytest.Config) -> bool:
+    return bool(config.getoption("prometheus") or config.getoption("prometheus_replay"))
+
+
+def prometheus_source(
+    config: pytest.Config,
+) -> Union[PrometheusClient, RecordedPrometheus]:
+    replay = config.getoption("prometheus_replay")
+    if replay:
+        return RecordedPrometheus(replay)
+    edge = testinfra.get_host("edge", **testinfra_host_options(config))
+    prometheus_hosts = edge.backend.get_hosts("prometheus")
+    if not prometheus_hosts:
+        raise PrometheusError("No host in the prometheus group of the inventory")
+    return PrometheusClient(edge, f"https://{prometheus_hosts[0]}:{PROMETHEUS_PORT}")
+
+
+def correlate_prometheus(config: pytest.Config, windows: List[TimeWindow]):
+    try:
+        records = prometheus_source(config).query_windows(
+            windows, load_series(config.getoption("prometheus_series"))
+        )
+    except (PrometheusError, HttpBatchError) as error:
+        # The results of the tests do not depend on it
+        logger.warning("Prometheus could not be queried: %s", error)
+        return
+    correlations = correlate(records)
+    record_path = config.getoption("prometheus_record")
+    if record_path:
+        for record in records:
+            record["aggregates"] = correlations[record["nodeid"]]
+        with open(record_path, "w") as record_file:
+            json.dump(records, record_file, indent=2)
+    config.stash[PROMETHEUS_CORRELATIONS_KEY] = correlations
+
+
+def testinfra_host_options(config: pytest.Config) -> Dict[str, Any]:
+    return {
+        "connection": config.option.connection,
+        "ssh_config": config.option.ssh_config,
+        "ssh_identity_file": config.option.ssh_identity_file,
+        "sudo": config.option.sudo,
+        "sudo_user": config.option.sudo_user,
+        "ansible_inventory": config.option.ansible_inventory,
+        "force_ansible": config.option.force_ansible,
+    }
+
+
 # Based on testinfra.plugin.pytest_generate_tests
 # Enables to have a "host" fixture with a"session" scope
 def pytest_generate_tests(metafunc):
@@ -40,16 +513,7 @@ def pytest_generate_tests(metafunc):
             hosts = metafunc.module.testinfra_hosts
         else:
             hosts = [None]
-        params = testinfra.get_hosts(
-            hosts,
-            connection=metafunc.config.option.connection,
-            ssh_config=metafunc.config.option.ssh_config,
-            ssh_identity_file=metafunc.config.option.ssh_identity_file,
-            sudo=metafunc.config.option.sudo,
-            sudo_user=metafunc.config.option.sudo_user,
-            ansible_inventory=metafunc.config.option.ansible_inventory,
-            force_ansible=metafunc.config.option.force_ansible,
-        )
+        params = testinfra.get_hosts(hosts, **testinfra_host_options(metafunc.config))
         params = sorted(params, key=lambda x: x.backend.get_pytest_id())
         ids = [e.backend.get_pytest_id() for e in params]
         metafunc.parametrize(
@@ -63,32 +527,51 @@ def _testinfra_host_custom(request):
 
 
 @pytest.fixture(scope="session")
-def host(_testinfra_host_custom):
-    return _testinfra_host_custom
+def host(request: Any, _testinfra_host_custom: Host) -> Generator[Host, None, None]:
+    tracer = request.config.stash.get(TRACER_KEY, None)
+    if not request.config.getoption("remote_agent"):
+        if tracer is not None:
+            trace_host(tracer, _testinfra_host_custom)
+        yield _testinfra_host_custom
+        return
+    agent = RemoteAgent(_testinfra_host_custom)
+    agent_host = AgentHost(_testinfra_host_custom, agent)
+    if tracer is not None:
+        trace_host(tracer, agent_host)
+    yield agent_host
+    agent.close()
 
 
-def retry(
-    func: Optional[Callable] = None,
-    nb_retries: int = 6,
-    sleep_time_between_tries: int = 10,
-):
-    if func is None:
-        return functools.partial(
-            retry,
-            nb_retries=nb_retries,
-            sleep_time_between_tries=sleep_time_between_tries,
+@pytest.fixture(scope="session")
+def benchmark_context(host: Host) -> dict:
+    return {
+        "config_hash": cluster_config_hash(),
+        "versions": component_versions(host),
+    }
+
+
+@pytest.fixture
+def benchmark(request: pytest.FixtureRequest, host: Host) -> Benchmark:
+    benchmark = Benchmark()
+    if request.config.getoption("benchmark"):
+        request.node.user_properties.append(
+            (
+                BENCHMARK_PROPERTY,
+                {
+                    "context": request.getfixturevalue("benchmark_context"),
+                    "metrics": benchmark.metrics,
+                    "parameters": benchmark.parameters,
+                },
+            )
         )
+    return benchmark
 
-    @functools.wraps(func)
-    def retry_func(*args, **kwargs):
-        for i in range(nb_retries - 1):
-            try:
-                return func(*args, **kwargs)
-            except:
-                time.sleep(sleep_time_between_tries)
-        return func(*args, **kwargs)
 
-    return retry_func
+@pytest.fixture(autouse=True)
+def benchmark_all_tests(request: pytest.FixtureRequest):
+    # The benchmark context is read from the host of the test
+    if request.config.getoption("benchmark") and "host" in request.fixturenames:
+        request.getfixturevalue("benchmark")
 
 
 @pytest.fixture(scope="session")
@@ -103,7 +586,7 @@ def domain(host: Host) -> str:
 
 # https://github.com/pytest-dev/pytest-xdist/tree/v2.4.0#making-session-scoped-fixtures-execute-only-once
 @pytest.fixture(scope="session")
-def lock(tmp_path_factory, worker_id: str):
+def shared_lock(request: Any, tmp_path_factory, worker_id: str):
     no_lock_data = {}
 
     # Mode séquentiel
@@ -113,68 +596,63 @@ def lock(tmp_path_factory, worker_id: str):
     def no_lock_context(namespace: str, teardown: bool = False):
         yield no_lock_data.setdefault(namespace, {"last_worker": True})
 
+    if worker_id == "master":
+        return no_lock_context
+
     # Mode parallèle
     # Les variables à sauvegarder et à partager entre les workers
-    # sont sauvegardés sur un emplacement partagé entre les workers
-    # avec un format JSON et un lock
-    @contextlib.contextmanager
+    # sont sauvegardées dans un backend partagé entre les workers
+    # (voir l'option "--lock-backend") avec un lock par namespace
+    # get the temp directory shared by all workers
+    root_tmp_dir = tmp_path_factory.getbasetemp().parent
+    backend_name = request.config.getoption("lock_backend")
+    backend = SHARED_STATE_BACKENDS[backend_name](str(root_tmp_dir))
+
     def lock_context(namespace: str, teardown: bool = False):
-        data = {}
-        # get the temp directory shared by all workers
-        root_tmp_dir = tmp_path_factory.getbasetemp().parent
-        fn = f"{root_tmp_dir}/{namespace}.json"
-        with FileLock(f"{fn}.lock"):
-            try:
-                with open(fn, "r") as fd:
-                    data = json.load(fd)
-            except:
-                pass
-
-            if teardown:
-                workers = data.setdefault("workers", {})
-                if worker_id in workers:
-                    del workers[worker_id]
-                data.setdefault("workers_teardown", []).append(worker_id)
-            else:
-                # Un "set" n'est pas serializable en json donc
-                # utilisation d'un "dict" à la place
-                data.setdefault("workers", {})[worker_id] = True
-                data.setdefault("workers_used", []).append(worker_id)
-
-            data["last_worker"] = not data["workers"]
-            if data["last_worker"]:
-                data.setdefault("workers_last", []).append(worker_id)
-            yield data
-            with open(fn, "w") as fd:
-                json.dump(data, fd)
+        return shared_state_context(backend, namespace, worker_id, teardown)
 
-    if worker_id == "master":
-        return no_lock_context
     return lock_context
 
 
+@pytest.fixture(scope="session")
+def lock(request: Any, shared_lock: Callable) -> Callable:
+    tracer = request.config.stash.get(TRACER_KEY, None)
+    if tracer is None:
+        return shared_lock
+
+    def traced_lock(namespace: str, teardown: bool = False):
+        return traced_acquisition(
+            tracer,
+            f"lock {namespace}",
+            shared_lock(namespace, teardown),
+            namespace=namespace,
+        )
+
+    return traced_lock
+
+
+@pytest.fixture(scope="session")
+def kerberos(
+    host: Host, realm: str, lock: Callable
+) -> Generator[CredentialCacheManager, None, None]:
+    manager = CredentialCacheManager(host, realm, lock)
+    yield manager
+    manager.close()
+
+
 @pytest.fixture(scope="session")
 def users() -> List[str]:
     return USERS
 
 
 @pytest.fixture(scope="session", params=USERS)
-def user(
-    host: Host, request: Any, realm: str, lock: Callable
-) -> Generator[str, None, None]:
+def user(request: Any, kerberos: CredentialCacheManager) -> str:
     user: str = request.param
-    with lock(f"user_{user}"):
-        with host.sudo(user):
-            kinit_cmd = host.run(f"kinit -kt /home/{user}/{user}.keytab {user}@{realm}")
-            if kinit_cmd.rc != 0:
-                pytest.fail(kinit_cmd.stderr)
-
-    yield user
-    with lock(f"user_{user}", teardown=True) as data:
-        if not data["last_worker"]:
-            return
-        with host.sudo(user):
-            host.run("kdestroy")
+    try:
+        kerberos.acquire(user)
+    except (KerberosError, RemoteAgentError) as error:
+        pytest.fail(str(error))
+    return user
 
 
 @pytest.fixture(scope="session")
@@ -214,54 +692,107 @@ def phoenix_queryserver(host: Host, domain: str) -> str:
 
 
 @pytest.fixture(scope="session")
-def upload_file(
-    host: Host,
-    lock: Callable,
-) -> Generator[
-    Callable[[str, str, Optional[str], Optional[str], Optional[int]], None], None, None
-]:
-    def scp_func(
-        local_file: str,
-        distant_file: str,
-        owner: Optional[str] = None,
-        group: Optional[str] = None,
-        permissions: Optional[int] = None,
+def phoenix_avatica(
+    request: pytest.FixtureRequest, host: Host, phoenix_queryserver: str
+) -> Generator[AvaticaConnectionPool, None, None]:
+    concurrency = request.config.getoption("phoenix_load_concurrency") or 0
+    pool = AvaticaConnectionPool(
+        host, phoenix_queryserver, max_connections=max(2, concurrency)
+    )
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="session")
+def livy_server(host: Host) -> str:
+    return f"https://{host.backend.get_hosts('livy_spark3_server')[0]}:8999"
+
+
+@pytest.fixture(scope="session")
+def resource_manager(
+    host: Host, http_client: HttpClient, user: str
+) -> ResourceManagerClient:
+    return ResourceManagerClient(
+        http_client,
+        user,
+        [f"https://{rm}:8090" for rm in host.backend.get_hosts("yarn_rm")],
+    )
+
+
+@pytest.fixture(scope="session")
+def executor_layout(
+    resource_manager: ResourceManagerClient,
+) -> Callable[[Optional[int]], ExecutorLayout]:
+    # Layout fitting in the capacity of YARN when the job is submitted and in
+    # JOB_RESOURCES, for a dataset of the given size
+    def executor_layout_func(dataset_bytes: Optional[int] = None) -> ExecutorLayout:
+        return resource_manager.executor_layout(dataset_bytes)
+
+    return executor_layout_func
+
+
+@pytest.fixture
+def record_executor_layout(
+    request: pytest.FixtureRequest, benchmark: Benchmark
+) -> Callable[[ExecutorLayout, Optional[int]], None]:
+    def record_executor_layout_func(
+        layout: ExecutorLayout, parallelism: Optional[int] = None
     ):
-        with lock("upload_file") as data:
-            if distant_file in data.setdefault("uploaded_files", []):
-                return
-            add_opts = []
+        request.node.user_properties.append(("executor_layout", layout._asdict()))
+        benchmark.parameters.update(layout._asdict())
+        if parallelism is not None:
+            request.node.user_properties.append(("parallelism", parallelism))
+            benchmark.record("parallelism", parallelism, "tasks", True)
+
+    return record_executor_layout_func
 
-            if owner:
-                add_opts += [f"owner={owner}"]
-            if group:
-                add_opts += [f"group={group}"]
-            if permissions:
-                add_opts += [f"mode={permissions:o}"]
-            result = host.ansible(
-                "copy",
-                f"src={local_file} dest={distant_file} {' '.join(add_opts)}",
-                check=False,
-            )
-            data["uploaded_files"].append(distant_file)
-            assert "state" in result, result["msg"]
 
-    yield scp_func
+@pytest.fixture(scope="session")
+def livy(
+    http_client: HttpClient,
+    user: str,
+    lock: Callable,
+    livy_server: str,
+    executor_layout: Callable[[Optional[int]], ExecutorLayout],
+) -> Generator[LivySession, None, None]:
+    # A single Livy session per user, shared by every worker
+    with lock(f"livy_{user}") as data:
+        session = LivySession(http_client, user, livy_server, data.get("session_id"))
+        if session.is_alive():
+            session.layout = ExecutorLayout(*data["layout"])
+        else:
+            session.layout = executor_layout()
+            # The executors are released while the session waits for the
+            # statements of the other tests
+            session.start(session.layout.livy_conf(dynamic_allocation=True))
+            data["session_id"] = session.session_id
+            data["layout"] = list(session.layout)
+    yield session
+    with lock(f"livy_{user}", teardown=True) as data:
+        if not data["last_worker"]:
+            return
+        session.close()
+        data.pop("session_id", None)
+
+
+@pytest.fixture(scope="session")
+def upload_file(
+    host: Host,
+    lock: Callable,
+) -> Generator[FileUploader, None, None]:
+    uploader = FileUploader(host, lock)
+    yield uploader
     with lock("upload_file", teardown=True) as data:
         if not data["last_worker"]:
             return
-        uploaded_files = data.get("uploaded_files", [])
-        for uploaded_file in uploaded_files[:]:
-            host.ansible("file", f"state=absent path={uploaded_file}", check=False)
-            uploaded_files.remove(uploaded_file)
+        uploaded_files = data.get("uploaded_files", {})
+        uploader.remove_all(list(uploaded_files))
+        uploaded_files.clear()
 
 
 @pytest.fixture(scope="session")
 def render_file(
-    lock: Callable,
-    upload_file: Callable[
-        [str, str, Optional[str], Optional[str], Optional[int]], None
-    ],
+    upload_file: FileUploader,
 ) -> Callable[[str, str, Optional[Dict[str, str]]], None]:
     def render_func(
         distant_path: str,
@@ -270,50 +801,54 @@ def render_file(
         *args,
         **kwargs,
     ):
-        with lock("render_file"):
-            if render_variables is None:
-                rendered_content = content
-            else:
-                rendered_content = content.format(**render_variables)
-
-            with tempfile.NamedTemporaryFile() as file_descriptor:
-                file_descriptor.write(bytes(rendered_content, "utf-8"))
-                file_descriptor.flush()
-                upload_file(file_descriptor.name, distant_path, *args, **kwargs)
+        if render_variables is None:
+            rendered_content = content
+        else:
+            rendered_content = content.format(**render_variables)
+        upload_file.upload_content(
+            bytes(rendered_content, "utf-8"), distant_path, *args, **kwargs
+        )
 
+    # Files rendered inside "with render_file.batch():" are sent at once
+    render_func.batch = upload_file.batch
     return render_func
 
 
+@pytest.fixture(scope="session")
+def webhdfs(http_client: HttpClient, user: str, webhdfs_gateway: str) -> WebHdfsClient:
+    return WebHdfsClient(http_client, user, webhdfs_gateway)
+
+
 @pytest.fixture(scope="session")
 def hdfs_dir(
-    host: Host,
     user: str,
     lock: Callable,
+    webhdfs: WebHdfsClient,
 ) -> Generator[Callable[[str], None], None, None]:
     def hdfs_dir_func(distant_hdfs_path: str):
         with lock(f"hdfs_dir_{user}") as data:
             if distant_hdfs_path in data.setdefault("hdfs_dirs", []):
                 return
-            with host.sudo(user):
-                host.check_output(f"hdfs dfs -mkdir '{distant_hdfs_path}'")
-                data["hdfs_dirs"].append(distant_hdfs_path)
+            webhdfs.batch().mkdirs(distant_hdfs_path).execute()
+            data["hdfs_dirs"].append(distant_hdfs_path)
 
     yield hdfs_dir_func
     with lock(f"hdfs_dir_{user}", teardown=True) as data:
         if not data["last_worker"]:
             return
-        with host.sudo(user):
-            hdfs_dirs = data.get("hdfs_dirs", [])
-            for hdfs_dir in reversed(hdfs_dirs[:]):
-                host.check_output(f"hdfs dfs -rm -r -f {hdfs_dir}")
-                hdfs_dirs.remove(hdfs_dir)
+        hdfs_dirs = data.get("hdfs_dirs", [])
+        batch = webhdfs.batch()
+        for hdfs_dir in reversed(hdfs_dirs):
+            batch.delete(hdfs_dir, recursive=True)
+        batch.execute()
+        hdfs_dirs.clear()
 
 
 @pytest.fixture(scope="session")
 def render_hdfs_file(
-    host: Host,
     user: str,
     lock: Callable,
+    webhdfs: WebHdfsClient,
     render_file: Callable[[str, str, Optional[Dict[str, str]]], None],
 ) -> Generator[
     Callable[
@@ -354,118 +889,264 @@ def render_hdfs_file(
         with lock(f"render_hdfs_file_{user}") as data:
             if distant_hdfs_path in data.setdefault("rendered_hdfs_files", []):
                 return
-            with host.sudo(user):
-                host.check_output(
-                    f"hdfs dfs -put '{distant_path}' '{distant_hdfs_path}'"
-                )
-                data["rendered_hdfs_files"].append(distant_hdfs_path)
-                if owner:
-                    host.check_output(
-                        f"hdfs dfs -chown '{owner}' '{distant_hdfs_path}'"
-                    )
-                if group:
-                    host.check_output(
-                        f"hdfs dfs -chgrp '{group}' '{distant_hdfs_path}'"
-                    )
-                if permissions:
-                    host.check_output(
-                        f"hdfs dfs -chmod '{permissions:0}' '{distant_hdfs_path}'"
-                    )
+            # create, chown and chmod are sent over a single connection
+            batch = webhdfs.batch().create(distant_hdfs_path, distant_path)
+            batch.set_owner(distant_hdfs_path, owner, group)
+            if permissions:
+                batch.set_permission(distant_hdfs_path, permissions)
+            batch.execute()
+            data["rendered_hdfs_files"].append(distant_hdfs_path)
 
     yield render_hdfs_func
     with lock(f"render_hdfs_file_{user}", teardown=True) as data:
         if not data["last_worker"]:
             return
-        with host.sudo(user):
-            rendered_hdfs_files = data.get("rendered_hdfs_files", [])
-            for hdfs_file in rendered_hdfs_files[:]:
-                host.check_output(f"hdfs dfs -rm -f {hdfs_file}")
-                rendered_hdfs_files.remove(hdfs_file)
-
-
-@pytest.fixture(scope="session")
-def dataset_weight() -> List[dict]:
-    nb_lines = 200
-    categories = ("sportscar", "truck", "berline")
-    dataset = [
-        {
-            "id": i,
-            "weight": i / 10 + 50,
-            "category": categories[i % len(categories)],
+        rendered_hdfs_files = data.get("rendered_hdfs_files", [])
+        batch = webhdfs.batch()
+        for hdfs_file in rendered_hdfs_files:
+            batch.delete(hdfs_file)
+        batch.execute()
+        rendered_hdfs_files.clear()
+
+
+@pytest.fixture(scope="session")
+def hive(host: Host) -> Generator[HiveSessionPool, None, None]:
+    pool = HiveSessionPool(host)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="session")
+def dataset_weight(request: pytest.FixtureRequest) -> Dataset:
+    return Dataset("weight", WEIGHT_SCHEMA, request.config.getoption("--dataset-rows"))
+
+
+@pytest.fixture(scope="session")
+def hdfs_dataset(
+    host: Host,
+    user: str,
+    lock: Callable,
+    hdfs_dir: Callable[[str], None],
+    webhdfs: WebHdfsClient,
+) -> Callable[[Dataset, str], dict]:
+    def hdfs_dataset_func(dataset: Dataset, dataset_format: str = "csv") -> dict:
+        dataset_dir = f"datasets/{dataset.name}_{len(dataset)}_{dataset_format}"
+        dataset_hdfs_path = f"{dataset_dir}/part-00000.{dataset_format}"
+        with lock(f"hdfs_dataset_{user}") as data:
+            if dataset_dir not in data.setdefault("hdfs_datasets", []):
+                hdfs_dir(dataset_dir)
+                stream_to_hdfs(host, user, dataset, dataset_hdfs_path, dataset_format)
+                file_status = webhdfs.get_file_status(dataset_hdfs_path)
+                if file_status is None:
+                    pytest.fail(f"{dataset_hdfs_path} is missing after its upload")
+                data["hdfs_datasets"].append(dataset_dir)
+                data.setdefault("sizes", {})[dataset_dir] = file_status["length"]
+            size = data["sizes"][dataset_dir]
+        return {
+            "hdfs_dir": dataset_dir,
+            "hdfs_path": dataset_hdfs_path,
+            "nb_lines": len(dataset),
+            "format": dataset_format,
+            "size": size,
         }
-        for i in range(nb_lines)
-    ]
-    return dataset
+
+    return hdfs_dataset_func
 
 
 @pytest.fixture(scope="session")
 def dataset_weight_csv(
-    dataset_weight: List[dict],
-    hdfs_dir: Callable[[str], None],
-    render_hdfs_file: Callable[[str, str], None],
+    dataset_weight: Dataset,
+    hdfs_dataset: Callable[[Dataset, str], dict],
 ) -> dict:
-    dataset_dir = "dataset_csv"
-    dataset_file = "weight.csv"
-    dataset_hdfs_path = f"{dataset_dir}/{dataset_file}"
-    nb_lines = len(dataset_weight)
-    hdfs_dir(dataset_dir)
+    return hdfs_dataset(dataset_weight, "csv")
 
-    with io.StringIO(newline="") as string_buffer:
-        fieldnames = dataset_weight[0].keys() if len(dataset_weight) > 0 else []
-        writer = csv.DictWriter(string_buffer, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(dataset_weight)
-        dataset_content = string_buffer.getvalue()
 
-    render_hdfs_file(dataset_hdfs_path, dataset_content)
-
-    return {
-        "hdfs_dir": dataset_dir,
-        "hdfs_path": dataset_hdfs_path,
-        "nb_lines": nb_lines,
-    }
+@pytest.fixture(scope="session")
+def http_client(host: Host, worker_id: str) -> Generator[HttpClient, None, None]:
+    client = HttpClient(host, f"/tmp/pytest_curl_cookies_{worker_id}")
+    yield client
+    client.close()
 
 
 @pytest.fixture(scope="session")
 def curl(
-    host: Host,
+    request: pytest.FixtureRequest,
+    http_client: HttpClient,
 ) -> Callable:
+    tracer = request.config.stash.get(TRACER_KEY, None)
+
+    def request_func(curl_args: str) -> dict:
+        if tracer is None:
+            return http_client.request(curl_args)
+        backend = http_client.host.backend
+        user = getattr(http_client.host, "sudo_user", None) or backend.sudo_user
+        with tracer.span("curl", user=user) as attributes:
+            curl_result = http_client.request(curl_args)
+            attributes["url"] = curl_result["url"]
+            attributes["http_status"] = curl_result["http_status"]
+            return curl_result
+
     def curl_func(
         curl_args: str,
         check_status_code: bool = True,
     ) -> dict:
-        curl_cmd = "curl --verbose --insecure"
-        curl_result = host.run_expect([0], f"{curl_cmd} {curl_args}")
-
-        match = RE_CURL_HTTP_STATUS.findall(curl_result.stderr)
-        if match:
-            http_status = int(match[-1])
-
-            if check_status_code and http_status >= 400:
-                pytest.fail(f"Erreur curl http status {http_status}\n{curl_result}")
-            return {
-                "command": curl_result,
-                "http_status": http_status,
-            }
-        else:
-            pytest.fail(f"HTTP status non trouvé\n{curl_result}")
-        return {}
+        curl_result = request_func(curl_args)
+        if curl_result["command"].rc != 0 or not curl_result["http_status"]:
+            pytest.fail(f"HTTP status non trouvé\n{curl_result['command']}")
+        http_status = curl_result["http_status"]
+        if check_status_code and http_status >= 400:
+            pytest.fail(
+                f"Erreur curl http status {http_status}\n{curl_result['command']}"
+            )
+        return curl_result
 
     return curl_func
 
 
+def parse_ranger_date(date: str) -> datetime:
+    return datetime.strptime(date, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
 @pytest.fixture(scope="session")
-def ranger_policy(
+def ranger_policies(
+    http_client: HttpClient,
     lock: Callable,
-    curl: Callable,
     ranger_manager: Dict[str, str],
-) -> Generator[Callable[[str, str, dict, List[dict], int], None], None, None]:
+) -> Generator[Callable[[List[dict]], None], None, None]:
     ranger_url = ranger_manager["url"]
     ranger_policy_url = f"{ranger_url}/service/public/v2/api/policy"
-    ranger_audits_url = f"{ranger_url}/service/assets/exportAudit?pageSize=10&sortBy=createDate&sortType=desc"
+    ranger_audits_url = f"{ranger_url}/service/assets/exportAudit"
     ranger_creds = ranger_manager["auth_creds"]
-    curl_args = f"--user '{ranger_creds}' -H 'Accept: application/json'"
+    curl_args = f"--user '{ranger_creds}' --header 'Accept: application/json'"
+
+    def count_plugins_pulled(
+        service: str, created_time: datetime, minimum_policy_pulled: int
+    ) -> int:
+        # Plugins, with the time they last downloaded the policies of the
+        # service, since the last policy of the service was created
+        plugins = {}
+        start_index = 0
+        # Audit dates are truncated to the second
+        created_time = created_time.replace(microsecond=0)
+        while len(plugins) < minimum_policy_pulled:
+            query = urlencode(
+                {
+                    "pageSize": RANGER_AUDITS_PAGE_SIZE,
+                    "startIndex": start_index,
+                    "sortBy": "createDate",
+                    "sortType": "desc",
+                    "repository": service,
+                }
+            )
+            response = http_client.batch([f"{curl_args} '{ranger_audits_url}?{query}'"])
+            result = json.loads(response[0]["body"])
+            audits = result["vXPolicyExportAudits"]
+            for audit in audits:
+                if parse_ranger_date(audit["createDate"]) < created_time:
+                    return len(plugins)
+                audit_update_date = parse_ranger_date(audit["updateDate"])
+                if (
+                    audit_update_date >= created_time
+                    and audit["httpRetCode"] in RANGER_POLICIES_UP_TO_DATE_CODES
+                ):
+                    plugin = audit.get("agentId") or audit["clientIP"]
+                    plugins[plugin] = max(
+                        plugins.get(plugin, audit_update_date), audit_update_date
+                    )
+            start_index += len(audits)
+            if not audits or start_index >= result["totalCount"]:
+                break
+        return len(plugins)
+
+    def wait_policies_pulled(pending_services: Dict[str, tuple]):
+        @retry(
+            nb_retries=None,
+            sleep_time_between_tries=5,
+            deadline=RANGER_POLICIES_PULL_TIMEOUT,
+        )
+        def check_policies_pulled():
+            for service, (created_time, minimum_policy_pulled) in list(
+                pending_services.items()
+            ):
+                plugins_pulled = count_plugins_pulled(
+                    service, created_time, minimum_policy_pulled
+                )
+                if plugins_pulled >= minimum_policy_pulled:
+                    del pending_services[service]
+            if pending_services:
+                raise ValueError(
+                    "Pas assez de machines ont pull la dernière version de policy"
+                    f" pour {', '.join(pending_services)}"
+                )
+
+        check_policies_pulled()
+
+    def ranger_policies_func(policies: List[dict]):
+        errors = []
+        with lock("ranger_policy") as data:
+            created_policies = data.setdefault("created_policies", {})
+            new_policies = [
+                policy for policy in policies if policy["name"] not in created_policies
+            ]
+            requests = []
+            for policy in new_policies:
+                policy_body = {
+                    "description": policy["name"],
+                    "isEnabled": True,
+                    "isAuditEnabled": True,
+                    **policy,
+                }
+                policy_body.pop("minimum_policy_pulled", None)
+                requests.append(
+                    f"{curl_args} --header 'Content-Type: application/json'"
+                    f" --request POST --data {shlex.quote(json.dumps(policy_body))}"
+                    f" '{ranger_policy_url}'"
+                )
+            # All the policies are created over a single connection
+            responses = http_client.batch(requests)
+
+            pending_services = {}
+            for policy, response in zip(new_policies, responses):
+                if response["http_status"] >= 400:
+                    errors.append(f"{policy['name']}: {response}")
+                    continue
+                created_policy = json.loads(response["body"])
+                created_policies[policy["name"]] = created_policy["id"]
+                created_time = datetime.fromtimestamp(
+                    created_policy["createTime"] / 1000, tz=timezone.utc
+                )
+                minimum_policy_pulled = policy.get("minimum_policy_pulled", 0)
+                if minimum_policy_pulled > 0:
+                    previous_time, previous_minimum = pending_services.get(
+                        policy["service"], (created_time, 0)
+                    )
+                    pending_services[policy["service"]] = (
+                        max(previous_time, created_time),
+                        max(previous_minimum, minimum_policy_pulled),
+                    )
+            if not errors:
+                wait_policies_pulled(pending_services)
+        if errors:
+            pytest.fail("Ranger policies could not be created\n" + "\n".join(errors))
+
+    yield ranger_policies_func
+    with lock("ranger_policy", teardown=True) as data:
+        if not data["last_worker"]:
+            return
+        created_policies = data.get("created_policies", {})
+        http_client.batch(
+            [
+                f"{curl_args} --request DELETE '{ranger_policy_url}/{policy_id}'"
+                for policy_id in created_policies.values()
+            ],
+        )
+        created_policies.clear()
+
 
+@pytest.fixture(scope="session")
+def ranger_policy(
+    ranger_policies: Callable[[List[dict]], None],
+) -> Callable[[str, str, dict, List[dict], int], None]:
     def ranger_policy_func(
         name: str,
         service: str,
@@ -474,60 +1155,20 @@ def ranger_policy(
         minimum_policy_pulled: int = 0,
         **kwargs,
     ):
-        with lock("ranger_policy") as data:
-            if name in data.setdefault("created_policies", {}):
-                return
-            policy = {
-                "name": name,
-                "service": service,
-                "description": name,
-                "isEnabled": True,
-                "isAuditEnabled": True,
-                "resources": resources,
-                "policyItems": policyItems,
-            }
-            policy.update(kwargs)
-            curl_args_create = f"{curl_args} -H 'Content-Type: application/json' -X POST '{ranger_policy_url}' -d '{json.dumps(policy)}'"
-            curl_result = curl(curl_args_create)
-            policy = json.loads(curl_result["command"].stdout)
-            data["created_policies"][name] = policy["id"]
-            policy_created_time = datetime.utcfromtimestamp(policy["createTime"] / 1000)
-            if minimum_policy_pulled > 0:
-
-                @retry(sleep_time_between_tries=5, nb_retries=10)
-                def check_policy_pulled_n_times():
-                    curl_result = curl(
-                        f"{curl_args} '{ranger_audits_url}&repository={service}'"
-                    )
-                    result = json.loads(curl_result["command"].stdout)
-                    times_pulled = 0
-                    for audit in result["vXPolicyExportAudits"]:
-                        audit_update_date = datetime.strptime(
-                            audit["updateDate"], "%Y-%m-%dT%H:%M:%SZ"
-                        )
-                        if audit_update_date >= policy_created_time:
-                            times_pulled += 1
-                            if times_pulled >= minimum_policy_pulled:
-                                break
-                    else:
-                        raise ValueError(
-                            "Pas assez de machines ont pull la dernière version de policy"
-                        )
-
-                check_policy_pulled_n_times()
-
-    yield ranger_policy_func
-    with lock("ranger_policy", teardown=True) as data:
-        if not data["last_worker"]:
-            return
-        created_policies = data.get("created_policies", {})
-        for policy_name in list(created_policies.keys()):
-            policy_id = created_policies[policy_name]
-            curl_args_delete = (
-                f"{curl_args} -X DELETE '{ranger_policy_url}/{policy_id}'"
-            )
-            curl(curl_args_delete)
-            del created_policies[policy_name]
+        ranger_policies(
+            [
+                {
+                    "name": name,
+                    "service": service,
+                    "resources": resources,
+                    "policyItems": policyItems,
+                    "minimum_policy_pulled": minimum_policy_pulled,
+                    **kwargs,
+                }
+            ]
+        )
+
+    return ranger_policy_func
 
 
 @pytest.fixture(scope="function")
@@ -0,0 +1,175 @@
+import csv
+import io
+import logging
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Iterator, List, NamedTuple, Sequence
+
+from testinfra.host import Host
+
+from .remote_agent import spawn_command
+
+logger = logging.getLogger("testinfra")
+
+DATASET_FORMATS = ("csv", "orc", "parquet")
+DATASET_CHUNK_SIZE = 100_000
+
+
+class DatasetError(Exception):
+    pass
+
+
+class Column(NamedTuple):
+    name: str
+    hive_type: str
+    # Value of the column for the row number
+    value: Callable[[int], Any]
+
+
+WEIGHT_CATEGORIES = ("sportscar", "truck", "berline")
+WEIGHT_SCHEMA = (
+    Column("id", "bigint", lambda i: i),
+    Column("weight", "float", lambda i: i / 10 + 50),
+    Column(
+        "category",
+        "varchar(9)",
+        lambda i: WEIGHT_CATEGORIES[i % len(WEIGHT_CATEGORIES)],
+    ),
+)
+
+
+class Dataset:
+    """Rows computed from their number, so a dataset of any size can be
+    iterated or streamed by chunks without being held in memory, and every
+    consumer gets the same rows for the same name, schema and size."""
+
+    def __init__(self, name: str, schema: Sequence[Column], nb_rows: int):
+        self.name = name
+        self.schema = schema
+        self.nb_rows = nb_rows
+
+    @property
+    def columns(self) -> List[str]:
+        return [column.name for column in self.schema]
+
+    def hive_columns(self) -> str:
+        return ", ".join(f"{column.name} {column.hive_type}" for column in self.schema)
+
+    def row(self, i: int) -> tuple:
+        return tuple(column.value(i) for column in self.schema)
+
+    def chunks(self, chunk_size: int = DATASET_CHUNK_SIZE) -> Iterator[List[tuple]]:
+        for start in range(0, self.nb_rows, chunk_size):
+            end = min(start + chunk_size, self.nb_rows)
+            yield [self.row(i) for i in range(start, end)]
+
+    def __len__(self) -> int:
+        return self.nb_rows
+
+    def __iter__(self) -> Iterator[dict]:
+        columns = self.columns
+        for i in range(self.nb_rows):
+            yield dict(zip(columns, self.row(i)))
+
+
+def write_csv(dataset: Dataset, stream, chunk_size: int = DATASET_CHUNK_SIZE):
+    with io.TextIOWrapper(stream, encoding="utf-8", newline="") as text_stream:
+        writer = csv.writer(text_stream)
+        writer.writerow(dataset.columns)
+        for chunk in dataset.chunks(chunk_size):
+            writer.writerows(chunk)
+
+
+def arrow_type(hive_type: str):
+    import pyarrow
+
+    if hive_type.startswith(("varchar", "char", "string")):
+        return pyarrow.string()
+    return {
+        "int": pyarrow.int32(),
+        "bigint": pyarrow.int64(),
+        "float": pyarrow.float32(),
+        "double": pyarrow.float64(),
+        "boolean": pyarrow.bool_(),
+    }[hive_type]
+
+
+def write_arrow(
+    dataset: Dataset,
+    stream,
+    dataset_format: str,
+    chunk_size: int = DATASET_CHUNK_SIZE,
+):
+    # pyarrow is only needed by the ORC and Parquet datasets
+    import pyarrow
+    import pyarrow.orc
+    import pyarrow.parquet
+
+    schema = pyarrow.schema(
+        [(column.name, arrow_type(column.hive_type)) for column in dataset.schema]
+    )
+    with pyarrow.PythonFile(stream, mode="w") as arrow_stream:
+        if dataset_format == "orc":
+            writer = pyarrow.orc.ORCWriter(arrow_stream)
+        else:
+            writer = pyarrow.parquet.ParquetWriter(arrow_stream, schema)
+        try:
+            for chunk in dataset.chunks(chunk_size):
+                # Each chunk is a stripe or a row group of the file
+                writer.write(
+                    pyarrow.Table.from_batches(
+                        [
+                            pyarrow.RecordBatch.from_arrays(
+                                list(zip(*chunk)), schema=schema
+                            )
+                        ]
+                    )
+                )
+        finally:
+            writer.close()
+
+
+def stream_to_hdfs(
+    host: Host,
+    user: str,
+    dataset: Dataset,
+    hdfs_path: str,
+    dataset_format: str = "csv",
+    chunk_size: int = DATASET_CHUNK_SIZE,
+) -> float:
+    """Write the dataset to the stdin of `hdfs dfs -put` run on the host,
+    returns the number of rows written per second."""
+    if dataset_format not in DATASET_FORMATS:
+        raise DatasetError(f"Unknown dataset format {dataset_format}")
+    start = time.perf_counter()
+    # stderr goes to a file so that it can not fill a pipe nobody reads
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            spawn_command(host, f"hdfs dfs -put -f - '{hdfs_path}'", user),
+            shell=True,
+            stdin=subprocess.PIPE,
+            stderr=stderr,
+        )
+        try:
+            if dataset_format == "csv":
+                write_csv(dataset, process.stdin, chunk_size)
+            else:
+                write_arrow(dataset, process.stdin, dataset_format, chunk_size)
+        except BrokenPipeError:
+            pass
+        finally:
+            if not process.stdin.closed:
+                process.stdin.close()
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise DatasetError(f"Unable to write {hdfs_path}: {stderr.read().decode()}")
+    rows_per_second = len(dataset) / (time.perf_counter() - start)
+    logger.info(
+        "%s rows of %s written to %s at %.0f rows/s",
+        len(dataset),
+        dataset.name,
+        hdfs_path,
+        rows_per_second,
+    )
+    return rows_per_second
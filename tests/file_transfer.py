@@ -0,0 +1,198 @@
+import contextlib
+import hashlib
+import io
+import shlex
+import subprocess
+import tarfile
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from testinfra.host import Host
+
+from .remote_agent import spawn_command
+
+DEFAULT_PERMISSIONS = 0o644
+
+
+class FileTransferError(Exception):
+    pass
+
+
+class PendingFile(NamedTuple):
+    content: bytes
+    sha256: str
+    distant_file: str
+    owner: Optional[str]
+    group: Optional[str]
+    permissions: Optional[int]
+
+
+class FileUploader:
+    """Copies files to the host as a single compressed tar stream.
+
+    Files are identified by the sha256 of their content: a file already
+    uploaded to the same path is skipped and a content already uploaded to
+    another path is copied on the host instead of being sent again, as long
+    as `sha256sum` finds these files unchanged. Files uploaded inside
+    `batch()` are sent together when the batch ends.
+    """
+
+    def __init__(self, host: Host, lock: Callable):
+        self.host = host
+        self.lock = lock
+        self.local = threading.local()
+
+    @property
+    def pending(self) -> Optional[List[PendingFile]]:
+        return getattr(self.local, "pending", None)
+
+    def __call__(
+        self,
+        local_file: str,
+        distant_file: str,
+        owner: Optional[str] = None,
+        group: Optional[str] = None,
+        permissions: Optional[int] = None,
+    ):
+        with open(local_file, "rb") as file_descriptor:
+            self.upload_content(
+                file_descriptor.read(), distant_file, owner, group, permissions
+            )
+
+    def upload_content(
+        self,
+        content: bytes,
+        distant_file: str,
+        owner: Optional[str] = None,
+        group: Optional[str] = None,
+        permissions: Optional[int] = None,
+    ):
+        pending_file = PendingFile(
+            content,
+            hashlib.sha256(content).hexdigest(),
+            distant_file,
+            owner,
+            group,
+            permissions,
+        )
+        if self.pending is not None:
+            self.pending.append(pending_file)
+        else:
+            self._send([pending_file])
+
+    @contextlib.contextmanager
+    def batch(self):
+        if self.pending is not None:
+            # Nested batches are sent with the outer one
+            yield
+            return
+        self.local.pending = []
+        try:
+            yield
+            pending_files = self.local.pending
+        finally:
+            self.local.pending = None
+        self._send(pending_files)
+
+    def _send(self, pending_files: List[PendingFile]):
+        if not pending_files:
+            return
+        with self.lock("upload_file") as data:
+            # sha256 by uploaded path
+            uploaded_files: Dict[str, str] = data.setdefault("uploaded_files", {})
+            previous_uploaded_files = dict(uploaded_files)
+            # A test may have changed or removed a file uploaded before, only
+            # the files still holding their content are reused
+            sha256s = {pending_file.sha256 for pending_file in pending_files}
+            reused_files = {
+                distant_file: sha256
+                for distant_file, sha256 in uploaded_files.items()
+                if sha256 in sha256s
+            }
+            for distant_file in set(reused_files) - self.intact_files(reused_files):
+                # Still removed at teardown, but never reused
+                uploaded_files[distant_file] = ""
+            paths_by_sha256 = {}
+            for distant_file, sha256 in uploaded_files.items():
+                paths_by_sha256.setdefault(sha256, distant_file)
+            archive = io.BytesIO()
+            commands = []
+            with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+                for pending_file in pending_files:
+                    if (
+                        uploaded_files.get(pending_file.distant_file)
+                        == pending_file.sha256
+                    ):
+                        continue
+                    source = paths_by_sha256.get(pending_file.sha256)
+                    if source is None:
+                        member = tarfile.TarInfo(pending_file.sha256)
+                        member.size = len(pending_file.content)
+                        tar.addfile(member, io.BytesIO(pending_file.content))
+                        source = f'"$tmp_dir"/{pending_file.sha256}'
+                        paths_by_sha256[pending_file.sha256] = pending_file.distant_file
+                    else:
+                        source = shlex.quote(source)
+                    commands.append(install_command(source, pending_file))
+                    uploaded_files[pending_file.distant_file] = pending_file.sha256
+            if not commands:
+                return
+            # Files of the tar stream are installed in place with their
+            # owner and mode, the temporary directory is removed on exit
+            command = " && ".join(
+                [
+                    "tmp_dir=$(mktemp -d)",
+                    "trap 'rm -rf \"$tmp_dir\"' EXIT",
+                    'tar -xzf - -C "$tmp_dir"',
+                    *commands,
+                ]
+            )
+            process = subprocess.run(
+                spawn_command(self.host, f"/bin/sh -c {shlex.quote(command)}"),
+                shell=True,
+                input=archive.getvalue(),
+                capture_output=True,
+            )
+            if process.returncode != 0:
+                uploaded_files.clear()
+                uploaded_files.update(previous_uploaded_files)
+                raise FileTransferError(
+                    f"Upload of {[f.distant_file for f in pending_files]} failed:"
+                    f" {process.stderr.decode()}"
+                )
+
+    def intact_files(self, files: Dict[str, str]) -> Set[str]:
+        """Paths of `files` whose content on the host has the sha256 they
+        are mapped to."""
+        if not files:
+            return set()
+        paths = list(files)
+        command = "; ".join(
+            f"echo {shlex.quote(f'{files[path]}  {path}')}"
+            f" | sha256sum --check --status 2>/dev/null && echo {index}"
+            for index, path in enumerate(paths)
+        )
+        process = subprocess.run(
+            spawn_command(self.host, f"/bin/sh -c {shlex.quote(command)}"),
+            shell=True,
+            capture_output=True,
+            text=True,
+        )
+        return {paths[int(index)] for index in process.stdout.split()}
+
+    def remove_all(self, uploaded_files: List[str]):
+        if uploaded_files:
+            self.host.run_expect(
+                [0], "rm -f -- " + " ".join(shlex.quote(f) for f in uploaded_files)
+            )
+
+
+def install_command(source: str, pending_file: PendingFile) -> str:
+    options = [f"-m {pending_file.permissions or DEFAULT_PERMISSIONS:o}"]
+    if pending_file.owner:
+        options.append(f"-o {shlex.quote(pending_file.owner)}")
+    if pending_file.group:
+        options.append(f"-g {shlex.quote(pending_file.group)}")
+    return (
+        f"install {' '.join(options)} {source} {shlex.quote(pending_file.distant_file)}"
+    )
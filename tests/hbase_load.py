@@ -0,0 +1,202 @@
+# HBase REST documentation https://hbase.apache.org/book.html#_rest
+import base64
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import logging
+import subprocess
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List
+
+from testinfra.host import Host
+
+from .remote_agent import spawn_command
+from .stats import percentiles
+
+logger = logging.getLogger("testinfra")
+
+HBASE_CONTENT_TYPES = {
+    "json": "application/json",
+    "protobuf": "application/x-protobuf",
+}
+
+
+class HBaseLoadError(Exception):
+    pass
+
+
+def salted_row_key(row_id: int, nb_salts: int = 16) -> str:
+    # The salt spreads consecutive ids over the regions and is derived from
+    # the id so that the same dataset always gives the same keys
+    salt = int(hashlib.sha256(str(row_id).encode()).hexdigest(), 16) % nb_salts
+    return f"{salt:02x}_{row_id}"
+
+
+def to_base64(value: bytes) -> str:
+    return str(base64.b64encode(value), "ascii")
+
+
+def encode_json(rows: List[tuple]) -> bytes:
+    cell_set = {
+        "Row": [
+            {
+                "key": to_base64(key),
+                "Cell": [
+                    {"column": to_base64(column), "$": to_base64(value)}
+                    for column, value in cells
+                ],
+            }
+            for key, cells in rows
+        ]
+    }
+    return json.dumps(cell_set).encode()
+
+
+def protobuf_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def protobuf_field(number: int, value: bytes) -> bytes:
+    # Length-delimited field (wire type 2)
+    return protobuf_varint(number << 3 | 2) + protobuf_varint(len(value)) + value
+
+
+def encode_protobuf(rows: List[tuple]) -> bytes:
+    # CellSet { repeated Row rows = 1 }
+    # Row { bytes key = 1; repeated Cell values = 2 }
+    # Cell { bytes column = 2; bytes data = 4 }
+    return b"".join(
+        protobuf_field(
+            1,
+            protobuf_field(1, key)
+            + b"".join(
+                protobuf_field(2, protobuf_field(2, column) + protobuf_field(4, value))
+                for column, value in cells
+            ),
+        )
+        for key, cells in rows
+    )
+
+
+HBASE_ENCODERS = {
+    "json": encode_json,
+    "protobuf": encode_protobuf,
+}
+
+
+class HBaseRestLoader:
+    """Write rows to an HBase table through the REST gateway.
+
+    Rows are encoded in chunks of `chunk_size` rows, each chunk is streamed
+    to the stdin of a curl process on the edge host and at most `nb_writers`
+    chunks are sent at the same time. The dataset is consumed lazily so only
+    the chunks being sent are held in memory.
+    """
+
+    def __init__(
+        self,
+        host: Host,
+        user: str,
+        hbase_rest: str,
+        table: str,
+        columns: Dict[str, str],
+        encoding: str = "json",
+        chunk_size: int = 1000,
+        nb_writers: int = 4,
+        nb_salts: int = 16,
+    ):
+        self.host = host
+        self.user = user
+        self.url = f"{hbase_rest}/{table}/fakerow"
+        # HBase column ("family:qualifier") by key of the dataset rows
+        self.columns = columns
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.nb_writers = nb_writers
+        self.nb_salts = nb_salts
+
+    def _chunks(self, dataset: Iterable[dict]) -> Iterator[List[tuple]]:
+        rows = (
+            (
+                salted_row_key(data["id"], self.nb_salts).encode(),
+                [
+                    (column.encode(), str(data[key]).encode())
+                    for column, key in self.columns.items()
+                ],
+            )
+            for data in dataset
+        )
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _write_chunk(self, chunk: List[tuple]) -> dict:
+        body = HBASE_ENCODERS[self.encoding](chunk)
+        curl_cmd = (
+            "curl --silent --show-error --insecure --negotiate --user :"
+            f" --request PUT --header 'Content-Type: {HBASE_CONTENT_TYPES[self.encoding]}'"
+            " --data-binary @- --output /dev/null --write-out '%{http_code}'"
+            f" '{self.url}'"
+        )
+        start = time.perf_counter()
+        process = subprocess.run(
+            spawn_command(self.host, curl_cmd, self.user),
+            shell=True,
+            input=body,
+            capture_output=True,
+        )
+        latency = time.perf_counter() - start
+        http_status = process.stdout.decode().strip()
+        if process.returncode != 0 or http_status != "200":
+            raise HBaseLoadError(
+                f"Chunk of {len(chunk)} rows failed with http status {http_status}:"
+                f" {process.stderr.decode()}"
+            )
+        return {"rows": len(chunk), "bytes": len(body), "latency": latency}
+
+    def load(self, dataset: Iterable[dict]) -> dict:
+        chunks_stats = []
+        # Bounds the number of encoded chunks waiting for a writer
+        slots = threading.BoundedSemaphore(self.nb_writers * 2)
+
+        def write_chunk(chunk: List[tuple]) -> dict:
+            try:
+                return self._write_chunk(chunk)
+            finally:
+                slots.release()
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(self.nb_writers) as executor:
+            futures = []
+            for chunk in self._chunks(dataset):
+                slots.acquire()
+                futures.append(executor.submit(write_chunk, chunk))
+            for future in futures:
+                chunks_stats.append(future.result())
+        duration = time.perf_counter() - start
+
+        nb_rows = sum(chunk_stats["rows"] for chunk_stats in chunks_stats)
+        report = {
+            "rows": nb_rows,
+            "chunks": len(chunks_stats),
+            "bytes": sum(chunk_stats["bytes"] for chunk_stats in chunks_stats),
+            "seconds": duration,
+            "rows_per_second": nb_rows / duration if duration else 0,
+            "chunk_latency": percentiles(
+                chunk_stats["latency"] for chunk_stats in chunks_stats
+            ),
+        }
+        logger.info("HBase REST load of %s: %s", self.url, report)
+        return report
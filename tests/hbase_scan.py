@@ -0,0 +1,153 @@
+# HBase REST documentation https://hbase.apache.org/book.html#_rest
+import base64
+import json
+import logging
+import shlex
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from .http_client import HttpClient
+from .stats import percentiles
+
+logger = logging.getLogger("testinfra")
+
+# Filters of the scanners, in the JSON form of the REST gateway
+SCAN_FILTERS: Dict[str, Optional[dict]] = {
+    "none": None,
+    "row_substring": {
+        "op": "EQUAL",
+        "type": "RowFilter",
+        "comparator": {"value": "_1", "type": "SubstringComparator"},
+    },
+    "first_key_only": {"type": "FirstKeyOnlyFilter"},
+}
+
+
+class HBaseScanError(Exception):
+    pass
+
+
+class HBaseRow(NamedTuple):
+    key: bytes
+    # Value by column ("family:qualifier")
+    cells: Dict[bytes, bytes]
+
+
+def decode_rows(cell_set: dict) -> Iterator[HBaseRow]:
+    for row in cell_set.get("Row", []):
+        yield HBaseRow(
+            base64.b64decode(row["key"]),
+            {
+                base64.b64decode(cell["column"]): base64.b64decode(cell["$"])
+                for cell in row.get("Cell", [])
+            },
+        )
+
+
+class HBaseRestScanner:
+    """Read an HBase table page by page through a scanner of the REST gateway.
+
+    `batch` is the maximum number of cells of a page, a row with more cells
+    is split over several pages and merged back. `caching` is the number of
+    rows the gateway fetches from the RegionServers at once. The pages are
+    decoded while they are read and the scanner is always deleted, even when
+    the rows are not all consumed.
+    """
+
+    def __init__(
+        self,
+        http_client: HttpClient,
+        user: str,
+        hbase_rest: str,
+        table: str,
+        batch: int = 1000,
+        caching: Optional[int] = None,
+        row_filter: Optional[dict] = None,
+        curl_opts: str = "--negotiate --user :",
+    ):
+        self.http_client = http_client
+        self.user = user
+        self.url = f"{hbase_rest}/{table}/scanner"
+        self.batch = batch
+        self.caching = caching
+        self.row_filter = row_filter
+        self.curl_opts = curl_opts
+        self.scanner_url: Optional[str] = None
+        # Response time of every page, as measured by curl
+        self.page_latencies: List[float] = []
+        self.nb_cells = 0
+
+    def _request(self, curl_args: str) -> dict:
+        with self.http_client.host.sudo(self.user):
+            response = self.http_client.request(
+                f"{self.curl_opts} --header 'Accept: application/json' {curl_args}"
+            )
+        if response["http_status"] is None or response["http_status"] >= 400:
+            raise HBaseScanError(f"{curl_args} failed\n{response['command']}")
+        return response
+
+    def open(self):
+        scanner = {"batch": self.batch}
+        if self.caching is not None:
+            scanner["caching"] = self.caching
+        if self.row_filter is not None:
+            scanner["filter"] = json.dumps(self.row_filter)
+        response = self._request(
+            "--request POST --header 'Content-Type: application/json'"
+            f" --data {shlex.quote(json.dumps(scanner))} {shlex.quote(self.url)}"
+        )
+        if "location" not in response["headers"]:
+            raise HBaseScanError(
+                f"No location url for the scanner\n{response['command']}"
+            )
+        self.scanner_url = response["headers"]["location"]
+        self.page_latencies = []
+        self.nb_cells = 0
+
+    def pages(self) -> Iterator[dict]:
+        while True:
+            response = self._request(shlex.quote(self.scanner_url))
+            # No content once the scanner is exhausted
+            if response["http_status"] == 204:
+                return
+            self.page_latencies.append(response["timings"]["time_total"])
+            yield json.loads(response["command"].stdout)
+
+    def rows(self) -> Iterator[HBaseRow]:
+        self.open()
+        try:
+            current: Optional[HBaseRow] = None
+            for page in self.pages():
+                for row in decode_rows(page):
+                    self.nb_cells += len(row.cells)
+                    if current is not None and current.key == row.key:
+                        current.cells.update(row.cells)
+                        continue
+                    if current is not None:
+                        yield current
+                    current = row
+            if current is not None:
+                yield current
+        finally:
+            self.close()
+
+    def close(self):
+        if self.scanner_url is not None:
+            self._request(f"--request DELETE {shlex.quote(self.scanner_url)}")
+            self.scanner_url = None
+
+    def scan(self) -> dict:
+        """Read every row without keeping them and report the throughput."""
+        start = time.perf_counter()
+        nb_rows = sum(1 for _ in self.rows())
+        duration = time.perf_counter() - start
+        report = {
+            "rows": nb_rows,
+            "cells": self.nb_cells,
+            "pages": len(self.page_latencies),
+            "seconds": duration,
+            "rows_per_second": nb_rows / duration if duration else 0,
+            "page_latency": percentiles(self.page_latencies),
+        }
+        logger.info("HBase REST scan of %s: %s", self.url, report)
+        return report
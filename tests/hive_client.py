@@ -0,0 +1,180 @@
+import itertools
+import queue
+import re
+import subprocess
+import threading
+from typing import Any, ContextManager, List, NamedTuple, Optional
+
+from testinfra.host import Host
+
+from .pooling import UserPool
+from .remote_agent import spawn_command
+
+RE_BEELINE_PROMPT = re.compile(r"^(\d+: jdbc:hive2:.*|[. ]+)> ")
+RE_BEELINE_LOG = re.compile(r"^(INFO|WARN|WARNING|ERROR|DEBUG)\s*:")
+RE_INT = re.compile(r"^-?[0-9]+$")
+RE_FLOAT = re.compile(r"^-?([0-9]+\.[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?$")
+
+BEELINE_CMD = (
+    "beeline --silent=true --outputformat=tsv2 --showHeader=true --force=true 2>&1"
+)
+STATEMENT_TIMEOUT = 600
+
+
+class HiveError(Exception):
+    pass
+
+
+class HiveResult(NamedTuple):
+    columns: List[str]
+    rows: List[tuple]
+
+
+def to_typed_value(value: str) -> Any:
+    if value == "NULL":
+        return None
+    if RE_INT.match(value):
+        return int(value)
+    if RE_FLOAT.match(value):
+        return float(value)
+    if value in ("true", "false"):
+        return value == "true"
+    return value
+
+
+def to_single_line(statement: str) -> str:
+    # Beeline echoes each line of a statement, comments are removed so that
+    # the statement can be sent on a single line
+    lines = [
+        line
+        for line in statement.strip().rstrip(";").splitlines()
+        if not line.strip().startswith("--")
+    ]
+    return " ".join(line.strip() for line in lines)
+
+
+class HiveSession:
+    """HiveServer2 session of a beeline process kept open on the edge host.
+
+    Statements are written on the stdin of beeline and each one is followed
+    by a query selecting a unique marker, the output until that marker is
+    the result of the statement.
+    """
+
+    def __init__(self, host: Host, user: str, beeline_cmd: str = BEELINE_CMD):
+        self.user = user
+        self.markers = itertools.count()
+        self.current_database_changed = False
+        self.settings_changed = False
+        # Set once the output of beeline can no longer be matched to the
+        # statements, after a timeout or when beeline exited
+        self.broken = False
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.process = subprocess.Popen(
+            spawn_command(host, beeline_cmd, user),
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        threading.Thread(target=self._read_lines, daemon=True).start()
+        # Drops the connection messages
+        self._send_marker()
+
+    def _read_lines(self):
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+        self.lines.put(None)
+
+    def _send_marker(
+        self, statement: str = "", timeout: float = STATEMENT_TIMEOUT
+    ) -> List[str]:
+        marker = f"__HIVE_END_{next(self.markers)}__"
+        self.process.stdin.write(f"{statement}\nSELECT '{marker}';\n")
+        self.process.stdin.flush()
+        output = []
+        while True:
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                self.broken = True
+                raise HiveError(f"No answer from beeline for {statement}")
+            if line is None:
+                self.broken = True
+                raise HiveError("beeline exited\n" + "\n".join(output))
+            if line == marker:
+                # Header of the marker query
+                return output[:-1]
+            if not RE_BEELINE_PROMPT.match(line) and not RE_BEELINE_LOG.match(line):
+                output.append(line)
+
+    def execute(self, statement: str) -> HiveResult:
+        statement = to_single_line(statement)
+        output = self._send_marker(f"{statement};")
+        errors = [line for line in output if line.startswith("Error:")]
+        if errors:
+            raise HiveError(f"{statement}\n" + "\n".join(errors))
+        if statement.lower().startswith("use "):
+            self.current_database_changed = True
+        elif statement.lower().startswith("set ") and "=" in statement:
+            self.settings_changed = True
+        if not output:
+            return HiveResult([], [])
+        columns = output[0].split("\t")
+        rows = [
+            tuple(to_typed_value(value) for value in line.split("\t"))
+            for line in output[1:]
+        ]
+        return HiveResult(columns, rows)
+
+    def reset(self):
+        """Undo the USE and SET statements before the session is reused."""
+        if self.settings_changed:
+            # Back to the configuration of HiveServer2
+            self.execute("RESET")
+            self.settings_changed = False
+        if self.current_database_changed:
+            self.execute("USE default")
+            self.current_database_changed = False
+
+    def close(self):
+        if self.broken:
+            self.process.kill()
+        else:
+            self.process.stdin.write("!quit\n")
+            self.process.stdin.close()
+        self.process.wait()
+
+
+class HiveSessionPool(UserPool[HiveSession]):
+    """Open beeline sessions per user, reused by the statements of the tests.
+
+    At most `max_sessions` sessions are opened per user, a statement waits
+    up to `wait_timeout` seconds for a free session when all of them are in
+    use.
+    """
+
+    error = HiveError
+    kind = "Hive session"
+
+    def __init__(
+        self,
+        host: Host,
+        max_sessions: int = 2,
+        wait_timeout: float = 2 * STATEMENT_TIMEOUT,
+    ):
+        super().__init__(max_sessions, wait_timeout)
+        self.host = host
+
+    def open(self, user: str) -> HiveSession:
+        return HiveSession(self.host, user)
+
+    def reset(self, session: HiveSession):
+        session.reset()
+
+    def session(self, user: str) -> ContextManager[HiveSession]:
+        return self.acquire(user)
+
+    def execute(self, user: str, statement: str) -> HiveResult:
+        with self.session(user) as session:
+            return session.execute(statement)
@@ -0,0 +1,138 @@
+import re
+from typing import Dict, List, Optional
+
+from testinfra.host import Host
+
+HTTP_STATUS_MARKER = "__HTTP_STATUS__"
+RE_HTTP_STATUS = re.compile(f"\n{HTTP_STATUS_MARKER} ([0-9]{{3}})\n")
+
+HTTP_RESPONSE_MARKER = "__HTTP_RESPONSE__"
+HTTP_RESPONSE_FIELDS = (
+    "http_code",
+    "num_connects",
+    "time_connect",
+    "time_appconnect",
+    "time_starttransfer",
+    "time_total",
+    "url_effective",
+)
+
+CURL_OPTS = "--insecure"
+
+
+class HttpBatchError(Exception):
+    pass
+
+
+def curl_batch(
+    host: Host,
+    requests: List[str],
+    curl_opts: str = CURL_OPTS,
+) -> List[dict]:
+    """Send `requests`, each one being curl arguments, with a single curl process.
+
+    Requests are chained with `--next` so curl reuses its connections between
+    them. `curl_opts` are added to every request since `--next` resets them.
+    The status and body of every response are returned in order.
+    """
+    if not requests:
+        return []
+    write_out = f"--write-out '\\n{HTTP_STATUS_MARKER} %{{http_code}}\\n'"
+    curl_cmd = "curl --silent --show-error " + " --next ".join(
+        f"{curl_opts} {write_out} {request}" for request in requests
+    )
+    curl_result = host.run(curl_cmd)
+
+    # The body of each response is followed by its status line
+    parts = RE_HTTP_STATUS.split(curl_result.stdout)
+    responses = [
+        {"http_status": int(status), "body": body.strip()}
+        for body, status in zip(parts[0::2], parts[1::2])
+    ]
+    if len(responses) != len(requests):
+        raise HttpBatchError(
+            f"Only {len(responses)}/{len(requests)} requests completed\n{curl_result}"
+        )
+    return responses
+
+
+def parse_headers(dump: str) -> Dict[str, str]:
+    # Only the headers of the last response are kept
+    headers: Dict[str, str] = {}
+    for line in dump.splitlines():
+        if line.startswith("HTTP/"):
+            headers = {}
+        elif ": " in line:
+            name, value = line.split(": ", 1)
+            headers[name.lower()] = value.strip()
+    return headers
+
+
+class HttpClient:
+    """Run curl on `host` while keeping the authentication cookies.
+
+    Cookies such as `hadoop.auth` are stored in a cookie jar per remote user
+    and sent back with every request, which saves the SPNEGO negotiation once
+    a service has authenticated the user. The status and timings are written
+    by curl after the body and the headers before it, both are removed from
+    the returned stdout.
+    """
+
+    def __init__(self, host: Host, cookie_jar_prefix: str):
+        self.host = host
+        self.cookie_jar_prefix = cookie_jar_prefix
+        # Resolved on the remote host for the user running curl
+        cookie_jar = f'"{cookie_jar_prefix}_$(id -u)"'
+        self.curl_opts = f"{CURL_OPTS} --cookie {cookie_jar} --cookie-jar {cookie_jar}"
+
+    def request(self, curl_args: str, output: Optional[str] = None) -> dict:
+        write_out = "\t".join(f"%{{{field}}}" for field in HTTP_RESPONSE_FIELDS)
+        curl_cmd = [
+            "curl --silent --show-error",
+            self.curl_opts,
+            "--dump-header -",
+            f"--write-out '\\n{HTTP_RESPONSE_MARKER}\\t{write_out}'",
+        ]
+        if output is not None:
+            # Streams the body to a remote file instead of the command output
+            curl_cmd.append(f"--output '{output}'")
+        curl_cmd.append(curl_args)
+        command = self.host.run(" ".join(curl_cmd))
+
+        body, marker, response = command.stdout.rpartition(
+            f"\n{HTTP_RESPONSE_MARKER}\t"
+        )
+        if not marker:
+            return {"command": command, "http_status": None}
+        # Headers of every response (authentication, redirections...) come
+        # before the body of the last response
+        headers_dump = ""
+        while body.startswith("HTTP/") and "\r\n\r\n" in body:
+            header_block, body = body.split("\r\n\r\n", 1)
+            headers_dump += header_block + "\r\n\r\n"
+        response_fields = dict(zip(HTTP_RESPONSE_FIELDS, response.split("\t")))
+        backend = self.host.backend
+        return {
+            # Headers are reported on stderr like with "curl --verbose"
+            "command": backend.result(
+                command.rc,
+                command.command,
+                backend.encode(body),
+                backend.encode(headers_dump + command.stderr),
+            ),
+            "http_status": int(response_fields["http_code"]),
+            "headers": parse_headers(headers_dump),
+            "num_connects": int(response_fields["num_connects"]),
+            "timings": {
+                field: float(value)
+                for field, value in response_fields.items()
+                if field.startswith("time_")
+            },
+            "url": response_fields["url_effective"],
+        }
+
+    def batch(self, requests: List[str]) -> List[dict]:
+        return curl_batch(self.host, requests, self.curl_opts)
+
+    def close(self):
+        self.host.run(f"rm -f {self.cookie_jar_prefix}_*")
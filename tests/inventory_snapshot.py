@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pytest
+from testinfra.utils.ansible_runner import AnsibleRunner
+
+from .benchmark import REPOSITORY_DIR
+
+logger = logging.getLogger("testinfra")
+
+# The resolved variables hold passwords, the snapshot is only readable by
+# its owner and kept out of the repository
+INVENTORY_SNAPSHOT_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "tdp-tests"
+)
+# Everything the resolution of the hosts and their variables depends on
+INVENTORY_SOURCES = ("inventory", "tdp_vars", "ansible.cfg")
+
+
+def sources_key(paths: Iterable[Path], *extra: Optional[str]) -> str:
+    """Hash of the path, size and mtime of every file under `paths`."""
+    digest = hashlib.sha256()
+    for value in extra:
+        digest.update(f"{value}\0".encode())
+    for path in paths:
+        if path.is_dir():
+            files = sorted(
+                Path(root) / name
+                for root, _, names in os.walk(path, followlinks=True)
+                for name in names
+            )
+        else:
+            files = [path]
+        for file in files:
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            digest.update(f"{file}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+    return digest.hexdigest()
+
+
+def snapshot_path(inventory_file: Optional[str]) -> Path:
+    # One snapshot per checkout and inventory
+    name = hashlib.sha256(f"{REPOSITORY_DIR}\0{inventory_file}".encode()).hexdigest()
+    return INVENTORY_SNAPSHOT_DIR / f"inventory-{name[:16]}.json"
+
+
+def read_snapshot(path: Path) -> Optional[dict]:
+    try:
+        with path.open() as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(path: Path, snapshot: dict):
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # Written aside and renamed so that a worker never reads a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_inventory_snapshot(config: pytest.Config):
+    """Resolve the Ansible inventory, with the variables of the hosts, once
+    for every process of the session.
+
+    The output of `ansible-inventory --list` is written with the key of its
+    sources to a file of `INVENTORY_SNAPSHOT_DIR` only readable by its owner,
+    and given to the testinfra runner of the process, which then never runs
+    it.
+    """
+    inventory_file = config.option.ansible_inventory
+    runner = AnsibleRunner.get_runner(inventory_file)
+    if "inventory" in runner.__dict__:
+        return
+    key = sources_key(
+        [REPOSITORY_DIR / source for source in INVENTORY_SOURCES],
+        inventory_file,
+        os.environ.get("ANSIBLE_CONFIG"),
+    )
+    path = snapshot_path(inventory_file)
+    snapshot = read_snapshot(path)
+    if snapshot is not None and snapshot.get("key") == key:
+        # Set the cached_property of the runner
+        runner.__dict__["inventory"] = snapshot["inventory"]
+        return
+    start = time.perf_counter()
+    try:
+        inventory = runner.inventory
+    except Exception as error:
+        # The tests using the hosts report it when they resolve it again
+        logger.warning("Ansible inventory could not be resolved: %s", error)
+        return
+    logger.info("Ansible inventory resolved in %.1fs", time.perf_counter() - start)
+    # The xdist workers start once the controller is configured and load it
+    write_snapshot(path, {"key": key, "inventory": inventory})
@@ -0,0 +1,160 @@
+import logging
+import re
+import subprocess
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from testinfra.host import Host
+
+from .remote_agent import RemoteAgentError, spawn_command
+
+logger = logging.getLogger("testinfra")
+
+# klist and date are run with the C locale so they print the same format
+KLIST_CMD = "export LC_ALL=C; klist && date '+%m/%d/%y %H:%M:%S'"
+KLIST_DATE_FORMAT = "%m/%d/%y %H:%M:%S"
+RE_KLIST_TGT = re.compile(
+    r"^(\d\d/\d\d/\d\d \d\d:\d\d:\d\d)\s+(\d\d/\d\d/\d\d \d\d:\d\d:\d\d)\s+krbtgt/"
+)
+# Tickets are renewed when less than this ratio of their lifetime is left
+RENEW_LIFETIME_RATIO = 0.3
+RENEW_CHECK_INTERVAL = 60
+
+
+class KerberosError(Exception):
+    pass
+
+
+class LatencyTracker:
+    """Ticket acquisition times, since the last report."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: List[float] = []
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.pending.append(seconds)
+
+    def pop(self) -> List[float]:
+        with self.lock:
+            pending, self.pending = self.pending, []
+        return pending
+
+
+kinit_tracker = LatencyTracker()
+
+
+def ticket_lifetime(klist_output: str) -> Dict[str, float]:
+    """Lifetime and remaining time in seconds of the TGT listed by
+    `KLIST_CMD`."""
+    lines = klist_output.strip().splitlines()
+    now = datetime.strptime(lines[-1], KLIST_DATE_FORMAT)
+    for line in lines:
+        match = RE_KLIST_TGT.match(line)
+        if match:
+            valid_starting, expires = (
+                datetime.strptime(date, KLIST_DATE_FORMAT) for date in match.groups()
+            )
+            return {
+                "lifetime": (expires - valid_starting).total_seconds(),
+                "remaining": (expires - now).total_seconds(),
+            }
+    raise KerberosError(f"No TGT in the credential cache\n{klist_output}")
+
+
+class CredentialCacheManager:
+    """Gets the tickets of the principals once for the whole session.
+
+    The credential cache of a user on the host is shared by every worker,
+    the lock namespace of each user records when its ticket expires so that
+    only the worker finding it expired or about to expire runs kinit. A
+    thread renews the tickets in the background when the connection to the
+    host supports `spawn_command`.
+    """
+
+    def __init__(
+        self,
+        host: Host,
+        realm: str,
+        lock: Callable,
+        check_interval: float = RENEW_CHECK_INTERVAL,
+    ):
+        self.host = host
+        self.realm = realm
+        self.lock = lock
+        self.check_interval = check_interval
+        self.users: List[str] = []
+        self.stop_event = threading.Event()
+        self.renewer: Optional[threading.Thread] = None
+        try:
+            spawn_command(host, "true")
+            self.background_renewal = True
+        except RemoteAgentError as error:
+            # The tickets are then only renewed when a test requests them
+            logger.warning(
+                "Kerberos tickets are not renewed in the background: %s", error
+            )
+            self.background_renewal = False
+
+    def _run(self, user: str, command: str) -> str:
+        if threading.current_thread() is not self.renewer:
+            with self.host.sudo(user):
+                result = self.host.run(command)
+            if result.rc != 0:
+                raise KerberosError(f"{command} failed for {user}: {result.stderr}")
+            return result.stdout
+        # Not run with host.run, the renewal thread must not depend on the
+        # sudo context of the tests
+        process = subprocess.run(
+            spawn_command(self.host, command, user),
+            shell=True,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise KerberosError(f"{command} failed for {user}: {process.stderr}")
+        return process.stdout
+
+    def _kinit(self, user: str) -> Dict[str, float]:
+        start = time.perf_counter()
+        self._run(user, f"kinit -kt /home/{user}/{user}.keytab {user}@{self.realm}")
+        kinit_tracker.add(time.perf_counter() - start)
+        return ticket_lifetime(self._run(user, KLIST_CMD))
+
+    def acquire(self, user: str):
+        with self.lock(f"user_{user}") as data:
+            renew_at = data.get("renew_at")
+            if renew_at is None or time.time() >= renew_at:
+                ticket = self._kinit(user)
+                data["renew_at"] = (
+                    time.time()
+                    + ticket["remaining"]
+                    - ticket["lifetime"] * RENEW_LIFETIME_RATIO
+                )
+        if user not in self.users:
+            self.users.append(user)
+        if self.renewer is None and self.background_renewal:
+            self.renewer = threading.Thread(target=self._renew, daemon=True)
+            self.renewer.start()
+
+    def _renew(self):
+        while not self.stop_event.wait(self.check_interval):
+            for user in list(self.users):
+                try:
+                    self.acquire(user)
+                except Exception:
+                    logger.exception("Unable to renew the ticket of %s", user)
+
+    def close(self):
+        self.stop_event.set()
+        if self.renewer is not None:
+            self.renewer.join()
+        for user in self.users:
+            with self.lock(f"user_{user}", teardown=True) as data:
+                if not data["last_worker"]:
+                    continue
+                self._run(user, "kdestroy")
+                data.pop("renew_at", None)
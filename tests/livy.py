@@ -0,0 +1,168 @@
+# Livy REST API documentation https://livy.apache.org/docs/latest/rest-api.html
+import json
+import shlex
+from typing import Any, Dict, NamedTuple, Optional
+
+from .http_client import HttpClient
+from .retrying import RetryPolicy, retry
+from .spark_layout import ExecutorLayout
+
+SESSION_START_TIMEOUT = 300
+STATEMENT_TIMEOUT = 300
+# Polling of the session and statement states
+POLL_POLICY = RetryPolicy(initial_sleep=0.5, backoff=1.5, max_sleep=5)
+SESSION_DEAD_STATES = ("shutting_down", "error", "dead", "killed", "success")
+
+
+class LivyError(Exception):
+    pass
+
+
+class LivyPending(Exception):
+    pass
+
+
+class LivyResult(NamedTuple):
+    """Output of a statement, by mime type."""
+
+    data: Dict[str, Any]
+
+    @property
+    def text(self) -> str:
+        return self.data.get("text/plain", "")
+
+    @property
+    def json(self) -> Any:
+        # Set by the %json magic of the pyspark interpreter
+        return self.data.get("application/json")
+
+
+class LivySession:
+    """Interactive Spark session on a Livy server, used as `user` through
+    `curl` on the edge host.
+
+    Statements are run one after the other by the Spark application of the
+    session, whose driver and executors are kept between statements.
+    """
+
+    def __init__(
+        self,
+        http_client: HttpClient,
+        user: str,
+        url: str,
+        session_id: Optional[int] = None,
+        curl_opts: str = "--negotiate --user :",
+    ):
+        self.http_client = http_client
+        self.user = user
+        self.url = url
+        self.session_id = session_id
+        self.curl_opts = curl_opts
+        # Executors asked for when the session was started
+        self.layout: Optional[ExecutorLayout] = None
+
+    def request(
+        self, method: str, path: str, body: Optional[dict] = None
+    ) -> Optional[dict]:
+        request = [
+            self.curl_opts,
+            f"--request {method}",
+            # Required when the CSRF protection of Livy is enabled
+            f"--header 'X-Requested-By: {self.user}'",
+        ]
+        if body is not None:
+            request.append("--header 'Content-Type: application/json'")
+            request.append(f"--data {shlex.quote(json.dumps(body))}")
+        request.append(shlex.quote(f"{self.url}{path}"))
+        with self.http_client.host.sudo(self.user):
+            response = self.http_client.request(" ".join(request))
+        if response["http_status"] == 404:
+            return None
+        if response["http_status"] is None or response["http_status"] >= 400:
+            raise LivyError(f"{method} {path} failed\n{response['command']}")
+        stdout = response["command"].stdout.strip()
+        return json.loads(stdout) if stdout else {}
+
+    def state(self) -> Optional[str]:
+        if self.session_id is None:
+            return None
+        session = self.request("GET", f"/sessions/{self.session_id}/state")
+        return session["state"] if session is not None else None
+
+    def is_alive(self) -> bool:
+        state = self.state()
+        return state is not None and state not in SESSION_DEAD_STATES
+
+    def start(
+        self,
+        conf: Optional[Dict[str, Any]] = None,
+        timeout: float = SESSION_START_TIMEOUT,
+    ):
+        """Create the session and wait for its Spark application.
+
+        `conf` is sent as is, e.g. `numExecutors` or `executorMemory`.
+        """
+        session = self.request("POST", "/sessions", {"kind": "pyspark", **(conf or {})})
+        self.session_id = session["id"]
+
+        @retry(
+            nb_retries=None,
+            deadline=timeout,
+            policies={LivyPending: POLL_POLICY, Exception: None},
+        )
+        def wait_idle():
+            state = self.state()
+            if state in ("not_started", "starting"):
+                raise LivyPending(state)
+            return state
+
+        try:
+            state = wait_idle()
+        except LivyPending as error:
+            raise LivyError(
+                f"Session {self.session_id} still {error} after {timeout}s"
+            ) from error
+        if state != "idle":
+            log = self.request("GET", f"/sessions/{self.session_id}/log")
+            raise LivyError(
+                f"Session {self.session_id} is {state}\n"
+                + "\n".join((log or {}).get("log", []))
+            )
+
+    def run(self, code: str, timeout: float = STATEMENT_TIMEOUT) -> LivyResult:
+        statements_path = f"/sessions/{self.session_id}/statements"
+        statement = self.request("POST", statements_path, {"code": code})
+
+        @retry(
+            nb_retries=None,
+            deadline=timeout,
+            policies={LivyPending: POLL_POLICY, Exception: None},
+        )
+        def wait_available():
+            current = self.request("GET", f"{statements_path}/{statement['id']}")
+            if current is None:
+                raise LivyError(f"Session {self.session_id} does not exist anymore")
+            if current["state"] in ("waiting", "running"):
+                raise LivyPending(current["state"])
+            return current
+
+        try:
+            statement = wait_available()
+        except LivyPending as error:
+            self.request("POST", f"{statements_path}/{statement['id']}/cancel")
+            raise LivyError(
+                f"Statement still {error} after {timeout}s, cancelled\n{code}"
+            ) from error
+        output = statement.get("output") or {}
+        if output.get("status") != "ok":
+            raise LivyError(
+                f"Statement {statement['state']}:"
+                f" {output.get('ename')}: {output.get('evalue')}\n"
+                + "".join(output.get("traceback", []))
+            )
+        return LivyResult(output.get("data", {}))
+
+    def close(self):
+        if self.session_id is not None:
+            self.request("DELETE", f"/sessions/{self.session_id}")
+            self.session_id = None
@@ -0,0 +1,41 @@
+from typing import Iterable
+
+# Above this number of rows the datasets are loaded with the MapReduce bulk
+# loader instead of upserts sent by the sqlline client
+PHOENIX_BULK_LOAD_MIN_ROWS = 100_000
+PHOENIX_UPSERT_BATCH_SIZE = 1_000
+PHOENIX_CLIENT_JAR = "/opt/tdp/phoenix/phoenix-client-hbase-*.jar"
+
+UPSERT = "UPSERT INTO {table} VALUES ({id}, {weight}, '{category}');"
+
+
+def render_upsert_script(
+    table: str,
+    dataset: Iterable[dict],
+    batch_size: int = PHOENIX_UPSERT_BATCH_SIZE,
+) -> str:
+    # The upserts are buffered by the client and sent to the region servers
+    # on each commit instead of one round trip per row
+    lines = ["!autocommit off"]
+    for i, data in enumerate(dataset, 1):
+        lines.append(
+            UPSERT.format(
+                table=table,
+                id=data["id"],
+                weight=data["weight"],
+                category=data["category"],
+            )
+        )
+        if i % batch_size == 0:
+            lines.append("!commit")
+    lines.append("!commit")
+    return "\n".join(lines)
+
+
+def csv_bulk_load_command(table: str, hdfs_path: str) -> str:
+    return (
+        "HADOOP_CLASSPATH=$(hbase mapredcp):/etc/hbase/conf"
+        f" hadoop jar {PHOENIX_CLIENT_JAR}"
+        " org.apache.phoenix.mapreduce.CsvBulkLoadTool"
+        f" --table '{table}' --input '{hdfs_path}' --skip-header"
+    )
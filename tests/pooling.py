@@ -0,0 +1,87 @@
+import contextlib
+import queue
+import threading
+from typing import Dict, Generator, Generic, List, Optional, Type, TypeVar
+
+# Anything with a `broken` attribute and a `close` method
+Resource = TypeVar("Resource")
+
+
+class UserPool(Generic[Resource]):
+    """Resources opened per user and reused by the tests.
+
+    At most `max_size` resources are opened per user, a caller waits up to
+    `wait_timeout` seconds for a free one when all of them are in use and
+    `error` is raised after that. Broken resources are closed and their slot
+    is given to the next caller, which opens a new one.
+    """
+
+    error: Type[Exception] = Exception
+    # Name of the resources in the error messages
+    kind = "resource"
+
+    def __init__(self, max_size: int, wait_timeout: float):
+        self.max_size = max_size
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        # None is a free slot, reserved for whoever gets it from the queue
+        self.idle: Dict[str, "queue.Queue[Optional[Resource]]"] = {}
+        self.opened: Dict[str, List[Optional[Resource]]] = {}
+
+    def open(self, user: str) -> Resource:
+        raise NotImplementedError
+
+    def reset(self, resource: Resource):
+        """Undo what a caller changed before the resource is reused, an
+        `error` marks it broken."""
+
+    @contextlib.contextmanager
+    def acquire(self, user: str) -> Generator[Resource, None, None]:
+        with self.lock:
+            idle = self.idle.setdefault(user, queue.Queue())
+            opened = self.opened.setdefault(user, [])
+            new_resource = idle.empty() and len(opened) < self.max_size
+            if new_resource:
+                # Reserves the slot before the resource is opened
+                opened.append(None)
+        resource = None
+        if not new_resource:
+            try:
+                resource = idle.get(timeout=self.wait_timeout)
+            except queue.Empty:
+                raise self.error(
+                    f"No {self.kind} of {user} was free after {self.wait_timeout}s"
+                ) from None
+        if resource is None:
+            try:
+                resource = self.open(user)
+            except Exception:
+                idle.put(None)
+                raise
+            with self.lock:
+                opened[opened.index(None)] = resource
+        try:
+            yield resource
+        finally:
+            self._release(user, resource)
+
+    def _release(self, user: str, resource: Resource):
+        if not resource.broken:
+            try:
+                self.reset(resource)
+            except self.error:
+                resource.broken = True
+        if not resource.broken:
+            self.idle[user].put(resource)
+            return
+        with self.lock:
+            opened = self.opened[user]
+            opened[opened.index(resource)] = None
+        self.idle[user].put(None)
+        resource.close()
+
+    def close(self):
+        for opened in self.opened.values():
+            for resource in opened:
+                if resource is not None:
+                    resource.close()
@@ -0,0 +1,209 @@
+"""Metrics of the observability stack over the time window of each test.
+
+The windows are recorded by the workers and Prometheus is queried once by
+the controller at the end of the session. `--prometheus-record` keeps the
+responses in a file, `--prometheus-replay` or `python -m tests.prometheus
+<file>` aggregate them again without the cluster.
+"""
+
+import argparse
+import json
+import math
+import shlex
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from testinfra.host import Host
+
+from .http_client import curl_batch
+
+WINDOW_PROPERTY = "test_window"
+PROMETHEUS_PORT = 9090
+# Points of the range queries of a window
+MAX_POINTS = 60
+# Size of the urls sent by a curl process, its whole command line must stay
+# under the 128KiB limit of the single argument of the shell running it
+MAX_BATCH_BYTES = 32 * 1024
+# Series of the JMX exporter and the JVM, by name
+DEFAULT_SERIES = {
+    "namenode_rpc_queue_time_ms": "avg(hadoop_namenode_rpcqueuetimeavgtime)",
+    "regionserver_get_latency_p99_ms": (
+        "max(hadoop_hbase_regionserver_server_get_99th_percentile)"
+    ),
+    "hs2_open_sessions": "sum(hs2_open_sessions)",
+    "jvm_gc_pause_ratio": "sum(rate(jvm_gc_collection_seconds_sum[1m]))",
+}
+
+
+class PrometheusError(Exception):
+    pass
+
+
+class TimeWindow(NamedTuple):
+    nodeid: str
+    # Epoch seconds
+    start: float
+    stop: float
+
+
+def load_series(path: Optional[str]) -> Dict[str, str]:
+    if path is None:
+        return dict(DEFAULT_SERIES)
+    with open(path) as series_file:
+        return json.load(series_file)
+
+
+def range_params(query: str, window: TimeWindow) -> Dict[str, str]:
+    step = max(1, math.ceil((window.stop - window.start) / MAX_POINTS))
+    return {
+        "query": query,
+        "start": f"{window.start:.3f}",
+        "end": f"{window.stop:.3f}",
+        "step": str(step),
+    }
+
+
+def aggregate(response: dict) -> Optional[Dict[str, float]]:
+    """Minimum, mean and maximum of every sample of a range query, `None`
+    when there is no sample."""
+    values = [
+        float(value)
+        for result in response.get("data", {}).get("result", [])
+        for _, value in result.get("values", [])
+        if value not in ("NaN", "+Inf", "-Inf")
+    ]
+    if not values:
+        return None
+    return {
+        "min": min(values),
+        "avg": sum(values) / len(values),
+        "max": max(values),
+    }
+
+
+def split_batches(requests: List[str]) -> Iterator[List[str]]:
+    batch: List[str] = []
+    size = 0
+    for request in requests:
+        if batch and size + len(request) > MAX_BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+        batch.append(request)
+        size += len(request)
+    if batch:
+        yield batch
+
+
+class PrometheusClient:
+    """Range queries sent to Prometheus by curl processes on `host`, each one
+    chaining as many queries as its command line allows."""
+
+    def __init__(self, host: Host, url: str):
+        self.host = host
+        self.url = url
+
+    def query_windows(
+        self, windows: List[TimeWindow], series: Dict[str, str]
+    ) -> List[dict]:
+        names = sorted(series)
+        requests = [
+            shlex.quote(
+                f"{self.url}/api/v1/query_range?"
+                + urlencode(range_params(series[name], window))
+            )
+            for window in windows
+            for name in names
+        ]
+        responses = iter(
+            response
+            for batch in split_batches(requests)
+            for response in curl_batch(self.host, batch)
+        )
+        records = []
+        for window in windows:
+            record = {**window._asdict(), "series": {}}
+            for name in names:
+                response = next(responses)
+                if response["http_status"] != 200:
+                    raise PrometheusError(
+                        f"{series[name]} failed with http status"
+                        f" {response['http_status']}: {response['body']}"
+                    )
+                try:
+                    body = json.loads(response["body"])
+                except json.JSONDecodeError as error:
+                    raise PrometheusError(
+                        f"{series[name]} answered with invalid JSON: {error}"
+                    ) from error
+                record["series"][name] = {"query": series[name], "response": body}
+            records.append(record)
+        return records
+
+
+class RecordedPrometheus:
+    """Stand-in for Prometheus answering with the responses recorded by a
+    previous session, matched by test and series name."""
+
+    def __init__(self, path: str):
+        with open(path) as records_file:
+            self.records = {
+                record["nodeid"]: record for record in json.load(records_file)
+            }
+
+    def query_windows(
+        self, windows: List[TimeWindow], series: Dict[str, str]
+    ) -> List[dict]:
+        records = []
+        for window in windows:
+            recorded = self.records.get(window.nodeid, {}).get("series", {})
+            records.append(
+                {
+                    **window._asdict(),
+                    "series": {
+                        name: recorded.get(
+                            name, {"query": query, "response": {"data": {}}}
+                        )
+                        for name, query in series.items()
+                    },
+                }
+            )
+        return records
+
+
+def correlate(records: List[dict]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Aggregated values of every series by test."""
+    return {
+        record["nodeid"]: {
+            name: values
+            for name, recorded in record["series"].items()
+            if (values := aggregate(recorded["response"])) is not None
+        }
+        for record in records
+    }
+
+
+def summary(correlations: Dict[str, Dict[str, Dict[str, float]]]) -> List[str]:
+    lines = []
+    for nodeid, series in correlations.items():
+        if not series:
+            continue
+        lines.append(nodeid)
+        for name, values in sorted(series.items()):
+            lines.append(
+                f"    {name:<36} min {values['min']:10.3f}"
+                f"  avg {values['avg']:10.3f}  max {values['max']:10.3f}"
+            )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m tests.prometheus")
+    parser.add_argument("records", help="File written with --prometheus-record")
+    args = parser.parse_args()
+    with open(args.records) as records_file:
+        records = json.load(records_file)
+    print("\n".join(summary(correlate(records))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import base64
+import contextlib
+import itertools
+import json
+import logging
+import shlex
+import subprocess
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from testinfra.backend.base import CommandResult
+from testinfra.host import Host
+
+logger = logging.getLogger("testinfra")
+
+# Reads the agent source on stdin so it does not have to be quoted
+AGENT_BOOTSTRAP = (
+    "import sys;"
+    "agent_source=sys.stdin.buffer.read(int(sys.stdin.buffer.readline()));"
+    "exec(agent_source)"
+)
+
+# Runs on the remote host, must stay compatible with the system python3 (3.6)
+AGENT_SOURCE = r"""
+import base64
+import json
+import subprocess
+import sys
+import threading
+
+output_lock = threading.Lock()
+children_lock = threading.Lock()
+children = {}
+
+
+def send(line):
+    with output_lock:
+        sys.stdout.buffer.write(line)
+        sys.stdout.buffer.flush()
+
+
+def run(request):
+    process = subprocess.Popen(
+        ["/bin/sh", "-c", request["command"]],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = process.communicate()
+    response = {
+        "id": request["id"],
+        "rc": process.returncode,
+        "stdout": base64.b64encode(stdout).decode("ascii"),
+        "stderr": base64.b64encode(stderr).decode("ascii"),
+    }
+    send((json.dumps(response) + "\n").encode("utf-8"))
+
+
+def forward(child):
+    for line in child.stdout:
+        send(line)
+
+
+def get_child(user):
+    # One agent per user keeps its environment and Kerberos cache warm
+    with children_lock:
+        if user not in children:
+            child = subprocess.Popen(
+                ["sudo", "-u", user, sys.executable, "-u", "-c", BOOTSTRAP],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            child.stdin.write(str(len(agent_source)).encode("ascii") + b"\n")
+            child.stdin.write(agent_source)
+            child.stdin.flush()
+            child.stdout.readline()
+            threading.Thread(target=forward, args=(child,), daemon=True).start()
+            children[user] = child
+        return children[user]
+
+
+send(b"ready\n")
+for line in sys.stdin.buffer:
+    request = json.loads(line.decode("utf-8"))
+    user = request.pop("user", None)
+    if user:
+        child = get_child(user)
+        child.stdin.write((json.dumps(request) + "\n").encode("utf-8"))
+        child.stdin.flush()
+    else:
+        threading.Thread(target=run, args=(request,), daemon=True).start()
+
+for child in children.values():
+    child.stdin.close()
+    child.wait()
+""".replace("BOOTSTRAP", repr(AGENT_BOOTSTRAP))
+
+
+class RemoteAgentError(Exception):
+    pass
+
+
+def spawn_command(host: Host, command: str, user: Optional[str] = None) -> str:
+    """Local shell command running `command` on `host` like `host.run`."""
+    backend = host.backend
+    if user is not None:
+        # Does not depend on the sudo context of the host, which another
+        # thread may be in
+        command = backend.get_sudo_command(command, user)
+    else:
+        command = backend.get_command(command)
+    if backend.NAME == "ansible":
+        # Same resolution as the ansible backend when force_ansible is False
+        target = backend.ansible_runner.get_host(
+            backend.host,
+            ssh_config=backend.ssh_config,
+            ssh_identity_file=backend.ssh_identity_file,
+        )
+        if target is None:
+            raise RemoteAgentError(f"No direct connection to {backend.host}")
+        backend = target.backend
+        command = backend.get_command(command)
+    if backend.NAME == "local":
+        return command
+    if backend.NAME in ("ssh", "safe-ssh"):
+        cmd, cmd_args = backend._build_ssh_command(command)
+        return backend.quote(" ".join(cmd), *cmd_args)
+    raise RemoteAgentError(f"Unsupported backend {backend.NAME}")
+
+
+class RemoteAgent:
+    """Long-lived process on a host running the commands it receives.
+
+    Commands are sent as JSON lines over the stdin of a single ssh session
+    and run concurrently by the agent. Commands of another user are run by a
+    child agent started once per user with sudo.
+    """
+
+    def __init__(self, host: Host):
+        self.host = host
+        self.ids = itertools.count()
+        self.pending: Dict[int, dict] = {}
+        self.write_lock = threading.Lock()
+        self.nb_commands = 0
+        self.total_time = 0.0
+        self.process = subprocess.Popen(
+            spawn_command(host, f"python3 -u -c {shlex.quote(AGENT_BOOTSTRAP)}"),
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        source = AGENT_SOURCE.encode("utf-8")
+        self.process.stdin.write(str(len(source)).encode("ascii") + b"\n" + source)
+        self.process.stdin.flush()
+        if self.process.stdout.readline() != b"ready\n":
+            raise RemoteAgentError(f"Agent failed to start on {host}")
+        self.reader = threading.Thread(target=self._read_responses, daemon=True)
+        self.reader.start()
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            response = json.loads(line)
+            pending = self.pending.pop(response["id"])
+            pending["response"] = response
+            pending["event"].set()
+        # The agent exited, wake up every waiting command
+        for pending in list(self.pending.values()):
+            pending["event"].set()
+
+    def run(self, command: str, user: Optional[str] = None) -> CommandResult:
+        request_id = next(self.ids)
+        pending = {"event": threading.Event(), "response": None}
+        self.pending[request_id] = pending
+        request = {"id": request_id, "command": command, "user": user}
+        start = time.perf_counter()
+        with self.write_lock:
+            try:
+                self.process.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                pass
+        pending["event"].wait()
+        response = pending["response"]
+        if response is None:
+            raise RemoteAgentError(f"Agent exited while running {command}")
+        self.nb_commands += 1
+        self.total_time += time.perf_counter() - start
+        backend = self.host.backend
+        return backend.result(
+            response["rc"],
+            backend.encode(command),
+            base64.b64decode(response["stdout"]),
+            base64.b64decode(response["stderr"]),
+        )
+
+    def close(self):
+        if self.nb_commands:
+            logger.info(
+                "Remote agent on %s ran %s commands in %.1fms on average",
+                self.host,
+                self.nb_commands,
+                self.total_time / self.nb_commands * 1000,
+            )
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class AgentHost(Host):
+    """Host running its commands, including those of testinfra modules,
+    through a `RemoteAgent`."""
+
+    def __init__(self, host: Host, agent: RemoteAgent):
+        super().__init__(host.backend)
+        self.agent = agent
+        self.sudo_user: Optional[str] = None
+
+    @contextlib.contextmanager
+    def sudo(self, user: Optional[str] = None):
+        previous_user = self.sudo_user
+        self.sudo_user = user or "root"
+        try:
+            yield
+        finally:
+            self.sudo_user = previous_user
+
+    def run(self, command: str, *args: str, **kwargs: Any) -> CommandResult:
+        return self.agent.run(self.backend.quote(command, *args), self.sudo_user)
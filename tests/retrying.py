@@ -0,0 +1,142 @@
+import dataclasses
+import functools
+import logging
+import random
+import time
+from typing import Callable, Dict, Optional, Type
+
+import pytest
+
+logger = logging.getLogger("testinfra")
+
+# "pytest.fail" raises an exception which does not inherit from "Exception"
+# and is used by the fixtures to report HTTP errors which are worth retrying
+RETRIABLE_EXCEPTIONS = (Exception, pytest.fail.Exception)
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    initial_sleep: float = 1
+    backoff: float = 2
+    max_sleep: float = 10
+    # Random part of each sleep, as a ratio of the sleep
+    jitter: float = 0.2
+
+    def sleep_time(self, attempt: int) -> float:
+        sleep_time = min(self.initial_sleep * self.backoff**attempt, self.max_sleep)
+        return sleep_time * (1 - self.jitter * random.random())
+
+
+class SleepTracker:
+    """Time spent sleeping between retries, since the last report."""
+
+    def __init__(self):
+        self.pending = 0.0
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+        self.pending += seconds
+
+    def pop(self) -> float:
+        pending, self.pending = self.pending, 0.0
+        return pending
+
+
+sleep_tracker = SleepTracker()
+
+
+def retry(
+    func: Optional[Callable] = None,
+    nb_retries: Optional[int] = 6,
+    sleep_time_between_tries: int = 10,
+    deadline: Optional[float] = None,
+    policy: Optional[RetryPolicy] = None,
+    policies: Optional[Dict[Type[BaseException], Optional[RetryPolicy]]] = None,
+    ready: Optional[Callable[[], bool]] = None,
+):
+    """Call `func` until it succeeds, `nb_retries` times or more.
+
+    Sleeps grow exponentially from `policy.initial_sleep` up to
+    `sleep_time_between_tries`. As these sleeps are shorter, the attempts go
+    on until `(nb_retries - 1) * sleep_time_between_tries` seconds, the wait
+    of the former fixed sleeps, have passed as well. `deadline` instead stops
+    the retries once that many seconds have passed, `nb_retries=None` only
+    keeps the deadline.
+
+    `policies` maps exception types to the policy used when they are raised,
+    a `None` policy raises the exception right away. Exceptions matching no
+    policy use `policy` if they are in `RETRIABLE_EXCEPTIONS`.
+
+    `ready` is polled with the same backoff before each new attempt, so that
+    `func` is only called again once the service is ready.
+    """
+    if func is None:
+        return functools.partial(
+            retry,
+            nb_retries=nb_retries,
+            sleep_time_between_tries=sleep_time_between_tries,
+            deadline=deadline,
+            policy=policy,
+            policies=policies,
+            ready=ready,
+        )
+    if policy is None:
+        policy = RetryPolicy(max_sleep=sleep_time_between_tries)
+
+    def get_policy(exception: BaseException) -> Optional[RetryPolicy]:
+        for exception_type, exception_policy in (policies or {}).items():
+            if isinstance(exception, exception_type):
+                return exception_policy
+        if isinstance(exception, RETRIABLE_EXCEPTIONS):
+            return policy
+        return None
+
+    def wait(
+        attempt: int, current_policy: RetryPolicy, end_time: Optional[float]
+    ) -> bool:
+        sleep_time = current_policy.sleep_time(attempt)
+        if end_time is not None and time.monotonic() + sleep_time > end_time:
+            return False
+        sleep_tracker.sleep(sleep_time)
+        return True
+
+    def exhausted(nb_calls: int, start_time: float) -> bool:
+        if nb_retries is None or nb_calls < nb_retries:
+            return False
+        if deadline is not None:
+            return True
+        min_wait = (nb_retries - 1) * sleep_time_between_tries
+        return time.monotonic() - start_time >= min_wait
+
+    @functools.wraps(func)
+    def retry_func(*args, **kwargs):
+        start_time = time.monotonic()
+        end_time = None if deadline is None else start_time + deadline
+        # `attempt` sets the backoff, it also grows while `ready` is polled
+        attempt = nb_calls = 0
+        while True:
+            nb_calls += 1
+            try:
+                return func(*args, **kwargs)
+            except BaseException as exception:
+                current_policy = get_policy(exception)
+                if (
+                    current_policy is None
+                    or exhausted(nb_calls, start_time)
+                    or not wait(attempt, current_policy, end_time)
+                ):
+                    raise
+                logger.info(
+                    "Retrying %s after attempt %s failed: %r",
+                    func.__name__,
+                    nb_calls,
+                    exception,
+                )
+                attempt += 1
+                if ready is not None:
+                    while not ready():
+                        if not wait(attempt, current_policy, end_time):
+                            raise
+                        attempt += 1
+
+    return retry_func
@@ -0,0 +1,342 @@
+import importlib.metadata
+import json
+import logging
+import shlex
+import subprocess
+import threading
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional
+
+import pytest
+from testinfra.host import Host
+from xdist.scheduler import LoadScheduling
+from xdist.workermanage import WorkerController
+
+from .remote_agent import spawn_command
+
+logger = logging.getLogger("testinfra")
+
+RESOURCES_MARKER = "resources"
+CAPACITY_REFRESH_INTERVAL = 10
+RM_METRICS_PATH = "/ws/v1/cluster/metrics"
+# CapacityScheduling relies on internals of LoadScheduling, its pending,
+# node2pending and _send_tests, which are only checked with these versions
+XDIST_SUPPORTED_VERSIONS = ((3, 8),)
+
+
+class CapacityError(Exception):
+    pass
+
+
+class Resources(NamedTuple):
+    """YARN resources and services used by a test, memory is in MB."""
+
+    vcores: int = 0
+    memory: int = 0
+    services: FrozenSet[str] = frozenset()
+
+    def to_json(self) -> dict:
+        return {
+            "vcores": self.vcores,
+            "memory": self.memory,
+            "services": sorted(self.services),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Resources":
+        return cls(data["vcores"], data["memory"], frozenset(data["services"]))
+
+    def combine(self, other: "Resources") -> "Resources":
+        # Tests sent to the same worker run one after the other
+        return Resources(
+            max(self.vcores, other.vcores),
+            max(self.memory, other.memory),
+            self.services | other.services,
+        )
+
+
+def item_resources(item: pytest.Item) -> Optional[Resources]:
+    marker = item.get_closest_marker(RESOURCES_MARKER)
+    if marker is None:
+        return None
+    return Resources(
+        marker.kwargs.get("vcores", 0),
+        marker.kwargs.get("memory", 0),
+        frozenset(marker.kwargs.get("services", ())),
+    )
+
+
+def write_items_resources(items: List[pytest.Item], path: Path):
+    """Resources of the collected items for the controller, which does not
+    collect the tests itself."""
+    resources = {}
+    for item in items:
+        needs = item_resources(item)
+        if needs is not None:
+            resources[item.nodeid] = needs.to_json()
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(resources))
+    tmp_path.replace(path)
+
+
+class YarnCapacity:
+    """Resources of YARN the tests can use, read in the background from the
+    cluster metrics of the ResourceManager.
+
+    The containers allocated while no test holding resources is running
+    belong to other applications, they are subtracted from the total
+    capacity of the cluster.
+    """
+
+    def __init__(
+        self,
+        host: Host,
+        rm_urls: List[str],
+        user: str,
+        realm: str,
+        in_use: Callable[[], bool],
+        interval: float = CAPACITY_REFRESH_INTERVAL,
+    ):
+        self.host = host
+        self.rm_urls = rm_urls
+        self.user = user
+        self.realm = realm
+        self.in_use = in_use
+        self.interval = interval
+        self.ccache = f"FILE:/tmp/pytest_capacity_krb5cc_{user}"
+        self.budget: Optional[Resources] = None
+        self.others = Resources()
+        self.stop_event = threading.Event()
+        self.refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+
+    def start(self):
+        try:
+            self.refresh()
+        except CapacityError as error:
+            logger.warning("Capacity of the cluster unknown: %s", error)
+        self.refresher.start()
+
+    def _run(self, command: str) -> str:
+        # Own credential cache so the tickets of the workers are not touched
+        command = (
+            f"export KRB5CCNAME={self.ccache}; klist -s"
+            f" || kinit -kt /home/{self.user}/{self.user}.keytab"
+            f" {self.user}@{self.realm} && {command}"
+        )
+        process = subprocess.run(
+            spawn_command(self.host, command, self.user),
+            shell=True,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise CapacityError(process.stderr.strip())
+        return process.stdout
+
+    def read_metrics(self) -> dict:
+        errors = []
+        for rm_url in self.rm_urls:
+            # The standby ResourceManager redirects to the active one
+            url = shlex.quote(f"{rm_url}{RM_METRICS_PATH}")
+            try:
+                output = self._run(f"curl -sSfL --negotiate -u : {url}")
+                return json.loads(output)["clusterMetrics"]
+            except (CapacityError, ValueError, KeyError) as error:
+                errors.append(f"{rm_url}: {error}")
+        raise CapacityError("\n".join(errors))
+
+    def refresh(self):
+        idle = not self.in_use()
+        metrics = self.read_metrics()
+        if idle and not self.in_use():
+            self.others = Resources(
+                metrics["allocatedVirtualCores"], metrics["allocatedMB"]
+            )
+        self.budget = Resources(
+            max(0, metrics["totalVirtualCores"] - self.others.vcores),
+            max(0, metrics["totalMB"] - self.others.memory),
+        )
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.refresh()
+            except CapacityError as error:
+                logger.warning("Unable to refresh the cluster capacity: %s", error)
+
+    def close(self):
+        self.stop_event.set()
+        if self.refresher.is_alive():
+            self.refresher.join()
+        try:
+            self._run("kdestroy")
+        except CapacityError:
+            pass
+
+
+def check_xdist_version():
+    version = importlib.metadata.version("pytest-xdist")
+    major_minor = tuple(int(part) for part in version.split(".")[:2])
+    if major_minor not in XDIST_SUPPORTED_VERSIONS:
+        raise pytest.UsageError(
+            f"--capacity-scheduling does not support pytest-xdist {version}, see"
+            " XDIST_SUPPORTED_VERSIONS in tests/scheduling.py"
+        )
+
+
+class CapacityScheduling(LoadScheduling):
+    """Load scheduling admitting the tests marked with the resources they
+    need only if they fit in the capacity of the cluster.
+
+    Unmarked tests are sent as usual. A marked test is held back while the
+    tests already sent to the other workers use too much of the capacity or
+    one of its services, except when no other worker holds YARN resources
+    so that a test bigger than the cluster still runs, alone.
+    """
+
+    def __init__(
+        self,
+        config: pytest.Config,
+        log,
+        resources_dir: Path,
+        capacity: Optional[YarnCapacity] = None,
+    ):
+        super().__init__(config, log)
+        self.resources_dir = resources_dir
+        self.capacity = capacity
+        self.items_resources: Optional[List[Optional[Resources]]] = None
+        self.delayed = set()
+        self.peak = Resources()
+
+    def load_items_resources(self) -> List[Optional[Resources]]:
+        resources = {}
+        for path in self.resources_dir.glob("*.json"):
+            resources = json.loads(path.read_text())
+            break
+        return [
+            Resources.from_json(resources[nodeid]) if nodeid in resources else None
+            for nodeid in self.collection
+        ]
+
+    def node_reservation(self, indices: List[int]) -> Resources:
+        reservation = Resources()
+        for index in indices:
+            needs = self.items_resources[index]
+            if needs is not None:
+                reservation = reservation.combine(needs)
+        return reservation
+
+    def in_use(self) -> bool:
+        return any(
+            reservation.vcores or reservation.memory
+            for reservation in self.reservations().values()
+        )
+
+    def reservations(self) -> Dict[WorkerController, Resources]:
+        if self.items_resources is None:
+            return {}
+        return {
+            node: self.node_reservation(indices)
+            for node, indices in list(self.node2pending.items())
+        }
+
+    def admissible(
+        self,
+        node: WorkerController,
+        needs: Optional[Resources],
+        reservations: Dict[WorkerController, Resources],
+    ) -> bool:
+        if needs is None:
+            return True
+        others = [r for other, r in reservations.items() if other is not node]
+        if any(needs.services & reservation.services for reservation in others):
+            return False
+        if not any(reservation.vcores or reservation.memory for reservation in others):
+            return True
+        own = reservations[node].combine(needs)
+        budget = self.capacity.budget if self.capacity is not None else None
+        if budget is None:
+            return False
+        return (
+            own.vcores + sum(r.vcores for r in others) <= budget.vcores
+            and own.memory + sum(r.memory for r in others) <= budget.memory
+        )
+
+    def _send_tests(self, node: WorkerController, num: int) -> None:
+        if self.items_resources is None:
+            self.items_resources = self.load_items_resources()
+        reservations = self.reservations()
+        selected = []
+        for index in self.pending:
+            if len(selected) >= num:
+                break
+            needs = self.items_resources[index]
+            if self.admissible(node, needs, reservations):
+                selected.append(index)
+                if needs is not None:
+                    reservations[node] = reservations[node].combine(needs)
+            else:
+                self.delayed.add(index)
+        own = reservations.get(node, Resources())
+        if not selected and len(self.node2pending[node]) == 1 and own != Resources():
+            # A worker only runs a test once it has received the next one,
+            # the test it is holding would otherwise keep its resources
+            # without ever running
+            selected.append(self.follow_up(node, reservations))
+        if not selected:
+            return
+        for index in selected:
+            self.pending.remove(index)
+        self.node2pending[node].extend(selected)
+        node.send_runtest_some(selected)
+        reservations = self.reservations().values()
+        self.peak = Resources(
+            max(self.peak.vcores, sum(r.vcores for r in reservations)),
+            max(self.peak.memory, sum(r.memory for r in reservations)),
+        )
+
+    def follow_up(
+        self, node: WorkerController, reservations: Dict[WorkerController, Resources]
+    ) -> int:
+        """Pending test to run after the last one held by `node`, preferably
+        one fitting in what it already reserved."""
+        own = reservations[node]
+        others = [r for other, r in reservations.items() if other is not node]
+        candidates = [
+            (index, self.items_resources[index] or Resources())
+            for index in self.pending
+        ]
+        candidates = [
+            (index, needs)
+            for index, needs in candidates
+            if not any(needs.services & reservation.services for reservation in others)
+        ]
+        for index, needs in candidates:
+            if needs.vcores <= own.vcores and needs.memory <= own.memory:
+                return index
+        return candidates[0][0] if candidates else self.pending[0]
+
+    def mark_test_complete(
+        self, node: WorkerController, item_index: int, duration: float = 0
+    ) -> None:
+        super().mark_test_complete(node, item_index, duration)
+        if self.items_resources[item_index] is None:
+            return
+        # The resources released can admit tests held back for the other workers
+        for other in list(self.node2pending):
+            if other is not node:
+                self.check_schedule(other)
+
+    def summary(self) -> List[str]:
+        budget = self.capacity.budget if self.capacity is not None else None
+        lines = [
+            f"{len(self.delayed)} test(s) held back for lack of capacity,"
+            f" peak reservation {self.peak.vcores} vcores {self.peak.memory} MB"
+        ]
+        if budget is not None:
+            lines.append(
+                f"capacity of the cluster: {budget.vcores} vcores {budget.memory} MB"
+            )
+        else:
+            lines.append("capacity of the cluster unknown, one YARN test at a time")
+        return lines
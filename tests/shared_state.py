@@ -0,0 +1,192 @@
+# Shared state between pytest-xdist workers used by the "lock" fixture
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Generator, Tuple
+
+from filelock import FileLock
+
+
+class ConcurrentUpdateError(Exception):
+    pass
+
+
+class JsonSharedState:
+    """One JSON file per namespace, rewritten on every update."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def _path(self, namespace: str) -> str:
+        return os.path.join(self.root_dir, f"{namespace}.json")
+
+    @contextlib.contextmanager
+    def mutex(self, namespace: str) -> Generator[None, None, None]:
+        with FileLock(f"{self._path(namespace)}.lock"):
+            yield
+
+    def load(self, namespace: str) -> Tuple[int, dict]:
+        try:
+            with open(self._path(namespace), "r") as fd:
+                data = json.load(fd)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0, {}
+        return data.pop("_version", 0), data
+
+    def compare_and_set(self, namespace: str, version: int, data: dict) -> bool:
+        current_version, _ = self.load(namespace)
+        if current_version != version:
+            return False
+        path = self._path(namespace)
+        with open(f"{path}.tmp", "w") as fd:
+            json.dump({**data, "_version": version + 1}, fd)
+        os.replace(f"{path}.tmp", path)
+        return True
+
+
+class SqliteSharedState:
+    """All namespaces in one SQLite database in WAL mode.
+
+    Readers never block writers in WAL mode and each update only rewrites
+    the row of its namespace, guarded by its version number. The critical
+    section of a namespace is still serialized by a lock file dedicated to
+    that namespace, so workers using different namespaces never wait for
+    each other.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self.db_path = os.path.join(root_dir, "shared_state.sqlite")
+        self._local = threading.local()
+        with FileLock(f"{self.db_path}.lock"):
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state ("
+                " namespace TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " data TEXT NOT NULL"
+                ")"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextlib.contextmanager
+    def mutex(self, namespace: str) -> Generator[None, None, None]:
+        with FileLock(os.path.join(self.root_dir, f"{namespace}.lock")):
+            yield
+
+    def load(self, namespace: str) -> Tuple[int, dict]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT version, data FROM shared_state WHERE namespace = ?",
+                (namespace,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return 0, {}
+        return row[0], json.loads(row[1])
+
+    def compare_and_set(self, namespace: str, version: int, data: dict) -> bool:
+        connection = self._connection()
+        if version == 0:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO shared_state (namespace, version, data)"
+                " VALUES (?, 1, ?)",
+                (namespace, json.dumps(data)),
+            )
+        else:
+            cursor = connection.execute(
+                "UPDATE shared_state SET version = version + 1, data = ?"
+                " WHERE namespace = ? AND version = ?",
+                (json.dumps(data), namespace, version),
+            )
+        return cursor.rowcount == 1
+
+
+SHARED_STATE_BACKENDS = {
+    "json": JsonSharedState,
+    "sqlite": SqliteSharedState,
+}
+
+
+def add_unique(values: list, value: str):
+    if value not in values:
+        values.append(value)
+
+
+@contextlib.contextmanager
+def shared_state_context(
+    backend, namespace: str, worker_id: str, teardown: bool = False
+) -> Generator[Dict, None, None]:
+    with backend.mutex(namespace):
+        version, data = backend.load(namespace)
+        workers = data.setdefault("workers", {})
+        # Bookkeeping only keeps one entry per worker so its size does not
+        # grow with the number of calls
+        if teardown:
+            workers.pop(worker_id, None)
+            add_unique(data.setdefault("workers_teardown", []), worker_id)
+        else:
+            workers[worker_id] = True
+            add_unique(data.setdefault("workers_used", []), worker_id)
+
+        data["last_worker"] = not workers
+        if data["last_worker"]:
+            add_unique(data.setdefault("workers_last", []), worker_id)
+        yield data
+        if not backend.compare_and_set(namespace, version, data):
+            raise ConcurrentUpdateError(
+                f"Shared state {namespace} was updated outside of its lock"
+            )
+
+
+def _benchmark_worker(args: tuple) -> int:
+    backend_name, root_dir, worker_id, nb_namespaces, nb_calls = args
+    backend = SHARED_STATE_BACKENDS[backend_name](root_dir)
+    for i in range(nb_calls):
+        namespace = f"namespace_{i % nb_namespaces}"
+        with shared_state_context(backend, namespace, worker_id) as data:
+            data["counter"] = data.get("counter", 0) + 1
+    return nb_calls
+
+
+def benchmark(
+    workers: Tuple[int, ...] = (1, 2, 4, 8, 16),
+    nb_namespaces: int = 8,
+    nb_calls: int = 500,
+):
+    import multiprocessing
+    import tempfile
+    import time
+
+    print(f"{'backend':<8} {'workers':>7} {'calls/s':>10}")
+    for backend_name in SHARED_STATE_BACKENDS:
+        for nb_workers in workers:
+            with tempfile.TemporaryDirectory() as root_dir:
+                SHARED_STATE_BACKENDS[backend_name](root_dir)
+                tasks = [
+                    (backend_name, root_dir, f"gw{i}", nb_namespaces, nb_calls)
+                    for i in range(nb_workers)
+                ]
+                with multiprocessing.Pool(nb_workers) as pool:
+                    start = time.perf_counter()
+                    total_calls = sum(pool.map(_benchmark_worker, tasks))
+                    duration = time.perf_counter() - start
+            print(f"{backend_name:<8} {nb_workers:>7} {total_calls / duration:>10.0f}")
+
+
+# Micro-benchmark of the lock throughput: python -m tests.shared_state
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,206 @@
+# ResourceManager REST API documentation https://hadoop.apache.org/docs/stable/hadoop-yarn/hadoop-yarn-site/ResourceManagerRest.html
+import json
+import math
+import shlex
+from typing import Any, Dict, List, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from .http_client import HttpClient
+from .scheduling import Resources
+
+DEFAULT_QUEUE = "default"
+EXECUTOR_CORES = 2
+# The tests used to ask for executors of 2 cores and 5G
+EXECUTOR_MEMORY_PER_CORE = 2560
+MIN_EXECUTOR_MEMORY = 1024
+EXECUTOR_MEMORY_STEP = 512
+# spark.executor.memoryOverhead defaults
+MEMORY_OVERHEAD_RATIO = 0.1
+MIN_MEMORY_OVERHEAD = 384
+# yarn.scheduler.minimum-allocation-mb default, containers are rounded up to it
+YARN_MIN_ALLOCATION = 1024
+# Application master of the driver in client mode
+AM_RESOURCES = Resources(1, 1024)
+# Size of the splits of the files read by Spark
+BYTES_PER_TASK = 128 * 1024 * 1024
+# Upper bound of the layouts of the tests: 3 executors of 2 vcores and 5G plus
+# their overhead, and the application master, rounded up to the 1G minimum
+# allocation of YARN
+JOB_RESOURCES = Resources(7, 19456)
+# Executors of the long-lived Livy sessions are released after this idle time
+DYNAMIC_ALLOCATION_IDLE_TIMEOUT = "60s"
+
+
+class ResourceManagerError(Exception):
+    pass
+
+
+class ExecutorLayout(NamedTuple):
+    num_executors: int
+    executor_cores: int
+    # MB
+    executor_memory: int
+
+    @property
+    def parallelism(self) -> int:
+        return self.num_executors * self.executor_cores
+
+    def spark_submit_options(self) -> str:
+        return (
+            f"--num-executors {self.num_executors}"
+            f" --executor-cores {self.executor_cores}"
+            f" --executor-memory {self.executor_memory}m"
+        )
+
+    def livy_conf(self, dynamic_allocation: bool = False) -> dict:
+        """Livy session request, with `dynamic_allocation` the executors are
+        only started while statements run, up to `num_executors`."""
+        conf = {
+            "executorCores": self.executor_cores,
+            "executorMemory": f"{self.executor_memory}m",
+        }
+        if not dynamic_allocation:
+            return {**conf, "numExecutors": self.num_executors}
+        conf["conf"] = {
+            "spark.dynamicAllocation.enabled": "true",
+            # Executors are released without an external shuffle service
+            "spark.dynamicAllocation.shuffleTracking.enabled": "true",
+            "spark.dynamicAllocation.shuffleTracking.timeout": (
+                DYNAMIC_ALLOCATION_IDLE_TIMEOUT
+            ),
+            "spark.dynamicAllocation.minExecutors": "0",
+            "spark.dynamicAllocation.maxExecutors": str(self.num_executors),
+            "spark.dynamicAllocation.executorIdleTimeout": (
+                DYNAMIC_ALLOCATION_IDLE_TIMEOUT
+            ),
+        }
+        return conf
+
+
+def container_memory(executor_memory: int) -> int:
+    overhead = max(MIN_MEMORY_OVERHEAD, int(executor_memory * MEMORY_OVERHEAD_RATIO))
+    return (
+        math.ceil((executor_memory + overhead) / YARN_MIN_ALLOCATION)
+        * YARN_MIN_ALLOCATION
+    )
+
+
+def compute_layout(
+    nodes: List[Resources],
+    headroom: Optional[Resources] = None,
+    dataset_bytes: Optional[int] = None,
+    max_resources: Optional[Resources] = None,
+) -> ExecutorLayout:
+    """Largest layout whose executors fit in the resources available on the
+    NodeManagers, in the headroom of the queue and in `max_resources`, with
+    no more executors than the number of splits of the dataset need."""
+    if not nodes:
+        raise ResourceManagerError("No running NodeManager")
+    cores = max(1, min(EXECUTOR_CORES, max(node.vcores for node in nodes)))
+    memory = cores * EXECUTOR_MEMORY_PER_CORE
+    biggest_node = max(node.memory for node in nodes)
+    while container_memory(memory) > biggest_node and memory > MIN_EXECUTOR_MEMORY:
+        memory -= EXECUTOR_MEMORY_STEP
+    container = container_memory(memory)
+
+    # The application master is started first, on the node with the most memory
+    nodes = sorted(nodes, key=lambda node: node.memory, reverse=True)
+    nodes[0] = Resources(
+        nodes[0].vcores - AM_RESOURCES.vcores, nodes[0].memory - AM_RESOURCES.memory
+    )
+    num_executors = sum(
+        max(0, min(node.vcores // cores, node.memory // container)) for node in nodes
+    )
+    for bound in (headroom, max_resources):
+        if bound is not None:
+            num_executors = min(
+                num_executors,
+                (bound.vcores - AM_RESOURCES.vcores) // cores,
+                (bound.memory - AM_RESOURCES.memory) // container,
+            )
+    if dataset_bytes is not None:
+        nb_tasks = max(1, math.ceil(dataset_bytes / BYTES_PER_TASK))
+        num_executors = min(num_executors, math.ceil(nb_tasks / cores))
+    # A single executor waits for resources rather than failing the test
+    return ExecutorLayout(max(1, num_executors), cores, memory)
+
+
+def find_queue(queue: dict, name: str) -> Optional[dict]:
+    if queue.get("queueName") == name:
+        return queue
+    for child in (queue.get("queues") or {}).get("queue", []):
+        found = find_queue(child, name)
+        if found is not None:
+            return found
+    return None
+
+
+class ResourceManagerClient:
+    """ResourceManager REST client acting as `user` through `curl` on the
+    edge host, the standby ResourceManager redirects to the active one."""
+
+    def __init__(
+        self,
+        http_client: HttpClient,
+        user: str,
+        urls: List[str],
+        curl_opts: str = "--negotiate --user : --location",
+    ):
+        self.http_client = http_client
+        self.user = user
+        self.urls = urls
+        self.curl_opts = curl_opts
+
+    def get(self, path: str) -> dict:
+        errors = []
+        for url in self.urls:
+            with self.http_client.host.sudo(self.user):
+                response = self.http_client.request(
+                    f"{self.curl_opts} {shlex.quote(url + path)}"
+                )
+            if response["http_status"] == 200:
+                return json.loads(response["command"].stdout)
+            errors.append(f"{url}: {response['command']}")
+        raise ResourceManagerError(f"GET {path} failed\n" + "\n".join(errors))
+
+    def applications(self, **filters: Any) -> List[dict]:
+        apps = self.get(f"/ws/v1/cluster/apps?{urlencode(filters)}")["apps"] or {}
+        return apps.get("app", [])
+
+    def cluster_metrics(self) -> Dict[str, int]:
+        return self.get("/ws/v1/cluster/metrics")["clusterMetrics"]
+
+    def available_nodes(self) -> List[Resources]:
+        nodes = self.get("/ws/v1/cluster/nodes?states=RUNNING")["nodes"] or {}
+        return [
+            Resources(node["availableVirtualCores"], node["availMemoryMB"])
+            for node in nodes.get("node", [])
+        ]
+
+    def queue_headroom(self, name: str = DEFAULT_QUEUE) -> Optional[Resources]:
+        """Resources the queue can still get, `None` if the scheduler does not
+        report the capacity of its queues."""
+        scheduler = self.get("/ws/v1/cluster/scheduler")["scheduler"]["schedulerInfo"]
+        queue = find_queue(scheduler, name)
+        if queue is None or "absoluteMaxCapacity" not in queue:
+            return None
+        metrics = self.cluster_metrics()
+        max_ratio = queue["absoluteMaxCapacity"] / 100
+        used = queue.get("resourcesUsed", {})
+        return Resources(
+            int(metrics["totalVirtualCores"] * max_ratio) - used.get("vCores", 0),
+            int(metrics["totalMB"] * max_ratio) - used.get("memory", 0),
+        )
+
+    def executor_layout(
+        self,
+        dataset_bytes: Optional[int] = None,
+        max_resources: Optional[Resources] = JOB_RESOURCES,
+        queue: str = DEFAULT_QUEUE,
+    ) -> ExecutorLayout:
+        return compute_layout(
+            self.available_nodes(),
+            self.queue_headroom(queue),
+            dataset_bytes,
+            max_resources,
+        )
@@ -0,0 +1,25 @@
+import math
+from typing import Dict, Iterable, Sequence
+
+
+def percentiles(
+    values: Iterable[float], quantiles: Sequence[int] = (50, 95, 99)
+) -> Dict[str, float]:
+    # Nearest-rank percentiles
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        f"p{quantile}": values[max(math.ceil(quantile / 100 * len(values)) - 1, 0)]
+        for quantile in quantiles
+    }
+
+
+def histogram(values: Iterable[float], bounds: Sequence[float]) -> Dict[str, int]:
+    # Cumulative buckets, like the histograms of Prometheus
+    values = list(values)
+    buckets = {
+        f"le_{bound:g}": sum(value <= bound for value in values) for bound in bounds
+    }
+    buckets["le_inf"] = len(values)
+    return buckets
@@ -1,18 +1,22 @@
 # HBase REST documentation https://hbase.apache.org/book.html#_rest
-import base64
-import hashlib
-import io
 import json
-import time
 from typing import Callable, Generator, List
 
 import pytest
 from testinfra import host
 
+from .benchmark import Benchmark
 from .conftest import USERS, retry
+from .datasets import Dataset
+from .hbase_load import HBaseRestLoader, salted_row_key, to_base64
+from .hbase_scan import SCAN_FILTERS, HBaseRestScanner
+from .http_client import HttpClient
 
 testinfra_hosts = ["edge"]
 
+# Cells per page of the scanners, the rows of the table have 2 cells
+SCAN_BATCHES = (10, 100, 1000)
+
 
 def hbase_table_from_user(user: str):
     return f"{user}_table_hbase".upper()
@@ -55,58 +59,21 @@ def hbase_ranger_policy(
     ranger_policy("hbase_pytest", "hbase-tdp", resources, policyItems, nb_region_server)
 
 
-def to_base64(value):
-    return str(base64.b64encode(bytes(value, "utf-8")), "ascii")
-
-
 def create_hbase_dataset(
     host: host.Host,
     user: str,
     hbase_table: str,
-    dataset_weight: List[dict],
-    curl: Callable,
+    dataset_weight: Dataset,
     hbase_rest: str,
 ) -> int:
-    nb_lines = len(dataset_weight)
-    row_ids = [
-        hashlib.sha256(bytes(str(time.time()), "utf-8")).hexdigest()
-        + "_"
-        + str(data["id"])
-        for data in dataset_weight
-    ]
-
-    weight_column = to_base64("car:weight")
-    category_column = to_base64("car:category")
-    data = {
-        "Row": [
-            {
-                "key": to_base64(row_id),
-                "Cell": [
-                    {
-                        "column": weight_column,
-                        "$": to_base64(str(data["weight"])),
-                    },
-                    {
-                        "column": category_column,
-                        "$": to_base64(data["category"]),
-                    },
-                ],
-            }
-            for row_id, data in zip(row_ids, dataset_weight)
-        ]
-    }
-    curl_args = [
-        "--negotiate",
-        "--user :",
-        "--header 'Accept: application/json'",
-        "--header 'Content-Type: application/json'",
-        "--request PUT",
-        f"--data '{json.dumps(data)}'",
-        f"{hbase_rest}/{hbase_table}/fakerow",
-    ]
-    with host.sudo(user):
-        curl(" ".join(curl_args))
-    return nb_lines
+    loader = HBaseRestLoader(
+        host,
+        user,
+        hbase_rest,
+        hbase_table,
+        {"car:weight": "weight", "car:category": "category"},
+    )
+    return loader.load(dataset_weight)["rows"]
 
 
 @pytest.fixture(scope="module")
@@ -116,7 +83,7 @@ def setup_hbase_table(
     hbase_table: str,
     lock: Callable,
     hbase_ranger_policy: None,
-    dataset_weight: List[dict],
+    dataset_weight: Dataset,
     curl: Callable,
     hbase_rest: str,
 ) -> Generator[dict, None, None]:
@@ -147,7 +114,7 @@ def setup_hbase_table(
                 create_table()
                 data["hbase_table_created"] = True
             nb_lines = create_hbase_dataset(
-                host, user, hbase_table, dataset_weight, curl, hbase_rest
+                host, user, hbase_table, dataset_weight, hbase_rest
             )
             data["hbase_nb_lines"] = nb_lines
         else:
@@ -170,52 +137,61 @@ def setup_hbase_table(
 
 
 def test_scanning_with_filter_works(
-    host: host.Host,
     user: str,
     setup_hbase_table: dict,
     hbase_rest: str,
-    curl: Callable,
+    http_client: HttpClient,
 ):
-    hbase_table = setup_hbase_table["table_name"]
-    nb_lines = setup_hbase_table["nb_lines"]
-    scanner_args = {
-        "batch": nb_lines,
-        "filter": json.dumps(
-            {
-                "op": "EQUAL",
-                "type": "RowFilter",
-                "comparator": {"value": "_150", "type": "SubstringComparator"},
-            }
-        ),
-    }
-    curl_args = [
-        "--negotiate",
-        "--user :",
-        "--header 'Accept: application/json'",
-        "--header 'Content-Type: application/json'",
-    ]
+    scanner = HBaseRestScanner(
+        http_client,
+        user,
+        hbase_rest,
+        setup_hbase_table["table_name"],
+        batch=SCAN_BATCHES[0],
+        row_filter={
+            "op": "EQUAL",
+            "type": "RowFilter",
+            "comparator": {
+                "value": to_base64(salted_row_key(150).encode()),
+                "type": "BinaryComparator",
+            },
+        },
+    )
+    rows = list(scanner.rows())
+    assert [row.key for row in rows] == [salted_row_key(150).encode()]
+    assert scanner.scanner_url is None
 
-    curl_data_args = [
-        "--request POST",
-        f"--data '{json.dumps(scanner_args)}'",
-        f"{hbase_rest}/{hbase_table}/scanner",
-    ]
 
-    with host.sudo(user):
-        curl_result = curl(" ".join(curl_args + curl_data_args))
-        for line in io.StringIO(curl_result["command"].stderr).readlines():
-            if "Location:" in line:
-                scanner_uri = line.split(": ")[1].strip()
-                break
-        else:
-            raise ValueError("Pas trouvé d'url location pour le scanner")
-        try:
-            curl_result = curl(" ".join(curl_args + [scanner_uri]))
-            data = json.loads(curl_result["command"].stdout)
-            assert len(data["Row"]) == 1
-        finally:
-            # free the scanner
-            curl(" ".join(curl_args + ["--request DELETE", scanner_uri]))
+@pytest.mark.parametrize("row_filter", sorted(SCAN_FILTERS))
+@pytest.mark.parametrize("batch", SCAN_BATCHES)
+def test_scanning_sweep(
+    request: pytest.FixtureRequest,
+    user: str,
+    setup_hbase_table: dict,
+    hbase_rest: str,
+    http_client: HttpClient,
+    benchmark: Benchmark,
+    batch: int,
+    row_filter: str,
+):
+    if not request.config.getoption("hbase_scan_sweep"):
+        pytest.skip("--hbase-scan-sweep is not set")
+    scanner = HBaseRestScanner(
+        http_client,
+        user,
+        hbase_rest,
+        setup_hbase_table["table_name"],
+        batch=batch,
+        row_filter=SCAN_FILTERS[row_filter],
+    )
+    report = scanner.scan()
+    benchmark.parameters.update({"batch": batch, "filter": row_filter})
+    benchmark.record("rows_per_second", report["rows_per_second"], "rows/s", True)
+    benchmark.record("pages", report["pages"])
+    for quantile, latency in report["page_latency"].items():
+        benchmark.record(f"page_latency_{quantile}", latency, "s")
+    if SCAN_FILTERS[row_filter] is None:
+        assert report["rows"] == setup_hbase_table["nb_lines"], report
 
 
 def test_hbase_script_is_executed(
@@ -1,18 +1,22 @@
-import textwrap
 from typing import Callable, Generator, List
 
 import pytest
 
-from testinfra import host
-
-from .conftest import retry
+from .benchmark import Benchmark
+from .conftest import USERS, retry
+from .datasets import Dataset
+from .hive_client import HiveSessionPool
 
 testinfra_hosts = ["edge"]
 
 
+def hive_database_from_user(user: str) -> str:
+    return f"{user}_db"
+
+
 @pytest.fixture(scope="module")
 def hive_database(user: str) -> str:
-    return f"{user}_db"
+    return hive_database_from_user(user)
 
 
 @pytest.fixture(scope="module")
@@ -22,131 +26,100 @@ def hive_table(user: str) -> str:
 
 @pytest.fixture(scope="module")
 def hive_ranger_policy(
-    user: str,
-    hive_database: str,
-    ranger_policy: Callable[[str, str, dict, List[dict]], dict],
+    ranger_policies: Callable[[List[dict]], None],
 ):
-    resources = {
-        "database": {"values": [hive_database], "isExcludes": False},
-        "table": {"values": ["*"], "isExcludes": False},
-        "column": {"values": ["*"], "isExcludes": False},
-    }
-    policyItems = [
+    # Policies of every user are created at once
+    policies = [
         {
-            "users": [user],
-            "accesses": [
-                {"isAllowed": True, "type": "select"},
-                {"isAllowed": True, "type": "update"},
-                {"isAllowed": True, "type": "create"},
-                {"isAllowed": True, "type": "drop"},
-                {"isAllowed": True, "type": "alter"},
-                {"isAllowed": True, "type": "index"},
-                {"isAllowed": True, "type": "lock"},
-                {"isAllowed": True, "type": "all"},
-                {"isAllowed": True, "type": "read"},
-                {"isAllowed": True, "type": "write"},
-                {"isAllowed": True, "type": "refresh"},
+            "name": f"{user}_hive_test",
+            "service": "hive-tdp",
+            "resources": {
+                "database": {
+                    "values": [hive_database_from_user(user)],
+                    "isExcludes": False,
+                },
+                "table": {"values": ["*"], "isExcludes": False},
+                "column": {"values": ["*"], "isExcludes": False},
+            },
+            "policyItems": [
+                {
+                    "users": [user],
+                    "accesses": [
+                        {"isAllowed": True, "type": "select"},
+                        {"isAllowed": True, "type": "update"},
+                        {"isAllowed": True, "type": "create"},
+                        {"isAllowed": True, "type": "drop"},
+                        {"isAllowed": True, "type": "alter"},
+                        {"isAllowed": True, "type": "index"},
+                        {"isAllowed": True, "type": "lock"},
+                        {"isAllowed": True, "type": "all"},
+                        {"isAllowed": True, "type": "read"},
+                        {"isAllowed": True, "type": "write"},
+                        {"isAllowed": True, "type": "refresh"},
+                    ],
+                }
             ],
         }
+        for user in USERS
     ]
-    ranger_policy(f"{user}_hive_test", "hive-tdp", resources, policyItems)
+    ranger_policies(policies)
 
 
 @pytest.fixture(scope="module")
 def setup_hive_database(
-    host: host.Host,
     user: str,
+    hive: HiveSessionPool,
     hive_database: str,
     hive_ranger_policy: None,
 ) -> Generator[str, None, None]:
-    with host.sudo(user):
-        retry(
-            lambda: host.check_output(
-                f"beeline -e \"CREATE DATABASE {hive_database} LOCATION '{hive_database}'\""
-            )
-        )()
+    retry(
+        lambda: hive.execute(
+            user, f"CREATE DATABASE {hive_database} LOCATION '{hive_database}'"
+        )
+    )()
     yield hive_database
-    with host.sudo(user):
-        host.check_output(f"beeline -e 'DROP DATABASE {hive_database}'")
+    hive.execute(user, f"DROP DATABASE {hive_database}")
 
 
 @pytest.fixture(scope="module")
 def setup_hive_table(
-    host: host.Host,
     user: str,
+    hive: HiveSessionPool,
+    dataset_weight: Dataset,
     dataset_weight_csv: dict,
     setup_hive_database: str,
     hive_table: str,
-    render_file: Callable,
 ) -> Generator[str, None, None]:
     hive_database = setup_hive_database
     dataset_csv = dataset_weight_csv["hdfs_dir"]
-    create_table_script = """
-    USE {database};
-
-    CREATE EXTERNAL TABLE {table} (
-        id int,
-        weight float,
-        category varchar(9)
+    create_table_script = f"""
+    CREATE EXTERNAL TABLE {hive_database}.{hive_table} (
+        {dataset_weight.hive_columns()}
     )
         ROW FORMAT DELIMITED
         FIELDS TERMINATED BY ","
-        STORED AS TEXTFILE 
+        STORED AS TEXTFILE
         LOCATION "{dataset_csv}"
-        tblproperties("skip.header.line.count"="1");
+        tblproperties("skip.header.line.count"="1")
     """
-    create_table_script = textwrap.dedent(create_table_script)
-    distant_path = f"/tmp/{user}_create_table.hql"
-    render_file(
-        distant_path,
-        create_table_script,
-        {
-            "database": hive_database,
-            "table": hive_table,
-            "dataset_csv": dataset_csv,
-        },
-        owner=user,
-        group=user,
-        permissions=0o644,
-    )
-    with host.sudo(user):
-        host.check_output(f"beeline -f '{distant_path}'")
+    hive.execute(user, create_table_script)
     yield hive_table
-    with host.sudo(user):
-        host.check_output(
-            f"beeline -e 'use {hive_database}' -e 'DROP TABLE {hive_table}'"
-        )
+    hive.execute(user, f"DROP TABLE {hive_database}.{hive_table}")
 
 
 def test_hive_csv_script_is_executed(
-    host: host.Host,
     user: str,
+    hive: HiveSessionPool,
     dataset_weight_csv: dict,
     setup_hive_database: str,
     setup_hive_table: str,
-    render_file: Callable,
+    benchmark: Benchmark,
 ):
     nb_lines = dataset_weight_csv["nb_lines"]
     hive_database = setup_hive_database
     hive_table = setup_hive_table
-    script = """
-    USE {database};
-
-    SELECT COUNT(*) FROM {table};
-    """
-    script = textwrap.dedent(script)
-    script_path = f"/tmp/{user}_script.hql"
-    render_file(
-        script_path,
-        script,
-        {
-            "database": hive_database,
-            "table": hive_table,
-        },
-        owner=user,
-        group=user,
-        permissions=0o644,
-    )
-    with host.sudo(user):
-        stdout = host.check_output(f"beeline -f '{script_path}'")
-        assert f"{nb_lines}" in stdout
+    with hive.session(user) as session:
+        session.execute(f"USE {hive_database}")
+        with benchmark.timer("count", nb_items=nb_lines):
+            result = session.execute(f"SELECT COUNT(*) FROM {hive_table}")
+    assert result.rows == [(nb_lines,)], result
@@ -0,0 +1,128 @@
+import time
+from typing import Callable, Dict, Generator, List
+
+import pytest
+
+from .benchmark import Benchmark
+from .conftest import USERS, retry
+from .datasets import Dataset
+from .hive_client import HiveSessionPool
+from .spark_layout import ResourceManagerClient
+from .tpcds import (
+    QUERIES,
+    SESSION_SETTINGS,
+    create_table_statement,
+    star_schema,
+    tez_applications,
+    yarn_usage_since,
+)
+
+testinfra_hosts = ["edge"]
+
+# The YARN usage of a query is read from the Tez applications of
+# HiveServer2, which no other test must use at the same time
+pytestmark = pytest.mark.resources(vcores=4, memory=8192, services=["hiveserver2"])
+
+
+def tpcds_database_from_user(user: str) -> str:
+    return f"{user}_tpcds"
+
+
+@pytest.fixture(scope="module")
+def scale_factor(request: pytest.FixtureRequest) -> float:
+    scale_factor = request.config.getoption("hive_benchmark_scale")
+    if scale_factor is None:
+        pytest.skip("--hive-benchmark-scale is not set")
+    return scale_factor
+
+
+@pytest.fixture(scope="module")
+def tpcds_ranger_policy(
+    ranger_policies: Callable[[List[dict]], None],
+):
+    # Policies of every user are created at once
+    policies = [
+        {
+            "name": f"{user}_hive_benchmark",
+            "service": "hive-tdp",
+            "resources": {
+                "database": {
+                    "values": [tpcds_database_from_user(user)],
+                    "isExcludes": False,
+                },
+                "table": {"values": ["*"], "isExcludes": False},
+                "column": {"values": ["*"], "isExcludes": False},
+            },
+            "policyItems": [
+                {
+                    "users": [user],
+                    "accesses": [
+                        {"isAllowed": True, "type": "select"},
+                        {"isAllowed": True, "type": "create"},
+                        {"isAllowed": True, "type": "drop"},
+                        {"isAllowed": True, "type": "alter"},
+                        {"isAllowed": True, "type": "read"},
+                    ],
+                }
+            ],
+        }
+        for user in USERS
+    ]
+    ranger_policies(policies)
+
+
+@pytest.fixture(scope="module")
+def setup_tpcds(
+    user: str,
+    hive: HiveSessionPool,
+    hdfs_dataset: Callable[[Dataset, str], dict],
+    scale_factor: float,
+    tpcds_ranger_policy: None,
+) -> Generator[Dict[str, Dataset], None, None]:
+    database = tpcds_database_from_user(user)
+    tables = star_schema(scale_factor)
+    retry(
+        lambda: hive.execute(
+            user, f"CREATE DATABASE IF NOT EXISTS {database} LOCATION '{database}'"
+        )
+    )()
+    with hive.session(user) as session:
+        session.execute(f"USE {database}")
+        for table, dataset in tables.items():
+            # The ORC files are streamed to HDFS and read as external tables
+            hdfs_dir = hdfs_dataset(dataset, "orc")["hdfs_dir"]
+            session.execute(f"DROP TABLE IF EXISTS {table}")
+            session.execute(create_table_statement(table, dataset, hdfs_dir))
+            session.execute(f"ANALYZE TABLE {table} COMPUTE STATISTICS")
+            session.execute(f"ANALYZE TABLE {table} COMPUTE STATISTICS FOR COLUMNS")
+    yield tables
+    hive.execute(user, f"DROP DATABASE {database} CASCADE")
+
+
+@pytest.mark.parametrize("query_name", sorted(QUERIES))
+def test_tpcds_query(
+    user: str,
+    hive: HiveSessionPool,
+    setup_tpcds: Dict[str, Dataset],
+    scale_factor: float,
+    query_name: str,
+    resource_manager: ResourceManagerClient,
+    benchmark: Benchmark,
+):
+    query = QUERIES[query_name]
+    rows_scanned = sum(len(setup_tpcds[table]) for table in query.tables)
+    with hive.session(user) as session:
+        for setting in SESSION_SETTINGS:
+            session.execute(setting)
+        session.execute(f"USE {tpcds_database_from_user(user)}")
+        started = time.time()
+        before = tez_applications(resource_manager, started)
+        with benchmark.timer("query", nb_items=rows_scanned):
+            result = session.execute(query.sql)
+        usage = yarn_usage_since(resource_manager, before, started)
+
+    benchmark.parameters["scale_factor"] = scale_factor
+    benchmark.record("rows_scanned", rows_scanned, "rows")
+    benchmark.record("memory_seconds", usage.memory_seconds, "MB.s")
+    benchmark.record("vcore_seconds", usage.vcore_seconds, "vcore.s")
+    assert len(result.rows) == query.expected_rows(setup_tpcds), result
@@ -5,10 +5,18 @@ import pytest
 
 from testinfra import host
 
+from .benchmark import Benchmark
 from .conftest import USERS, retry
+from .webhdfs_load import WebHdfsEndpoint, WebHdfsLoadTester
 
 testinfra_hosts = ["edge"]
 
+WEBHDFS_LOAD_FILE_SIZES = (1024, 1024**2, 16 * 1024**2)
+# Cycles of each client of the load test
+WEBHDFS_LOAD_CYCLES = 10
+# Share of the operations of the load test allowed to fail
+WEBHDFS_LOAD_MAX_ERROR_RATE = 0.01
+
 
 @pytest.fixture(scope="module")
 def webhdfs_ranger_policy(
@@ -94,3 +102,71 @@ def test_create_webhdfs_temporary_file_in_user_directory(
         f"File /user/{user}/{distant_hdfs_path} does not exist."
         in liststatus["RemoteException"]["message"]
     ), curl_result
+
+
+@pytest.fixture(scope="module")
+def webhdfs_load_clients(request: pytest.FixtureRequest) -> int:
+    nb_clients = request.config.getoption("webhdfs_load_clients")
+    if nb_clients is None:
+        pytest.skip("--webhdfs-load-clients is not set")
+    return nb_clients
+
+
+@pytest.mark.parametrize("file_size", WEBHDFS_LOAD_FILE_SIZES)
+@pytest.mark.parametrize("endpoint", ["knox", "direct"])
+def test_webhdfs_load_through_knox_and_direct(
+    request: pytest.FixtureRequest,
+    host: host.Host,
+    user: str,
+    webhdfs_ranger_policy: None,
+    knox_gateway: Dict[str, str],
+    webhdfs_gateway: str,
+    hdfs_dir: Callable[[str], None],
+    webhdfs_load_clients: int,
+    benchmark: Benchmark,
+    worker_id: str,
+    endpoint: str,
+    file_size: int,
+):
+    endpoints = {
+        "knox": WebHdfsEndpoint(
+            "knox",
+            f"{knox_gateway['url']}/gateway/tdpldap/webhdfs/v1",
+            f"--user {user}:{knox_gateway['user_creds']}",
+        ),
+        "direct": WebHdfsEndpoint(
+            "direct", f"{webhdfs_gateway}/webhdfs/v1", "--negotiate --user :"
+        ),
+    }
+    local_file = f"/tmp/{user}_webhdfs_load_{file_size}"
+    with host.sudo(user):
+        # Another worker may write the same file at the same time
+        host.check_output(
+            f"test -s {local_file} || (head -c {file_size} /dev/urandom"
+            f" > {local_file}.$$ && mv {local_file}.$$ {local_file})"
+        )
+    load_dir = "webhdfs_load"
+    hdfs_dir(load_dir)
+
+    tester = WebHdfsLoadTester(
+        host,
+        user,
+        endpoints[endpoint],
+        local_file,
+        f"/user/{user}/{load_dir}",
+        nb_clients=webhdfs_load_clients,
+        nb_cycles=WEBHDFS_LOAD_CYCLES,
+        worker_id=worker_id,
+    )
+    report = tester.run(file_size)
+    request.node.user_properties.append(("webhdfs_load", report))
+    benchmark.parameters.update(
+        endpoint=endpoint, clients=webhdfs_load_clients, file_size=file_size
+    )
+    benchmark.record("cycles_per_second", report["cycles_per_second"], "cycles/s", True)
+    benchmark.record("bytes_per_second", report["bytes_per_second"], "B/s", True)
+    benchmark.record("error_rate", report["error_rate"])
+    for op, stats in report["operations"].items():
+        for quantile, latency in stats["latency"].items():
+            benchmark.record(f"{op.lower()}_latency_{quantile}", latency, "s")
+    assert report["error_rate"] <= WEBHDFS_LOAD_MAX_ERROR_RATE, report
@@ -1,43 +1,63 @@
 import textwrap
+import time
 from typing import Callable, Generator, List
 
 import pytest
 
 from testinfra import host
 
-from .conftest import retry
+from .conftest import USERS, logger, retry
+from .datasets import WEIGHT_CATEGORIES, Dataset
+from .phoenix import (
+    PHOENIX_BULK_LOAD_MIN_ROWS,
+    csv_bulk_load_command,
+    render_upsert_script,
+)
 
 testinfra_hosts = ["edge"]
 
 
+def phoenix_table_from_user(user: str) -> str:
+    return f"{user}_table_phoenix".upper()
+
+
 @pytest.fixture(scope="module")
 def phoenix_table(user: str) -> str:
-    return f"{user}_table_phoenix".upper()
+    return phoenix_table_from_user(user)
 
 
 @pytest.fixture(scope="module")
 def phoenix_ranger_policy(
-    user: str,
-    phoenix_table: str,
-    ranger_policy: Callable[[str, str, dict, List[dict]], dict],
+    ranger_policies: Callable[[List[dict]], None],
 ):
-    resources = {
-        "table": {"values": [phoenix_table], "isExcludes": False},
-        "column-family": {"values": ["*"], "isExcludes": False},
-        "column": {"values": ["*"], "isExcludes": False},
-    }
-    policyItems = [
+    # Policies of every user are created at once
+    policies = [
         {
-            "users": [user],
-            "accesses": [
-                {"isAllowed": True, "type": "read"},
-                {"isAllowed": True, "type": "write"},
-                {"isAllowed": True, "type": "create"},
-                {"isAllowed": True, "type": "admin"},
+            "name": f"{user}_phoenix_test",
+            "service": "hbase-tdp",
+            "resources": {
+                "table": {
+                    "values": [phoenix_table_from_user(user)],
+                    "isExcludes": False,
+                },
+                "column-family": {"values": ["*"], "isExcludes": False},
+                "column": {"values": ["*"], "isExcludes": False},
+            },
+            "policyItems": [
+                {
+                    "users": [user],
+                    "accesses": [
+                        {"isAllowed": True, "type": "read"},
+                        {"isAllowed": True, "type": "write"},
+                        {"isAllowed": True, "type": "create"},
+                        {"isAllowed": True, "type": "admin"},
+                    ],
+                }
             ],
         }
+        for user in USERS
     ]
-    ranger_policy(f"{user}_phoenix_test", "hbase-tdp", resources, policyItems)
+    ranger_policies(policies)
 
 
 @pytest.fixture(scope="module")
@@ -58,14 +78,22 @@ def setup_phoenix_table(
     """
     create_table_script = textwrap.dedent(create_table_script)
     script_path = f"/tmp/{user}_create_table.sql"
-    render_file(
-        script_path,
-        create_table_script,
-        {"table": phoenix_table},
-        owner=user,
-        group=user,
-        permissions=0o644,
-    )
+    drop_table_script = "DROP TABLE {table};"
+    drop_script_path = f"/tmp/{user}_drop_table.sql"
+    # Both scripts are sent together
+    with render_file.batch():
+        for path, script in (
+            (script_path, create_table_script),
+            (drop_script_path, drop_table_script),
+        ):
+            render_file(
+                path,
+                script,
+                {"table": phoenix_table},
+                owner=user,
+                group=user,
+                permissions=0o644,
+            )
     with host.sudo(user):
 
         def create_table():
@@ -73,18 +101,8 @@ def setup_phoenix_table(
 
         retry(create_table)()
     yield phoenix_table
-    drop_table_script = "DROP TABLE {table};"
-    script_path = f"/tmp/{user}_drop_table.sql"
-    render_file(
-        script_path,
-        drop_table_script,
-        {"table": phoenix_table},
-        owner=user,
-        group=user,
-        permissions=0o644,
-    )
     with host.sudo(user):
-        host.check_output(f"sqlline.py '{script_path}'")
+        host.check_output(f"sqlline.py '{drop_script_path}'")
 
 
 @pytest.fixture(scope="module")
@@ -93,35 +111,40 @@ def phoenix_dataset(
     user: str,
     setup_phoenix_table: str,
     render_file: Callable,
-    dataset_weight: List[dict],
+    dataset_weight: Dataset,
+    request: pytest.FixtureRequest,
 ) -> dict:
     phoenix_table = setup_phoenix_table
     nb_lines = len(dataset_weight)
-    upsert = "UPSERT INTO {table} VALUES ({id}, {weight}, '{category}');"
-    upsert_commands = [
-        upsert.format(
-            table=phoenix_table,
-            id=data["id"],
-            weight=data["weight"],
-            category=data["category"],
+    categories = list(WEIGHT_CATEGORIES)
+
+    start = time.perf_counter()
+    if nb_lines >= PHOENIX_BULK_LOAD_MIN_ROWS:
+        dataset_weight_csv = request.getfixturevalue("dataset_weight_csv")
+        with host.sudo(user):
+            host.check_output(
+                csv_bulk_load_command(phoenix_table, dataset_weight_csv["hdfs_path"])
+            )
+    else:
+        script_path = f"/tmp/{user}_dataset.sql"
+        render_file(
+            script_path,
+            render_upsert_script(phoenix_table, dataset_weight),
+            owner=user,
+            group=user,
+            permissions=0o644,
         )
-        for data in dataset_weight
-    ]
-    categories = list(set(data["category"] for data in dataset_weight))
-    script = "\n".join(upsert_commands)
-
-    script_path = f"/tmp/{user}_dataset.sql"
-    render_file(
-        script_path,
-        script,
-        owner=user,
-        group=user,
-        permissions=0o644,
+        with host.sudo(user):
+            host.check_output(f"sqlline.py '{script_path}'")
+    rows_per_second = nb_lines / (time.perf_counter() - start)
+    logger.info(
+        "%s rows loaded in %s at %.0f rows/s", nb_lines, phoenix_table, rows_per_second
     )
-
-    with host.sudo(user):
-        host.check_output(f"sqlline.py {script_path}")
-    return {"nb_lines": nb_lines, "categories": categories}
+    return {
+        "nb_lines": nb_lines,
+        "categories": categories,
+        "rows_per_second": rows_per_second,
+    }
 
 
 def test_phoenix_script_is_executed(
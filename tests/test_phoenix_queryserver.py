@@ -1,43 +1,68 @@
 import textwrap
+import time
 from typing import Callable, Generator, List
 
 import pytest
 
 from testinfra import host
 
-from .conftest import retry
+from .avatica import AvaticaConnectionPool, run_load
+from .benchmark import Benchmark
+from .conftest import USERS, logger, retry
+from .datasets import WEIGHT_CATEGORIES, Dataset
+from .phoenix import (
+    PHOENIX_BULK_LOAD_MIN_ROWS,
+    csv_bulk_load_command,
+    render_upsert_script,
+)
 
 testinfra_hosts = ["edge"]
 
+# Queries of each thread of the load test
+PHOENIX_LOAD_QUERIES_PER_THREAD = 50
+
+
+def phoenix_table_from_user(user: str) -> str:
+    return f"{user}_table_phoenix".upper()
+
 
 @pytest.fixture(scope="module")
 def phoenix_table(user: str) -> str:
-    return f"{user}_table_phoenix".upper()
+    return phoenix_table_from_user(user)
 
 
 @pytest.fixture(scope="module")
 def phoenix_ranger_policy(
-    user: str,
-    phoenix_table: str,
-    ranger_policy: Callable[[str, str, dict, List[dict]], dict],
+    ranger_policies: Callable[[List[dict]], None],
 ):
-    resources = {
-        "table": {"values": [phoenix_table], "isExcludes": False},
-        "column-family": {"values": ["*"], "isExcludes": False},
-        "column": {"values": ["*"], "isExcludes": False},
-    }
-    policyItems = [
+    # Policies of every user are created at once
+    policies = [
         {
-            "users": [user],
-            "accesses": [
-                {"isAllowed": True, "type": "read"},
-                {"isAllowed": True, "type": "write"},
-                {"isAllowed": True, "type": "create"},
-                {"isAllowed": True, "type": "admin"},
+            "name": f"{user}_phoenix_test",
+            "service": "hbase-tdp",
+            "resources": {
+                "table": {
+                    "values": [phoenix_table_from_user(user)],
+                    "isExcludes": False,
+                },
+                "column-family": {"values": ["*"], "isExcludes": False},
+                "column": {"values": ["*"], "isExcludes": False},
+            },
+            "policyItems": [
+                {
+                    "users": [user],
+                    "accesses": [
+                        {"isAllowed": True, "type": "read"},
+                        {"isAllowed": True, "type": "write"},
+                        {"isAllowed": True, "type": "create"},
+                        {"isAllowed": True, "type": "admin"},
+                    ],
+                }
             ],
         }
+        for user in USERS
     ]
-    ranger_policy(f"{user}_phoenix_test", "hbase-tdp", resources, policyItems)
+    ranger_policies(policies)
 
 
 @pytest.fixture(scope="module")
@@ -59,33 +84,36 @@ def setup_phoenix_table(
     """
     create_table_script = textwrap.dedent(create_table_script)
     script_path = f"/tmp/{user}_create_table.sql"
-    render_file(
-        script_path,
-        create_table_script,
-        {"table": phoenix_table},
-        owner=user,
-        group=user,
-        permissions=0o644,
-    )
+    drop_table_script = "DROP TABLE {table};"
+    drop_script_path = f"/tmp/{user}_drop_table.sql"
+    # Both scripts are sent together
+    with render_file.batch():
+        for path, script in (
+            (script_path, create_table_script),
+            (drop_script_path, drop_table_script),
+        ):
+            render_file(
+                path,
+                script,
+                {"table": phoenix_table},
+                owner=user,
+                group=user,
+                permissions=0o644,
+            )
     with host.sudo(user):
 
         def create_table():
             host.check_output(f"sqlline-thin.py '{phoenix_queryserver}' '{script_path}'")
 
-        retry(create_table)()
+        def query_server_listening() -> bool:
+            # Any HTTP response, even an authentication error, will do
+            curl_cmd = f"curl --silent --insecure --output /dev/null '{phoenix_queryserver}'"
+            return host.run(curl_cmd).rc == 0
+
+        retry(create_table, ready=query_server_listening)()
     yield phoenix_table
-    drop_table_script = "DROP TABLE {table};"
-    script_path = f"/tmp/{user}_drop_table.sql"
-    render_file(
-        script_path,
-        drop_table_script,
-        {"table": phoenix_table},
-        owner=user,
-        group=user,
-        permissions=0o644,
-    )
     with host.sudo(user):
-        host.check_output(f"sqlline-thin.py '{phoenix_queryserver}' '{script_path}'")
+        host.check_output(f"sqlline-thin.py '{phoenix_queryserver}' '{drop_script_path}'")
 
 
 @pytest.fixture(scope="module")
@@ -94,36 +122,43 @@ def phoenix_dataset(
     user: str,
     setup_phoenix_table: str,
     render_file: Callable,
-    dataset_weight: List[dict],
+    dataset_weight: Dataset,
     phoenix_queryserver: str,
+    request: pytest.FixtureRequest,
 ) -> dict:
     phoenix_table = setup_phoenix_table
     nb_lines = len(dataset_weight)
-    upsert = "UPSERT INTO {table} VALUES ({id}, {weight}, '{category}');"
-    upsert_commands = [
-        upsert.format(
-            table=phoenix_table,
-            id=data["id"],
-            weight=data["weight"],
-            category=data["category"],
-        )
-        for data in dataset_weight
-    ]
-    categories = list(set(data["category"] for data in dataset_weight))
-    script = "\n".join(upsert_commands)
+    categories = list(WEIGHT_CATEGORIES)
 
-    script_path = f"/tmp/{user}_dataset.sql"
-    render_file(
-        script_path,
-        script,
-        owner=user,
-        group=user,
-        permissions=0o644,
+    start = time.perf_counter()
+    if nb_lines >= PHOENIX_BULK_LOAD_MIN_ROWS:
+        dataset_weight_csv = request.getfixturevalue("dataset_weight_csv")
+        with host.sudo(user):
+            host.check_output(
+                csv_bulk_load_command(phoenix_table, dataset_weight_csv["hdfs_path"])
+            )
+    else:
+        script_path = f"/tmp/{user}_dataset.sql"
+        render_file(
+            script_path,
+            render_upsert_script(phoenix_table, dataset_weight),
+            owner=user,
+            group=user,
+            permissions=0o644,
+        )
+        with host.sudo(user):
+            host.check_output(
+                f"sqlline-thin.py '{phoenix_queryserver}' '{script_path}'"
+            )
+    rows_per_second = nb_lines / (time.perf_counter() - start)
+    logger.info(
+        "%s rows loaded in %s at %.0f rows/s", nb_lines, phoenix_table, rows_per_second
     )
-
-    with host.sudo(user):
-        host.check_output(f"sqlline-thin.py '{phoenix_queryserver}' '{script_path}'")
-    return {"nb_lines": nb_lines, "categories": categories}
+    return {
+        "nb_lines": nb_lines,
+        "categories": categories,
+        "rows_per_second": rows_per_second,
+    }
 
 
 def test_phoenix_script_is_executed(
@@ -158,3 +193,80 @@ def test_phoenix_script_is_executed(
         # can't assert because phoenix sqlline client doing tricks in terminal
         # can only rely on command return code
         # assert all(category in stdout for category in categories)
+
+
+def test_phoenix_queries_return_typed_rows(
+    user: str,
+    setup_phoenix_table: str,
+    phoenix_dataset: dict,
+    dataset_weight: Dataset,
+    phoenix_avatica: AvaticaConnectionPool,
+):
+    phoenix_table = setup_phoenix_table
+    nb_lines = phoenix_dataset["nb_lines"]
+    with phoenix_avatica.connection(user) as connection:
+        result = connection.execute(f"SELECT COUNT(*) FROM {phoenix_table}")
+        assert result.rows == [(nb_lines,)], result
+
+        result = connection.execute(
+            f"SELECT car.category, COUNT(*) FROM {phoenix_table} GROUP BY car.category"
+        )
+        categories = {dataset_weight.row(i)[2] for i in range(nb_lines)}
+        assert {row[0] for row in result.rows} == categories, result
+        assert sum(row[1] for row in result.rows) == nb_lines, result
+
+        statement = connection.prepare(
+            f"SELECT id, car.weight, car.category FROM {phoenix_table} WHERE id = ?"
+        )
+        row_id, weight, category = dataset_weight.row(nb_lines - 1)
+        result = statement.execute([row_id])
+        assert result.rows == [(row_id, pytest.approx(weight), category)], result
+
+        # The rows are fetched in about 4 requests, whatever the dataset size
+        frame_size = max(1, nb_lines // 4)
+        statement = connection.prepare(f"SELECT id FROM {phoenix_table}")
+        nb_rows = sum(1 for _ in statement.iter_rows(frame_max_size=frame_size))
+        assert nb_rows == nb_lines, f"{nb_rows} rows read by frames of {frame_size}"
+
+
+def test_phoenix_queryserver_load(
+    request: pytest.FixtureRequest,
+    user: str,
+    setup_phoenix_table: str,
+    phoenix_dataset: dict,
+    phoenix_avatica: AvaticaConnectionPool,
+    benchmark: Benchmark,
+):
+    concurrency = request.config.getoption("phoenix_load_concurrency")
+    if concurrency is None:
+        pytest.skip("--phoenix-load-concurrency is not set")
+    phoenix_table = setup_phoenix_table
+    nb_lines = phoenix_dataset["nb_lines"]
+    # Point lookups spread over the table and an aggregation
+    queries = [
+        (
+            f"SELECT car.weight FROM {phoenix_table} WHERE id = ?",
+            [i * 7919 % nb_lines],
+        )
+        for i in range(10)
+    ]
+    queries.append(
+        (
+            f"SELECT car.category, AVG(car.weight) FROM {phoenix_table}"
+            " GROUP BY car.category",
+            [],
+        )
+    )
+    report = run_load(
+        phoenix_avatica,
+        user,
+        queries,
+        nb_queries=PHOENIX_LOAD_QUERIES_PER_THREAD * concurrency,
+        concurrency=concurrency,
+    )
+    benchmark.parameters["concurrency"] = concurrency
+    benchmark.record(
+        "queries_per_second", report["queries_per_second"], "queries/s", True
+    )
+    for quantile, latency in report["latency"].items():
+        benchmark.record(f"latency_{quantile}", latency, "s")
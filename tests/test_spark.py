@@ -1,3 +1,4 @@
+import re
 import textwrap
 from typing import Any, Callable
 
@@ -5,60 +6,33 @@ import pytest
 
 from testinfra import host
 
+from .livy import LivySession
+from .spark_layout import JOB_RESOURCES, ExecutorLayout
+
 testinfra_hosts = ["edge"]
 
+# The executor layouts of the jobs are capped at JOB_RESOURCES
+pytestmark = pytest.mark.resources(
+    vcores=JOB_RESOURCES.vcores, memory=JOB_RESOURCES.memory
+)
+
 
 @pytest.fixture(scope="module", params=["spark3"])
 def spark_version(request: Any) -> str:
     return request.param
 
 
-def test_pyspark_csv_script_is_executed(
-    host: host.Host,
-    user: str,
-    spark_version: str,
-    dataset_weight_csv: dict,
-    render_file: Callable,
+def test_pyspark_csv_is_read(
+    livy: LivySession, dataset_weight_csv: dict, record_executor_layout: Callable
 ):
-    code = """
-    #!/bin/sh
-    export SPARK_CONF_DIR=/etc/{spark_version}/conf
-    expect -c "
-    set timeout 45
-    spawn /opt/tdp/{spark_version}/bin/pyspark --master yarn --deploy-mode client --executor-memory 5G --num-executors 3 --executor-cores 2
-    expect \\">>>\\"
-    send \\"data = spark.read.option(\\\\\\"header\\\\\\", True).csv(\\\\\\"{dataset_hdfs_path}\\\\\\")\\r\\"
-    expect \\">>>\\"
-    send \\"print(\\\\\\"data count is {{}}\\\\\\".format(data.count()))\\r\\"
-    expect \\">>>\\"
-    send \\"quit()\\r\\"
-    interact
-    exit 0
-    "
-    """
-    code = textwrap.dedent(code)
-    dataset_hdfs_path = dataset_weight_csv["hdfs_path"]
-    code_path = f"/tmp/{user}_pyspark_test.sh"
-    owner = user
-    group = user
-    permissions = 0o755
-
-    render_file(
-        code_path,
-        code,
-        {
-            "dataset_hdfs_path": dataset_hdfs_path,
-            "spark_version": spark_version,
-        },
-        owner=owner,
-        group=group,
-        permissions=permissions,
-    )
-
-    nb_lines = dataset_weight_csv["nb_lines"]
-    with host.sudo(user):
-        stdout = host.check_output(code_path)
-        assert f"data count is {nb_lines}" in stdout
+    code = f"""
+data = spark.read.option("header", True).csv("{dataset_weight_csv['hdfs_path']}")
+result = {{"count": data.count(), "parallelism": sc.defaultParallelism}}
+%json result
+"""
+    result = livy.run(code).json
+    record_executor_layout(livy.layout, result["parallelism"])
+    assert result["count"] == dataset_weight_csv["nb_lines"]
 
 
 def test_spark_submit_csv_script_is_executed(
@@ -67,6 +41,8 @@ def test_spark_submit_csv_script_is_executed(
     spark_version: str,
     dataset_weight_csv: dict,
     render_file: Callable,
+    executor_layout: Callable[[int], ExecutorLayout],
+    record_executor_layout: Callable,
 ):
     code = """
     from pyspark.sql import SparkSession
@@ -84,6 +60,11 @@ def test_spark_submit_csv_script_is_executed(
             data.count()
         )
     )
+    print(
+        "parallelism is {{}}".format(
+            spark.sparkContext.defaultParallelism
+        )
+    )
     """
     code = textwrap.dedent(code)
     dataset_hdfs_path = dataset_weight_csv["hdfs_path"]
@@ -104,30 +85,37 @@ def test_spark_submit_csv_script_is_executed(
     )
 
     nb_lines = dataset_weight_csv["nb_lines"]
+    layout = executor_layout(dataset_weight_csv["size"])
     with host.sudo(user):
         stdout = host.check_output(
             f"SPARK_CONF_DIR=/etc/{spark_version}/conf"
             f" /opt/tdp/{spark_version}/bin/spark-submit"
             " --master yarn"
             " --deploy-mode client"
-            " --executor-memory 5G"
-            " --num-executors 3"
-            " --executor-cores 2"
+            f" {layout.spark_submit_options()}"
             f" {code_path}"
         )
         assert f"data count is {nb_lines}" in stdout
+    parallelism = re.search(r"^parallelism is (\d+)$", stdout, re.MULTILINE)
+    record_executor_layout(layout, int(parallelism.group(1)) if parallelism else None)
 
 
-def test_spark_submit_jar_is_executed(host: host.Host, user: str, spark_version: str):
+def test_spark_submit_jar_is_executed(
+    host: host.Host,
+    user: str,
+    spark_version: str,
+    executor_layout: Callable[[], ExecutorLayout],
+    record_executor_layout: Callable,
+):
+    layout = executor_layout()
+    record_executor_layout(layout)
     with host.sudo(user):
         spark_stdout = host.check_output(
             f"SPARK_CONF_DIR=/etc/{spark_version}/conf"
             f" /opt/tdp/{spark_version}/bin/spark-submit"
             " --master yarn"
             " --deploy-mode client"
-            " --executor-memory 5G"
-            " --num-executors 3"
-            " --executor-cores 2"
+            f" {layout.spark_submit_options()}"
             " --class org.apache.spark.examples.JavaSparkPi"
             f" /opt/tdp/{spark_version}/examples/jars/spark-examples*.jar 50"
         )
@@ -1,8 +1,11 @@
+import pytest
 from testinfra import host
 
 testinfra_hosts = ["edge"]
 
 
+# Application master, 3 maps and the reduce of the MapReduce defaults
+@pytest.mark.resources(vcores=5, memory=6144)
 def test_yarn_works(host: host.Host, user: str):
     with host.sudo(user):
         yarn_stdout = host.check_output(
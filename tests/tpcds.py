@@ -0,0 +1,310 @@
+"""Star schema and queries modeled on TPC-DS for the Hive benchmark.
+
+The rows are computed from their number like every dataset of the tests, the
+fact table and the customer and item dimensions grow with the scale factor.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from .datasets import Column, Dataset
+from .spark_layout import ResourceManagerClient
+
+DAY_NAMES = (
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+)
+ITEM_CATEGORIES = (
+    "Books",
+    "Electronics",
+    "Home",
+    "Jewelry",
+    "Men",
+    "Music",
+    "Shoes",
+    "Sports",
+    "Toys",
+    "Women",
+)
+STORE_STATES = ("AL", "GA", "IL", "MI", "NY", "OH", "TN", "TX")
+FIRST_YEAR = 2018
+NB_DAYS = 5 * 365
+NB_STORES = 12
+NB_BRANDS = 50
+NB_MANUFACTS = 100
+# Rows at scale factor 1
+SCALED_TABLE_ROWS = {
+    "store_sales": 1_000_000,
+    "customer": 10_000,
+    "item": 2_000,
+}
+# Dimension tables by the column of store_sales referencing their surrogate
+# key, which is the row number + 1
+FOREIGN_KEYS = {
+    "date_dim": "ss_sold_date_sk",
+    "item": "ss_item_sk",
+    "customer": "ss_customer_sk",
+    "store": "ss_store_sk",
+}
+# Hive settings of the sessions running the queries
+SESSION_SETTINGS = (
+    "SET hive.execution.engine=tez",
+    # Each run executes the query instead of reading a previous result
+    "SET hive.query.results.cache.enabled=false",
+    "SET hive.compute.query.using.stats=false",
+)
+
+
+def spread(i: int, modulo: int, seed: int = 0) -> int:
+    """Number in [0, modulo) looking random but always the same for `i`."""
+    return ((i + seed) * 2654435761 % 2**32) % modulo
+
+
+def scaled_rows(table: str, scale_factor: float) -> int:
+    return max(1, int(SCALED_TABLE_ROWS[table] * scale_factor))
+
+
+def star_schema(scale_factor: float) -> Dict[str, Dataset]:
+    nb_items = scaled_rows("item", scale_factor)
+    nb_customers = scaled_rows("customer", scale_factor)
+    date_dim = (
+        Column("d_date_sk", "bigint", lambda i: i + 1),
+        Column("d_year", "int", lambda i: FIRST_YEAR + i // 365),
+        Column("d_moy", "int", lambda i: min(12, i % 365 // 30 + 1)),
+        Column("d_dom", "int", lambda i: i % 365 % 30 + 1),
+        Column("d_day_name", "varchar(9)", lambda i: DAY_NAMES[i % len(DAY_NAMES)]),
+    )
+    item = (
+        Column("i_item_sk", "bigint", lambda i: i + 1),
+        Column("i_brand_id", "int", lambda i: spread(i, NB_BRANDS) + 1),
+        Column("i_brand", "varchar(20)", lambda i: f"brand#{spread(i, NB_BRANDS)}"),
+        Column(
+            "i_category",
+            "varchar(20)",
+            lambda i: ITEM_CATEGORIES[spread(i, len(ITEM_CATEGORIES), 1)],
+        ),
+        Column("i_manufact_id", "int", lambda i: spread(i, NB_MANUFACTS, 2) + 1),
+        Column("i_current_price", "double", lambda i: spread(i, 10_000, 3) / 100),
+    )
+    store = (
+        Column("s_store_sk", "bigint", lambda i: i + 1),
+        Column("s_store_name", "varchar(20)", lambda i: f"store#{i + 1}"),
+        Column("s_state", "varchar(2)", lambda i: STORE_STATES[i % len(STORE_STATES)]),
+    )
+    customer = (
+        Column("c_customer_sk", "bigint", lambda i: i + 1),
+        Column("c_birth_year", "int", lambda i: 1940 + spread(i, 60)),
+        Column("c_preferred_cust_flag", "varchar(1)", lambda i: "YN"[spread(i, 2, 1)]),
+    )
+    store_sales = (
+        Column("ss_sold_date_sk", "bigint", lambda i: spread(i, NB_DAYS) + 1),
+        Column("ss_item_sk", "bigint", lambda i: spread(i, nb_items, 1) + 1),
+        Column("ss_customer_sk", "bigint", lambda i: spread(i, nb_customers, 2) + 1),
+        Column("ss_store_sk", "bigint", lambda i: spread(i, NB_STORES, 3) + 1),
+        Column("ss_quantity", "int", lambda i: spread(i, 100, 4) + 1),
+        Column("ss_sales_price", "double", lambda i: spread(i, 20_000, 5) / 100),
+        Column("ss_net_profit", "double", lambda i: spread(i, 10_000, 6) / 100 - 25),
+    )
+    return {
+        "date_dim": Dataset("tpcds_date_dim", date_dim, NB_DAYS),
+        "item": Dataset("tpcds_item", item, nb_items),
+        "store": Dataset("tpcds_store", store, NB_STORES),
+        "customer": Dataset("tpcds_customer", customer, nb_customers),
+        "store_sales": Dataset(
+            "tpcds_store_sales", store_sales, scaled_rows("store_sales", scale_factor)
+        ),
+    }
+
+
+def joined_column(tables: Dict[str, Dataset], name: str) -> Callable[[int], Any]:
+    """Value of the column `name` for a row number of store_sales joined
+    with its dimensions."""
+    for table, dataset in tables.items():
+        for column in dataset.schema:
+            if column.name != name:
+                continue
+            if table == "store_sales":
+                return column.value
+            foreign_key = joined_column(tables, FOREIGN_KEYS[table])
+            return lambda i, value=column.value: value(foreign_key(i) - 1)
+    raise KeyError(name)
+
+
+def joined_rows(tables: Dict[str, Dataset], columns: List[str]) -> Iterator[tuple]:
+    values = [joined_column(tables, name) for name in columns]
+    for i in range(len(tables["store_sales"])):
+        yield tuple(value(i) for value in values)
+
+
+def nb_groups(
+    tables: Dict[str, Dataset],
+    group_by: List[str],
+    filters: Dict[str, Callable[[Any], bool]],
+    limit: Optional[int] = None,
+) -> int:
+    """Rows returned by a query grouping the sales matching `filters`,
+    computed from the datasets loaded into Hive."""
+    columns = group_by + list(filters)
+    groups = {
+        row[: len(group_by)]
+        for row in joined_rows(tables, columns)
+        if all(
+            keep(value) for keep, value in zip(filters.values(), row[len(group_by) :])
+        )
+    }
+    return len(groups) if limit is None else min(len(groups), limit)
+
+
+class Query(NamedTuple):
+    # Tables read by the query, which are scanned entirely
+    tables: List[str]
+    sql: str
+    # Number of rows of the result for the tables of a scale factor
+    expected_rows: Callable[[Dict[str, Dataset]], int]
+
+
+QUERIES = {
+    # TPC-DS query 3
+    "brand_revenue_by_year": Query(
+        ["store_sales", "date_dim", "item"],
+        """
+        SELECT d_year, i_brand_id, i_brand, SUM(ss_sales_price) AS revenue
+        FROM store_sales
+        JOIN date_dim ON ss_sold_date_sk = d_date_sk
+        JOIN item ON ss_item_sk = i_item_sk
+        WHERE i_manufact_id = 28 AND d_moy = 11
+        GROUP BY d_year, i_brand_id, i_brand
+        ORDER BY d_year, revenue DESC, i_brand_id
+        LIMIT 100
+        """,
+        lambda tables: nb_groups(
+            tables,
+            ["d_year", "i_brand_id", "i_brand"],
+            {"i_manufact_id": lambda v: v == 28, "d_moy": lambda v: v == 11},
+            limit=100,
+        ),
+    ),
+    # TPC-DS query 42
+    "category_revenue_by_month": Query(
+        ["store_sales", "date_dim", "item"],
+        f"""
+        SELECT d_year, i_category, SUM(ss_sales_price) AS revenue
+        FROM store_sales
+        JOIN date_dim ON ss_sold_date_sk = d_date_sk
+        JOIN item ON ss_item_sk = i_item_sk
+        WHERE d_moy = 12 AND d_year = {FIRST_YEAR + 1}
+        GROUP BY d_year, i_category
+        ORDER BY revenue DESC, d_year, i_category
+        LIMIT 100
+        """,
+        lambda tables: nb_groups(
+            tables,
+            ["d_year", "i_category"],
+            {"d_moy": lambda v: v == 12, "d_year": lambda v: v == FIRST_YEAR + 1},
+            limit=100,
+        ),
+    ),
+    # TPC-DS query 19
+    "state_profit_of_preferred_customers": Query(
+        ["store_sales", "date_dim", "customer", "store"],
+        """
+        SELECT s_state, d_year, SUM(ss_net_profit) AS profit, COUNT(*) AS sales
+        FROM store_sales
+        JOIN date_dim ON ss_sold_date_sk = d_date_sk
+        JOIN customer ON ss_customer_sk = c_customer_sk
+        JOIN store ON ss_store_sk = s_store_sk
+        WHERE c_preferred_cust_flag = 'Y' AND c_birth_year BETWEEN 1960 AND 1980
+        GROUP BY s_state, d_year
+        ORDER BY s_state, d_year
+        """,
+        lambda tables: nb_groups(
+            tables,
+            ["s_state", "d_year"],
+            {
+                "c_preferred_cust_flag": lambda v: v == "Y",
+                "c_birth_year": lambda v: 1960 <= v <= 1980,
+            },
+        ),
+    ),
+    # TPC-DS query 96
+    "weekend_bulk_sales": Query(
+        ["store_sales", "date_dim", "store"],
+        """
+        SELECT COUNT(*) AS sales
+        FROM store_sales
+        JOIN date_dim ON ss_sold_date_sk = d_date_sk
+        JOIN store ON ss_store_sk = s_store_sk
+        WHERE d_day_name IN ('Saturday', 'Sunday') AND ss_quantity > 50
+            AND s_store_name = 'store#1'
+        """,
+        # COUNT(*) without GROUP BY
+        lambda tables: 1,
+    ),
+    "top_items_by_quantity": Query(
+        ["store_sales", "item"],
+        """
+        SELECT i_item_sk, i_category, SUM(ss_quantity) AS quantity
+        FROM store_sales
+        JOIN item ON ss_item_sk = i_item_sk
+        GROUP BY i_item_sk, i_category
+        ORDER BY quantity DESC, i_item_sk
+        LIMIT 100
+        """,
+        lambda tables: nb_groups(tables, ["i_item_sk", "i_category"], {}, limit=100),
+    ),
+}
+
+
+def create_table_statement(table: str, dataset: Dataset, location: str) -> str:
+    return f"""
+    CREATE EXTERNAL TABLE {table} ({dataset.hive_columns()})
+        STORED AS ORC
+        LOCATION '{location}'
+    """
+
+
+class YarnUsage(NamedTuple):
+    # MB.s and vcore.s allocated to the applications
+    memory_seconds: int
+    vcore_seconds: int
+
+
+def tez_applications(
+    resource_manager: ResourceManagerClient, finished_since: float
+) -> Dict[str, YarnUsage]:
+    """Resources allocated so far to the Tez applications running or
+    finished since `finished_since`."""
+    applications = resource_manager.applications(
+        applicationTypes="TEZ", states="RUNNING"
+    ) + resource_manager.applications(
+        applicationTypes="TEZ",
+        states="FINISHED,FAILED,KILLED",
+        finishedTimeBegin=int(finished_since * 1000),
+    )
+    return {
+        application["id"]: YarnUsage(
+            application["memorySeconds"], application["vcoreSeconds"]
+        )
+        for application in applications
+    }
+
+
+def yarn_usage_since(
+    resource_manager: ResourceManagerClient,
+    before: Dict[str, YarnUsage],
+    started: float,
+) -> YarnUsage:
+    """Resources allocated to the Tez applications since `before` was read
+    at `started`, the sessions of HiveServer2 are shared by the queries so
+    only the growth of their usage is counted."""
+    after = tez_applications(resource_manager, started)
+    memory_seconds = vcore_seconds = 0
+    for application_id, usage in after.items():
+        previous = before.get(application_id, YarnUsage(0, 0))
+        memory_seconds += usage.memory_seconds - previous.memory_seconds
+        vcore_seconds += usage.vcore_seconds - previous.vcore_seconds
+    return YarnUsage(memory_seconds, vcore_seconds)
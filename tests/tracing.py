@@ -0,0 +1,331 @@
+"""Spans of the test sessions exported as OTLP JSON.
+
+`python -m tests.tracing collector` receives the spans sent with
+`--trace-endpoint` and appends them to a file, `python -m tests.tracing
+summary <file>` prints the summary of a trace file.
+"""
+
+import argparse
+import contextlib
+import http.server
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from filelock import FileLock
+
+TRACE_SERVICE_NAME = "tdp-tests"
+# OTLP status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span(NamedTuple):
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: int
+    end: int
+    attributes: Dict[str, Any]
+    error: bool = False
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / 1e9
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+class Tracer:
+    """Records the spans of one pytest process (controller or xdist worker).
+
+    The current span is tracked per thread, spans opened by a thread
+    without a current span are children of the current span of the main
+    thread.
+    """
+
+    def __init__(self, trace_id: str, worker_id: str):
+        self.trace_id = trace_id
+        self.worker_id = worker_id
+        self.spans: List[Span] = []
+        self.local = threading.local()
+        self.main_stack: List[str] = []
+        self.local.stack = self.main_stack
+        # Set to the component of the current test
+        self.component: Optional[str] = None
+
+    def _stack(self) -> List[str]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = self.main_stack[-1:]
+        return self.local.stack
+
+    def start(self, name: str, **attributes: Any) -> dict:
+        stack = self._stack()
+        span = {
+            "name": name,
+            "span_id": secrets.token_hex(8),
+            "parent_id": stack[-1] if stack else None,
+            "start": time.time_ns(),
+            "attributes": {
+                "worker.id": self.worker_id,
+                "component": self.component,
+                **attributes,
+            },
+        }
+        stack.append(span["span_id"])
+        return span
+
+    def end(self, span: dict, error: bool = False, **attributes: Any):
+        stack = self._stack()
+        if span["span_id"] in stack:
+            stack.remove(span["span_id"])
+        span["attributes"].update(attributes)
+        self.spans.append(Span(end=time.time_ns(), error=error, **span))
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any):
+        span = self.start(name, **attributes)
+        try:
+            yield span["attributes"]
+        except BaseException:
+            self.end(span, error=True)
+            raise
+        self.end(span)
+
+    def to_otlp(self) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": otlp_attributes(
+                            {
+                                "service.name": TRACE_SERVICE_NAME,
+                                "worker.id": self.worker_id,
+                            }
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [
+                                {
+                                    "traceId": self.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent_id or "",
+                                    "name": span.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(span.start),
+                                    "endTimeUnixNano": str(span.end),
+                                    "attributes": otlp_attributes(span.attributes),
+                                    "status": {
+                                        "code": (
+                                            STATUS_ERROR if span.error else STATUS_OK
+                                        )
+                                    },
+                                }
+                                for span in self.spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export(self, output: Optional[str] = None, endpoint: Optional[str] = None):
+        payload = json.dumps(self.to_otlp())
+        if output is not None:
+            # One OTLP request per line like the file exporter of the collector
+            with FileLock(f"{output}.lock"):
+                with open(output, "a") as trace_file:
+                    trace_file.write(payload + "\n")
+        if endpoint is not None:
+            request = urllib.request.Request(
+                endpoint,
+                data=payload.encode(),
+                headers={"Content-Type": "application/json"},
+            )
+            urllib.request.urlopen(request, timeout=30).close()
+
+
+@contextlib.contextmanager
+def traced_acquisition(tracer: Tracer, name: str, context_manager, **attributes: Any):
+    # The span ends once the context is entered
+    with contextlib.ExitStack() as stack:
+        with tracer.span(name, **attributes):
+            value = stack.enter_context(context_manager)
+        yield value
+
+
+def trace_host(tracer: Tracer, host):
+    run = host.run
+
+    def traced_run(command: str, *args: str, **kwargs: Any):
+        user = getattr(host, "sudo_user", None) or host.backend.sudo_user
+        with tracer.span("host.run", user=user, command=command[:200]) as attributes:
+            result = run(command, *args, **kwargs)
+            attributes["rc"] = result.rc
+            return result
+
+    host.run = traced_run
+
+
+def otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    otlp = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        else:
+            otlp_value = {"stringValue": str(value)}
+        otlp.append({"key": key, "value": otlp_value})
+    return otlp
+
+
+def from_otlp(payload: dict) -> Iterable[Span]:
+    for resource_spans in payload["resourceSpans"]:
+        for scope_spans in resource_spans["scopeSpans"]:
+            for span in scope_spans["spans"]:
+                yield Span(
+                    name=span["name"],
+                    span_id=span["spanId"],
+                    parent_id=span.get("parentSpanId") or None,
+                    start=int(span["startTimeUnixNano"]),
+                    end=int(span["endTimeUnixNano"]),
+                    attributes={
+                        attribute["key"]: next(iter(attribute["value"].values()))
+                        for attribute in span.get("attributes", [])
+                    },
+                    error=span.get("status", {}).get("code") == STATUS_ERROR,
+                )
+
+
+def read_trace_file(path: str) -> List[Span]:
+    spans = []
+    with open(path) as trace_file:
+        for line in trace_file:
+            if line.strip():
+                spans.extend(from_otlp(json.loads(line)))
+    return spans
+
+
+def critical_path(span: Span, children: Dict[str, List[Span]]) -> List[Span]:
+    """Spans the end of `span` waited for, starting from its last child and
+    going back to the child which ended before each one started."""
+    path = [span]
+    end = span.end
+    for child in sorted(children[span.span_id], key=lambda s: s.end, reverse=True):
+        if child.end <= end:
+            path.extend(critical_path(child, children))
+            end = child.start
+    return path
+
+
+def summary(spans: List[Span], top: int = 10) -> List[str]:
+    lines = [f"{len(spans)} spans, top {top} by duration:"]
+    for span in sorted(spans, key=lambda s: s.duration, reverse=True)[:top]:
+        lines.append(f"{span.duration:9.2f}s {span.name} ({span_labels(span)})")
+
+    children: Dict[str, List[Span]] = defaultdict(list)
+    span_ids = {span.span_id for span in spans}
+    roots_by_worker: Dict[str, List[Span]] = defaultdict(list)
+    for span in spans:
+        if span.parent_id in span_ids:
+            children[span.parent_id].append(span)
+        else:
+            roots_by_worker[span.attributes.get("worker.id", "")].append(span)
+
+    for worker_id, roots in sorted(roots_by_worker.items()):
+        # The worker is the root of its spans
+        worker = Span(
+            worker_id,
+            worker_id,
+            None,
+            min(span.start for span in roots),
+            max(span.end for span in roots),
+            {},
+        )
+        children[worker.span_id] = roots
+        path = critical_path(worker, children)[1:]
+        # Time spent in each span of the path outside of its children on
+        # the path
+        path_ids = {span.span_id for span in path}
+        self_times: Dict[str, float] = defaultdict(float)
+        for span in path:
+            children_time = sum(
+                child.duration
+                for child in children[span.span_id]
+                if child.span_id in path_ids
+            )
+            self_times[span.name] += span.duration - children_time
+        idle_time = worker.duration - sum(root.duration for root in roots)
+        lines.append(
+            f"critical path of {worker_id}: {worker.duration:.2f}s,"
+            f" {max(idle_time, 0):.2f}s outside of the spans"
+        )
+        for name, self_time in sorted(
+            self_times.items(), key=lambda item: item[1], reverse=True
+        )[:top]:
+            lines.append(f"{self_time:9.2f}s {name}")
+    return lines
+
+
+def span_labels(span: Span) -> str:
+    return ", ".join(
+        f"{key}={value}"
+        for key, value in span.attributes.items()
+        if key in ("worker.id", "user", "component")
+    )
+
+
+class CollectorHandler(http.server.BaseHTTPRequestHandler):
+    output: str
+
+    def do_POST(self):
+        payload = self.rfile.read(int(self.headers["Content-Length"]))
+        # Validates the payload before writing it
+        json.loads(payload)
+        with FileLock(f"{self.output}.lock"):
+            with open(self.output, "ab") as trace_file:
+                trace_file.write(payload.rstrip(b"\n") + b"\n")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m tests.tracing")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    collector = subparsers.add_parser(
+        "collector", help="Receive OTLP JSON spans and append them to a file"
+    )
+    collector.add_argument("--port", type=int, default=4318)
+    collector.add_argument("--output", default="traces.jsonl")
+    summary_parser = subparsers.add_parser("summary", help="Summary of a trace file")
+    summary_parser.add_argument("trace_file")
+    summary_parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        print("\n".join(summary(read_trace_file(args.trace_file), args.top)))
+        return
+    CollectorHandler.output = os.path.abspath(args.output)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", args.port), CollectorHandler)
+    print(f"Collecting on http://127.0.0.1:{args.port}/v1/traces into {args.output}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# WebHDFS REST API documentation https://hadoop.apache.org/docs/stable/hadoop-project-dist/hadoop-hdfs/WebHDFS.html
+import json
+import posixpath
+import shlex
+from typing import List, Optional
+from urllib.parse import urlencode
+
+from .http_client import HttpClient
+
+
+class WebHdfsError(Exception):
+    pass
+
+
+class WebHdfsBatch:
+    """Operations sent to the NameNode by a single `curl` process.
+
+    Every operation is chained with `--next` so that curl keeps the
+    connection to the NameNode alive between requests. Operations are
+    executed in order and the first failure raises `WebHdfsError`.
+    """
+
+    def __init__(self, client: "WebHdfsClient"):
+        self.client = client
+        self.operations: List[dict] = []
+
+    def _add(
+        self,
+        method: str,
+        path: str,
+        op: str,
+        params: Optional[dict] = None,
+        upload_file: Optional[str] = None,
+        expected_status: int = 200,
+    ) -> "WebHdfsBatch":
+        self.operations.append(
+            {
+                "method": method,
+                "path": self.client.absolute_path(path),
+                "op": op,
+                "params": params or {},
+                "upload_file": upload_file,
+                "expected_status": expected_status,
+            }
+        )
+        return self
+
+    def mkdirs(self, path: str, permissions: Optional[int] = None) -> "WebHdfsBatch":
+        params = {}
+        if permissions:
+            params["permission"] = f"{permissions:o}"
+        return self._add("PUT", path, "MKDIRS", params)
+
+    def create(
+        self,
+        path: str,
+        local_file: str,
+        overwrite: bool = False,
+        permissions: Optional[int] = None,
+    ) -> "WebHdfsBatch":
+        params = {"overwrite": str(overwrite).lower()}
+        if permissions:
+            params["permission"] = f"{permissions:o}"
+        return self._add(
+            "PUT", path, "CREATE", params, upload_file=local_file, expected_status=201
+        )
+
+    def set_owner(
+        self, path: str, owner: Optional[str] = None, group: Optional[str] = None
+    ) -> "WebHdfsBatch":
+        params = {}
+        if owner:
+            params["owner"] = owner
+        if group:
+            params["group"] = group
+        if not params:
+            return self
+        return self._add("PUT", path, "SETOWNER", params)
+
+    def set_permission(self, path: str, permissions: int) -> "WebHdfsBatch":
+        return self._add(
+            "PUT", path, "SETPERMISSION", {"permission": f"{permissions:o}"}
+        )
+
+    def delete(self, path: str, recursive: bool = False) -> "WebHdfsBatch":
+        return self._add(
+            "DELETE", path, "DELETE", {"recursive": str(recursive).lower()}
+        )
+
+    def execute(self) -> List[dict]:
+        requests = []
+        for operation in self.operations:
+            query = urlencode({"op": operation["op"], **operation["params"]})
+            url = f"{self.client.url}/webhdfs/v1{operation['path']}?{query}"
+            request = [
+                self.client.curl_opts,
+                "--location",
+                f"--request {operation['method']}",
+            ]
+            if operation["upload_file"]:
+                request.append(f"--upload-file {shlex.quote(operation['upload_file'])}")
+            request.append(shlex.quote(url))
+            requests.append(" ".join(request))
+
+        with self.client.http_client.host.sudo(self.client.user):
+            responses = self.client.http_client.batch(requests)
+
+        for operation, response in zip(self.operations, responses):
+            response.update(op=operation["op"], path=operation["path"])
+            if response["http_status"] != operation["expected_status"]:
+                raise WebHdfsError(
+                    f"{operation['op']} {operation['path']} failed with http status"
+                    f" {response['http_status']}: {response['body']}"
+                )
+        self.operations = []
+        return responses
+
+
+class WebHdfsClient:
+    """WebHDFS client acting as `user` through `curl` on the edge host."""
+
+    def __init__(
+        self,
+        http_client: HttpClient,
+        user: str,
+        url: str,
+        curl_opts: str = "--negotiate --user :",
+    ):
+        self.http_client = http_client
+        self.user = user
+        self.url = url
+        self.curl_opts = curl_opts
+        self.home = f"/user/{user}"
+
+    def absolute_path(self, path: str) -> str:
+        return posixpath.normpath(posixpath.join(self.home, path))
+
+    def batch(self) -> WebHdfsBatch:
+        return WebHdfsBatch(self)
+
+    def get_file_status(self, path: str) -> Optional[dict]:
+        batch = self.batch()._add("GET", path, "GETFILESTATUS")
+        try:
+            response = batch.execute()[0]
+        except WebHdfsError as error:
+            if "FileNotFoundException" in str(error):
+                return None
+            raise
+        return json.loads(response["body"])["FileStatus"]
@@ -0,0 +1,171 @@
+# WebHDFS REST API documentation https://hadoop.apache.org/docs/stable/hadoop-project-dist/hadoop-hdfs/WebHDFS.html
+import concurrent.futures
+import functools
+import logging
+import re
+import shlex
+import subprocess
+import time
+from typing import Dict, List, NamedTuple
+
+from testinfra.host import Host
+
+from .remote_agent import spawn_command
+from .stats import histogram, percentiles
+
+logger = logging.getLogger("testinfra")
+
+LOAD_RESPONSE_MARKER = "__WEBHDFS_LOAD__"
+RE_LOAD_RESPONSE = re.compile(f"{LOAD_RESPONSE_MARKER} ([0-9]{{3}}) ([0-9.]+)\n")
+# Operations of a cycle with their method and expected status
+WEBHDFS_CYCLE = (
+    ("CREATE", "PUT", 201),
+    ("OPEN", "GET", 200),
+    ("LISTSTATUS", "GET", 200),
+    ("DELETE", "DELETE", 200),
+)
+# Upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class WebHdfsEndpoint(NamedTuple):
+    name: str
+    # Up to /webhdfs/v1
+    url: str
+    # Authentication
+    curl_opts: str
+
+
+class WebHdfsLoadTester:
+    """Run the create/open/list/delete cycle of WebHDFS from `nb_clients`
+    concurrent clients acting as `user`.
+
+    Each cycle is sent by a curl process on the edge host, chained with
+    `--next` so that the client keeps its connection between the operations
+    like an application would. The bodies are discarded, only the status and
+    response time of every operation are kept.
+    """
+
+    def __init__(
+        self,
+        host: Host,
+        user: str,
+        endpoint: WebHdfsEndpoint,
+        local_file: str,
+        hdfs_dir: str,
+        nb_clients: int = 4,
+        nb_cycles: int = 10,
+        worker_id: str = "master",
+    ):
+        self.host = host
+        self.user = user
+        self.endpoint = endpoint
+        self.local_file = local_file
+        self.hdfs_dir = hdfs_dir
+        self.nb_clients = nb_clients
+        self.nb_cycles = nb_cycles
+        self.worker_id = worker_id
+
+    def _cycle(self, path: str) -> List[dict]:
+        write_out = (
+            f"--write-out '{LOAD_RESPONSE_MARKER} %{{http_code}} %{{time_total}}\\n'"
+        )
+        requests = []
+        for op, method, _ in WEBHDFS_CYCLE:
+            request = [
+                self.endpoint.curl_opts,
+                "--insecure --location --output /dev/null",
+                write_out,
+                f"--request {method}",
+            ]
+            query = f"op={op}"
+            if op == "CREATE":
+                # Files left by an interrupted run are replaced
+                query += "&overwrite=true"
+                request.append(f"--upload-file {shlex.quote(self.local_file)}")
+            request.append(shlex.quote(f"{self.endpoint.url}{path}?{query}"))
+            requests.append(" ".join(request))
+        curl_cmd = "curl --silent --show-error " + " --next ".join(requests)
+        process = subprocess.run(
+            spawn_command(self.host, curl_cmd, self.user),
+            shell=True,
+            capture_output=True,
+        )
+        responses = RE_LOAD_RESPONSE.findall(process.stdout.decode())
+        results = []
+        for i, (op, _, expected_status) in enumerate(WEBHDFS_CYCLE):
+            if i >= len(responses):
+                # curl stopped before this operation
+                results.append({"op": op, "ok": False, "latency": None})
+                continue
+            http_status, latency = responses[i]
+            results.append(
+                {
+                    "op": op,
+                    "ok": int(http_status) == expected_status,
+                    "latency": float(latency),
+                }
+            )
+        if not all(result["ok"] for result in results):
+            logger.debug(
+                "WebHDFS cycle %s through %s failed: %s %s",
+                path,
+                self.endpoint.name,
+                responses,
+                process.stderr.decode(),
+            )
+        return results
+
+    def _client(self, prefix: str, client: int) -> List[dict]:
+        results = []
+        for cycle in range(self.nb_cycles):
+            results.extend(self._cycle(f"{prefix}_{client}_{cycle}"))
+        return results
+
+    def run(self, file_size: int) -> dict:
+        # Runs with other endpoints, sizes or workers use the same directory
+        prefix = f"{self.hdfs_dir}/{self.endpoint.name}_{file_size}_{self.worker_id}"
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(self.nb_clients) as executor:
+            results = [
+                result
+                for client_results in executor.map(
+                    functools.partial(self._client, prefix), range(self.nb_clients)
+                )
+                for result in client_results
+            ]
+        duration = time.perf_counter() - start
+
+        operations: Dict[str, dict] = {}
+        for op, _, _ in WEBHDFS_CYCLE:
+            op_results = [result for result in results if result["op"] == op]
+            latencies = [result["latency"] for result in op_results if result["ok"]]
+            errors = sum(not result["ok"] for result in op_results)
+            operations[op] = {
+                "count": len(op_results),
+                "errors": errors,
+                "error_rate": errors / len(op_results) if op_results else 0,
+                "latency": percentiles(latencies),
+                "histogram": histogram(latencies, LATENCY_BUCKETS),
+            }
+        nb_cycles = self.nb_clients * self.nb_cycles
+        # Each file is written then read once
+        transferred = sum(
+            file_size
+            for result in results
+            if result["op"] in ("CREATE", "OPEN") and result["ok"]
+        )
+        nb_errors = sum(op["errors"] for op in operations.values())
+        report = {
+            "endpoint": self.endpoint.name,
+            "clients": self.nb_clients,
+            "file_size": file_size,
+            "cycles": nb_cycles,
+            "seconds": duration,
+            "cycles_per_second": nb_cycles / duration if duration else 0,
+            "bytes_per_second": transferred / duration if duration else 0,
+            "error_rate": nb_errors / len(results) if results else 0,
+            "operations": operations,
+        }
+        logger.info("WebHDFS load through %s: %s", self.endpoint.name, report)
+        return report